@@ -1,5 +1,7 @@
 import os
 
+from sqlalchemy.engine import make_url
+
 def load_config(app, overrides):
     if os.path.exists(os.path.join('./App', 'custom_config.py')):
         app.config.from_object('App.custom_config')
@@ -15,5 +17,96 @@ def load_config(app, overrides):
     app.config["JWT_COOKIE_SECURE"] = True
     app.config["JWT_COOKIE_CSRF_PROTECT"] = False
     app.config['FLASK_ADMIN_SWATCH'] = 'darkly'
+    app.config.setdefault('LOCATION_FLUSH_INTERVAL_MS', 500)
+    app.config.setdefault('LOCATION_FLUSH_MAX_PINGS', 200)
+    app.config.setdefault('LOCATION_MAX_AHEAD_SECONDS', 60)
+    app.config.setdefault('LOCATION_MAX_AGE_SECONDS', 86400)
+    app.config.setdefault('LOCATION_SEGMENT_POINTS', 512)
+    app.config.setdefault('LOCATION_HISTORY_FLUSH_SECONDS', 5)
+    app.config.setdefault('LOCATION_HISTORY_MAX_PENDING', 2000)
+    app.config.setdefault('LOCATION_HISTORY_MAX_RETRIES', 3)
+    app.config.setdefault('SPATIAL_INDEX_CELL_DEGREES', 0.01)
+    app.config.setdefault('SPATIAL_INDEX_REFRESH_SECONDS', 30)
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+    app.config.setdefault('IDENTITY_CACHE_SIZE', 1024)
+    app.config.setdefault('IDENTITY_CACHE_TTL', 60)
+    app.config.setdefault('RESPONSE_CACHE_SIZE', 256)
+    app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+    app.config.setdefault('RESPONSE_CACHE_VERSION_TTL', 1.0)
+    app.config.setdefault('JOB_BATCH_SIZE', 10)
+    app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+    app.config.setdefault('JOB_MAX_ATTEMPTS', 5)
+    app.config.setdefault('JOB_RETRY_BASE_SECONDS', 5)
+    app.config.setdefault('JOB_RETRY_MAX_SECONDS', 600)
+    app.config.setdefault('JOB_LEASE_SECONDS', 300)
+    app.config.setdefault('NOTIFICATION_SINK', 'log')
+    app.config.setdefault('NOTIFICATION_BATCH_SIZE', 1000)
+    app.config.setdefault('ARCHIVE_OLDER_THAN_DAYS', 30)
+    app.config.setdefault('ARCHIVE_BATCH_SIZE', 200)
+    app.config.setdefault('ARCHIVE_PAUSE_SECONDS', 0.05)
+    app.config.setdefault('ARCHIVE_JOB_MAX_BATCHES', 50)
+    app.config.setdefault('TRACKING_QUEUE_SIZE', 32)
+    app.config.setdefault('TRACKING_KEEPALIVE_SECONDS', 15)
+    app.config.setdefault('ETA_CACHE_TTL', 30)
+    app.config.setdefault('ETA_AVERAGE_SPEED_KMH', 25.0)
+    app.config.setdefault('ETA_STOP_DWELL_SECONDS', 60)
+    app.config.setdefault('QUERY_STATS_ENABLED', True)
+    app.config.setdefault('QUERY_BUDGET_STATEMENTS', 20)
+    app.config.setdefault('QUERY_BUDGET_MS', 250)
+    app.config.setdefault('SERVER_WORKERS', 4)
+    app.config.setdefault('SERVER_WORKER_CLASS', 'gevent')
+    app.config.setdefault('SERVER_THREADS', 1)
+    app.config.setdefault('DB_MAX_CONNECTIONS', 100)
+    app.config.setdefault('DB_RESERVED_CONNECTIONS', 10)
+    app.config.setdefault('DB_POOL_SIZE', None)
+    app.config.setdefault('DB_MAX_OVERFLOW', None)
+    app.config.setdefault('DB_POOL_TIMEOUT', 10)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('SQLALCHEMY_REPLICA_URI', None)
+    app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
     for key in overrides:
-        app.config[key] = overrides[key]
\ No newline at end of file
+        app.config[key] = overrides[key]
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    replica = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if replica:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault('replica', dict(engine_options(app.config, replica), url=replica))
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def engine_options(config, url=None):
+    """
+    Connection pool settings sized for the server's worker model. Each
+    worker process gets an equal share of the database's connection limit.
+    Gevent and eventlet workers run many requests at once, so half the share
+    is kept open and bursts may overflow into the rest; thread and sync
+    workers never need more connections than they have threads.
+    SQLite keeps SQLAlchemy's defaults and is tuned with pragmas instead.
+    """
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    workers = max(int(config['SERVER_WORKERS']), 1)
+    share = max((config['DB_MAX_CONNECTIONS'] - config['DB_RESERVED_CONNECTIONS']) // workers, 2)
+    if config['SERVER_WORKER_CLASS'] in ('gevent', 'eventlet'):
+        pool_size = max(share // 2, 1)
+    else:
+        pool_size = min(max(int(config['SERVER_THREADS']), 1), share)
+    if config['DB_POOL_SIZE'] is not None:
+        pool_size = config['DB_POOL_SIZE']
+    max_overflow = config['DB_MAX_OVERFLOW']
+    if max_overflow is None:
+        max_overflow = max(share - pool_size, 0)
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE']
+    }
\ No newline at end of file
@@ -1,4 +1,15 @@
 from .user import *
 from .auth import *
 from .initialize import *
+from .location import *
+from .spatial import *
+from .tracking import *
+from .notifications import *
 from .controllers import *
+from .summary import *
+from .schedule import *
+from .optimizer import *
+from .eta import *
+from .history import *
+from .archive import *
+from .importer import *
@@ -0,0 +1,183 @@
+import logging
+from datetime import date, datetime, timedelta
+from time import perf_counter, sleep
+
+from sqlalchemy import delete, insert
+
+from App.models import (
+    Route, Street, Stop, LocationSegment,
+    ArchivedRoute, ArchivedStreet, ArchivedStop, ArchivedLocationSegment
+)
+from App.database import db, read_only
+from App.jobs import job, enqueue
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROUTE_STATUSES = ('completed', 'cancelled')
+
+_routes = Route.__table__
+_streets = Street.__table__
+_stops = Stop.__table__
+_segments = LocationSegment.__table__
+
+
+class RouteArchiver:
+    """
+    Moves completed and cancelled routes driven more than older_than_days ago,
+    with their streets, stops and location history, into the *_archive
+    tables. Work is done batch_size routes per transaction: each batch
+    deletes its rows with RETURNING and inserts exactly those rows into the
+    archive, so nothing written concurrently is lost or copied twice, and
+    locks are held only for one short batch. pause_seconds between batches
+    lets other writers in. Route summaries of archived routes are kept, so
+    get_daily_summary still covers archived days.
+    """
+
+    def __init__(self, older_than_days=30, batch_size=200, pause_seconds=0.05, job_max_batches=50):
+        self.older_than_days = older_than_days
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.job_max_batches = job_max_batches
+
+    def init_app(self, app):
+        self.older_than_days = app.config['ARCHIVE_OLDER_THAN_DAYS']
+        self.batch_size = app.config['ARCHIVE_BATCH_SIZE']
+        self.pause_seconds = app.config['ARCHIVE_PAUSE_SECONDS']
+        self.job_max_batches = app.config['ARCHIVE_JOB_MAX_BATCHES']
+
+    def archive(self, older_than_days=None, batch_size=None, max_batches=None):
+        """
+        Archive batches until no old routes are left or max_batches have run.
+        Returns counts of the rows moved; remaining is True when it stopped
+        at max_batches with more routes to go.
+        """
+        older_than_days = self.older_than_days if older_than_days is None else older_than_days
+        batch_size = batch_size or self.batch_size
+        cutoff = date.today() - timedelta(days=older_than_days)
+        started = perf_counter()
+        totals = {'routes': 0, 'streets': 0, 'stops': 0, 'segments': 0, 'batches': 0, 'remaining': False}
+        while True:
+            if max_batches is not None and totals['batches'] >= max_batches:
+                totals['remaining'] = True
+                break
+            counts = self.archive_batch(cutoff, batch_size)
+            if not counts['routes']:
+                break
+            totals['batches'] += 1
+            for name, count in counts.items():
+                totals[name] += count
+            if counts['routes'] < batch_size:
+                break
+            if self.pause_seconds:
+                sleep(self.pause_seconds)
+        totals['cutoff'] = cutoff.isoformat()
+        totals['ms'] = round((perf_counter() - started) * 1000, 3)
+        return totals
+
+    def archive_batch(self, cutoff, batch_size):
+        """Move up to batch_size routes driven before cutoff in one transaction"""
+        try:
+            candidates = (
+                db.select(_routes.c.routeID)
+                .where(_routes.c.status.in_(ARCHIVE_ROUTE_STATUSES), _routes.c.driveDate < cutoff)
+                .order_by(_routes.c.driveDate, _routes.c.routeID).limit(batch_size)
+            )
+            if db.engine.dialect.name == 'postgresql':
+                # Routes someone is writing to right now wait for the next run
+                candidates = candidates.with_for_update(skip_locked=True)
+            route_ids = db.session.scalars(candidates).all()
+            if not route_ids:
+                db.session.rollback()
+                return {'routes': 0, 'streets': 0, 'stops': 0, 'segments': 0}
+            now = datetime.now()
+            street_ids = db.select(_streets.c.streetID).where(_streets.c.routeID.in_(route_ids))
+            # Children first, so foreign keys to routes and streets hold throughout
+            counts = {
+                'stops': _move(_stops, ArchivedStop, _stops.c.streetID.in_(street_ids), now),
+                'segments': _move(_segments, ArchivedLocationSegment, _segments.c.routeID.in_(route_ids), now),
+            }
+            counts['streets'] = _move(_streets, ArchivedStreet, _streets.c.routeID.in_(route_ids), now)
+            counts['routes'] = _move(_routes, ArchivedRoute, _routes.c.routeID.in_(route_ids), now)
+            db.session.commit()
+            return counts
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def _move(table, archive, condition, archived_at):
+    rows = db.session.execute(delete(table).where(condition).returning(*table.c)).mappings().all()
+    if rows:
+        db.session.execute(insert(archive.__table__), [dict(row, archivedAt=archived_at) for row in rows])
+    return len(rows)
+
+
+archiver = RouteArchiver()
+
+
+def setup_archive(app):
+    archiver.init_app(app)
+    return archiver
+
+
+def archive_routes(older_than_days=None, batch_size=None, max_batches=None):
+    """
+    Move old completed and cancelled routes into the archive tables.
+    Returns the counts moved, or None when a batch failed; batches committed
+    before the failure stay archived.
+    """
+    try:
+        return archiver.archive(older_than_days, batch_size, max_batches)
+    except Exception as e:
+        logger.warning('Route archiving failed: %s', e)
+        return None
+
+
+@job('routes.archive')
+def archive_routes_job(older_than_days=None, batch_size=None):
+    """Background form of archive_routes; queues a follow-up job while old routes remain"""
+    result = archiver.archive(older_than_days, batch_size, max_batches=archiver.job_max_batches)
+    if result['remaining']:
+        enqueue('routes.archive', {'older_than_days': older_than_days, 'batch_size': batch_size})
+    return result
+
+
+def _drive_dates(query, column, start_date, end_date):
+    if start_date is not None:
+        query = query.filter(column >= start_date)
+    if end_date is not None:
+        query = query.filter(column <= end_date)
+    return query
+
+
+@read_only
+def get_routes_in_range(driver_userID, start_date=None, end_date=None):
+    """
+    A driver's routes driven between start_date and end_date: Route and
+    ArchivedRoute rows, which share columns and relationships.
+    """
+    routes = []
+    for model in (Route, ArchivedRoute):
+        query = db.select(model).filter(model.driverID == driver_userID)
+        routes.extend(db.session.scalars(_drive_dates(query, model.driveDate, start_date, end_date)).all())
+    return sorted(routes, key=lambda route: (route.driveDate, route.driveTime, route.routeID))
+
+
+@read_only
+def get_stops_in_range(resident_userID, start_date=None, end_date=None):
+    """
+    A resident's stops on routes driven between start_date and end_date:
+    Stop and ArchivedStop rows, which share columns and relationships.
+    """
+    rows = []
+    for stop, street, route in ((Stop, Street, Route), (ArchivedStop, ArchivedStreet, ArchivedRoute)):
+        query = (
+            db.select(stop, route.driveDate)
+            .join(street, street.streetID == stop.streetID)
+            .join(route, route.routeID == street.routeID)
+            .filter(stop.residentID == resident_userID)
+        )
+        rows.extend(db.session.execute(_drive_dates(query, route.driveDate, start_date, end_date)).all())
+    rows.sort(key=lambda row: (row[1], row[0].stopTime, row[0].stopID))
+    return [row[0] for row in rows]
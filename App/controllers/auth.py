@@ -2,11 +2,17 @@ from flask_jwt_extended import create_access_token, jwt_required, JWTManager, ge
 
 from App.models import User
 from App.database import db
+from .user import get_user_identity, invalidate_user_identity
 
 def login(username, password):
-  result = db.session.execute(db.select(User).filter_by(username=username))
+  result = db.session.execute(db.select(User).filter_by(userName=username))
   user = result.scalar_one_or_none()
   if user and user.check_password(password):
+    # Upgrade hashes made with an older method or cost while we have the password
+    if user.password_needs_rehash():
+      user.set_password(password)
+      db.session.commit()
+      invalidate_user_identity(user.id)
     # Store ONLY the user id as a string in JWT 'sub'
     return create_access_token(identity=str(user.id))
   return None
@@ -30,7 +36,7 @@ def setup_jwt(app):
       user_id = int(identity)
     except (TypeError, ValueError):
       return None
-    return db.session.get(User, user_id)
+    return get_user_identity(user_id)
 
   return jwt
 
@@ -43,7 +49,7 @@ def add_auth_context(app):
           verify_jwt_in_request()
           identity = get_jwt_identity()
           user_id = int(identity) if identity is not None else None
-          current_user = db.session.get(User, user_id) if user_id is not None else None
+          current_user = get_user_identity(user_id) if user_id is not None else None
           is_authenticated = current_user is not None
       except Exception as e:
           print(e)
@@ -1,7 +1,17 @@
-from App.models import Driver, Resident, Route, Street, Stop
-from App.database import db
+from App.models import Driver, Resident, Route, Street, Stop, ArchivedRoute, ArchivedStreet, ArchivedStop
+from App.database import db, read_only, upsert
+from App.response_cache import bump_versions
 from datetime import datetime, date, time
-from sqlalchemy import and_
+from sqlalchemy import update
+from sqlalchemy.orm import contains_eager
+
+from .location import location_buffer, location_changed
+from .tracking import publish_route_update
+from .eta import invalidate_route_etas
+from .summary import record_new_route, adjust_route_summary, sync_route_summary
+from .notifications import queue_route_notifications
+from .history import flush_location_history
+from .archive import get_routes_in_range, get_stops_in_range
 
 # Driver operations from UML diagram
 def schedule_route(driver_userID, route_date, route_time, street_list=None):
@@ -16,6 +26,7 @@ def schedule_route(driver_userID, route_date, route_time, street_list=None):
         db.session.flush()  # Get the route ID
         
         # Add streets to the route if provided
+        street_count = 0
         if street_list:
             for street_info in street_list:
                 if isinstance(street_info, dict):
@@ -28,48 +39,72 @@ def schedule_route(driver_userID, route_date, route_time, street_list=None):
                                   streetName=street_info[0], 
                                   streetLocation=street_info[1])
                 db.session.add(street)
+                street_count += 1
         
+        record_new_route(new_route, street_count)
         db.session.commit()
         return new_route
     except Exception as e:
         db.session.rollback()
         return None
 
-def view_stops(driver_userID, route_id=None):
+def view_stops(driver_userID, route_id=None, start_date=None, end_date=None,
+               status=None, after_stop_id=None, limit=None):
     """
     Driver operation: view_stops(route: Route, routeStops: Stop[])
-    Returns all stops for a driver's routes or specific route
+    Returns stops for a driver's routes or specific route in a single joined
+    query. Results can be narrowed by route date range and stop status, and
+    paged by passing the last seen stopID as after_stop_id. A date range also
+    reads archived stops; stop IDs are never reused, so both sources page
+    together by stopID.
     """
     try:
-        if route_id:
-            # Get stops for specific route
-            route = db.session.get(Route, route_id)
-            if route and route.driverID == driver_userID:
-                stops = []
-                for street in route.streets:
-                    stops.extend(street.stops)
-                return stops
-        else:
-            # Get all stops for all driver's routes
-            driver = db.session.get(Driver, driver_userID)
-            if driver:
-                all_stops = []
-                for route in driver.routes:
-                    for street in route.streets:
-                        all_stops.extend(street.stops)
-                return all_stops
-        return []
+        sources = [(Stop, Street, Route)]
+        if start_date or end_date:
+            sources.append((ArchivedStop, ArchivedStreet, ArchivedRoute))
+        stops = []
+        for stop, street, route in sources:
+            query = (
+                db.select(stop)
+                .join(stop.street)
+                .join(street.route)
+                .filter(route.driverID == driver_userID)
+                .options(contains_eager(stop.street).contains_eager(street.route))
+            )
+            if route_id:
+                query = query.filter(route.routeID == route_id)
+            if start_date:
+                query = query.filter(route.driveDate >= start_date)
+            if end_date:
+                query = query.filter(route.driveDate <= end_date)
+            if status:
+                statuses = [status] if isinstance(status, str) else list(status)
+                query = query.filter(stop.stopStatus.in_(statuses))
+            if after_stop_id:
+                query = query.filter(stop.stopID > after_stop_id)
+            query = query.order_by(stop.stopID)
+            if limit:
+                query = query.limit(limit)
+            stops.extend(db.session.scalars(query).all())
+        stops.sort(key=lambda stop: stop.stopID)
+        return stops[:limit] if limit else stops
     except Exception as e:
         return []
 
 def update_route(driver_userID, route_id, new_date=None, new_time=None, new_status=None):
     """
     Driver operation: update_route(route: Route, routeStops: Stop[])
-    Updates route information and coordinates driver location
+    Updates route information and coordinates driver location.
+    Residents on the route are notified in the background when it goes active.
     """
     try:
         route = db.session.get(Route, route_id)
         if route and route.driverID == driver_userID:
+            if route.status == 'active' and new_status and new_status != 'active':
+                # History is matched to active routes, so store the pings buffered so far first
+                flush_location_history(quiet=True)
+            if new_status == 'active' and route.status != 'active':
+                queue_route_notifications(route_id)
             if new_date:
                 route.driveDate = new_date
             if new_time:
@@ -77,7 +112,11 @@ def update_route(driver_userID, route_id, new_date=None, new_time=None, new_stat
             if new_status:
                 route.status = new_status
             
+            db.session.flush()
+            sync_route_summary(route)
             db.session.commit()
+            invalidate_route_etas(route_id)
+            publish_route_update(route)
             return route
         return None
     except Exception as e:
@@ -85,6 +124,7 @@ def update_route(driver_userID, route_id, new_date=None, new_time=None, new_stat
         return None
 
 # Resident operations from UML diagram
+@read_only
 def view_driver(resident_userID, driver_userID=None):
     """
     Resident operation: view_driver(driver: Driver)
@@ -101,6 +141,7 @@ def view_driver(resident_userID, driver_userID=None):
     except Exception as e:
         return None
 
+@read_only
 def track_driver(resident_userID, driver_userID):
     """
     Resident operation: track_driver(driver: Driver)
@@ -109,11 +150,14 @@ def track_driver(resident_userID, driver_userID):
     try:
         driver = db.session.get(Driver, driver_userID)
         if driver:
+            # Prefer a buffered ping that has not been flushed yet
+            latest = location_buffer.latest(driver_userID)
+            latitude, longitude = latest if latest else (driver.currentLat, driver.currentLng)
             tracking_info = {
                 'driver': driver,
                 'currentLocation': {
-                    'latitude': driver.currentLat,
-                    'longitude': driver.currentLng
+                    'latitude': latitude,
+                    'longitude': longitude
                 },
                 'currentRoute': driver.driverRoute,
                 'activeRoutes': [route for route in driver.routes if route.status == 'active']
@@ -126,24 +170,36 @@ def track_driver(resident_userID, driver_userID):
 def request_stop(resident_userID, street_id, stop_time):
     """
     Resident operation: request_stop(newStop: Stop)
-    Creates a new stop request for the resident
+    Creates a new stop request for the resident, or reactivates their
+    cancelled stop on the street. The unique (residentID, streetID) index
+    settles concurrent requests: a new stop is one INSERT ... ON CONFLICT DO
+    NOTHING, and only when that hits an existing stop does a conditional
+    UPDATE try to reactivate it.
     """
     try:
-        # Check if resident already has a stop on this street
-        existing_stop = db.session.execute(
-            db.select(Stop).filter(
-                and_(Stop.residentID == resident_userID, Stop.streetID == street_id)
-            )
-        ).scalar_one_or_none()
-        
-        if existing_stop:
-            return {'error': 'Stop already requested for this street'}
-        
-        new_stop = Stop(residentID=resident_userID, streetID=street_id, 
-                       stopTime=stop_time, stopStatus='requested')
-        db.session.add(new_stop)
+        values = {'residentID': resident_userID, 'streetID': street_id, 'stopTime': stop_time}
+        stop = db.session.scalars(
+            upsert(Stop).values(stopStatus='requested', **values)
+            .on_conflict_do_nothing(index_elements=['residentID', 'streetID'])
+            .returning(Stop)
+        ).one_or_none()
+        if stop is not None:
+            adjust_route_summary(street_id=street_id, stops={'requested': 1})
+        else:
+            stop = db.session.scalars(
+                update(Stop)
+                .where(Stop.residentID == resident_userID, Stop.streetID == street_id,
+                       Stop.stopStatus == 'cancelled')
+                .values(stopStatus='requested', stopTime=stop_time)
+                .returning(Stop)
+                .execution_options(populate_existing=True, synchronize_session=False)
+            ).one_or_none()
+            if stop is None:
+                db.session.rollback()
+                return {'error': 'Stop already requested for this street'}
+            adjust_route_summary(street_id=street_id, stops={'cancelled': -1, 'requested': 1})
         db.session.commit()
-        return new_stop
+        return stop
     except Exception as e:
         db.session.rollback()
         return None
@@ -157,7 +213,10 @@ def cancel_stop(resident_userID, stop_id):
         stop = db.session.get(Stop, stop_id)
         if stop and stop.residentID == resident_userID:
             if stop.stopStatus in ['requested', 'confirmed']:
+                previous_status = stop.stopStatus
                 stop.stopStatus = 'cancelled'
+                db.session.flush()
+                adjust_route_summary(street_id=stop.streetID, stops={previous_status: -1, 'cancelled': 1})
                 db.session.commit()
                 return stop
             else:
@@ -168,9 +227,14 @@ def cancel_stop(resident_userID, stop_id):
         return None
 
 # Additional utility functions for route management
-def get_routes_by_driver(driver_userID):
-    """Get all routes for a specific driver"""
+def get_routes_by_driver(driver_userID, start_date=None, end_date=None):
+    """
+    Get all routes for a specific driver. Given start_date and/or end_date,
+    get the routes driven in that range instead, archived ones included.
+    """
     try:
+        if start_date is not None or end_date is not None:
+            return get_routes_in_range(driver_userID, start_date, end_date)
         driver = db.session.get(Driver, driver_userID)
         if driver:
             return driver.routes
@@ -178,9 +242,16 @@ def get_routes_by_driver(driver_userID):
     except Exception as e:
         return []
 
-def get_stops_by_resident(resident_userID):
-    """Get all stops requested by a specific resident"""
+@read_only
+def get_stops_by_resident(resident_userID, start_date=None, end_date=None):
+    """
+    Get all stops requested by a specific resident. Given start_date and/or
+    end_date, get their stops on routes driven in that range instead,
+    archived ones included.
+    """
     try:
+        if start_date is not None or end_date is not None:
+            return get_stops_in_range(resident_userID, start_date, end_date)
         resident = db.session.get(Resident, resident_userID)
         if resident:
             return resident.stops
@@ -205,7 +276,10 @@ def add_street_to_route(route_id, street_name, street_location):
         if route:
             street = Street(routeID=route_id, streetName=street_name, streetLocation=street_location)
             db.session.add(street)
+            db.session.flush()
+            adjust_route_summary(route_id=route_id, streets=1)
             db.session.commit()
+            invalidate_route_etas(route_id)
             return street
         return None
     except Exception as e:
@@ -219,7 +293,10 @@ def update_driver_location(driver_userID, new_lat, new_lng):
         if driver:
             driver.currentLat = new_lat
             driver.currentLng = new_lng
+            bump_versions('drivers')
             db.session.commit()
+            location_buffer.discard(driver_userID)
+            location_changed(driver_userID, new_lat, new_lng)
             return driver
         return None
     except Exception as e:
@@ -0,0 +1,176 @@
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+
+import numpy as np
+
+from App.models import Route, Street, Stop
+from App.database import db
+from .location import location_buffer, on_location_change
+from .optimizer import haversine_km_array, parse_street_location
+
+
+class ETACache:
+    """
+    Per-worker cache of computed route ETAs. Entries are dropped when the
+    route's driver reports a new location or the route changes, and expire
+    after ttl seconds so stop requests and writes handled by other workers
+    are picked up.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._routes = {}
+        self._by_driver = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'computations': 0}
+
+    def get(self, route_id):
+        with self._lock:
+            entry = self._routes.get(route_id)
+            if entry is None or entry[1] <= monotonic():
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return entry[2]
+
+    def set(self, route_id, driver_id, result):
+        with self._lock:
+            self._stats['computations'] += 1
+            self._routes[route_id] = (driver_id, monotonic() + self.ttl, result)
+            self._by_driver.setdefault(driver_id, set()).add(route_id)
+
+    def invalidate_driver(self, driver_id):
+        with self._lock:
+            for route_id in self._by_driver.pop(driver_id, ()):
+                self._routes.pop(route_id, None)
+
+    def invalidate_route(self, route_id):
+        with self._lock:
+            entry = self._routes.pop(route_id, None)
+            if entry is not None:
+                self._by_driver.get(entry[0], set()).discard(route_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['routes'] = len(self._routes)
+        return stats
+
+
+eta_cache = ETACache()
+_settings = {'speed_kmh': 25.0, 'dwell_seconds': 60}
+
+
+def setup_eta(app):
+    eta_cache.ttl = app.config['ETA_CACHE_TTL']
+    _settings['speed_kmh'] = app.config['ETA_AVERAGE_SPEED_KMH']
+    _settings['dwell_seconds'] = app.config['ETA_STOP_DWELL_SECONDS']
+    return eta_cache
+
+
+@on_location_change
+def _invalidate_driver_etas(driver_userID, lat, lng, recorded_at):
+    # A new position makes every cached ETA for the driver's routes stale
+    eta_cache.invalidate_driver(driver_userID)
+
+
+def invalidate_route_etas(route_id):
+    eta_cache.invalidate_route(route_id)
+
+
+def get_route_etas(route_id):
+    """
+    Resident operation: estimate when the van reaches each remaining stop.
+    Returns the ETAs for every open stop on an active route, computed once
+    per driver location update and shared by every caller until then.
+    """
+    cached = eta_cache.get(route_id)
+    if cached is not None:
+        return cached
+    try:
+        route = db.session.get(Route, route_id)
+        if not route:
+            return None
+        if route.status != 'active':
+            return {'error': 'Route is not active'}
+        start = location_buffer.latest(route.driverID)
+        if start is None and route.driver.currentLat is not None and route.driver.currentLng is not None:
+            start = (route.driver.currentLat, route.driver.currentLng)
+        if start is None:
+            return {'error': 'Driver location unknown'}
+        streets = db.session.scalars(
+            db.select(Street).filter(Street.routeID == route_id).order_by(Street.streetID)
+        ).all()
+        stops = db.session.execute(
+            db.select(Stop.stopID, Stop.streetID, Stop.residentID).join(Stop.street)
+            .filter(Street.routeID == route_id, Stop.stopStatus.in_(['requested', 'confirmed']))
+            .order_by(Stop.stopTime, Stop.stopID)
+        ).all()
+    except Exception as e:
+        return None
+    result = _compute_etas(route, start, streets, stops)
+    eta_cache.set(route_id, route.driverID, result)
+    return result
+
+
+def get_stop_eta(stop_id, resident_userID=None):
+    """Resident operation: ETA for a single stop, optionally checking ownership"""
+    stop = db.session.get(Stop, stop_id)
+    if not stop or (resident_userID is not None and stop.residentID != resident_userID):
+        return None
+    etas = get_route_etas(stop.street.routeID)
+    if not etas or 'error' in etas:
+        return etas
+    for eta in etas['stops']:
+        if eta['stopID'] == stop_id:
+            return eta
+    return {'error': 'Stop is not pending on this route'}
+
+
+def get_eta_cache_stats():
+    return eta_cache.get_stats()
+
+
+def _compute_etas(route, start, streets, stops):
+    computed_at = datetime.now()
+    located = [(street, parse_street_location(street.streetLocation)) for street in streets]
+    located = [(street, point) for street, point in located if point is not None]
+    result = {
+        'routeID': route.routeID,
+        'driverID': route.driverID,
+        'computedAt': computed_at.isoformat(timespec='seconds'),
+        'driverLocation': {'latitude': start[0], 'longitude': start[1]},
+        'stops': []
+    }
+    if not located or not stops:
+        return result
+
+    points = np.array([point for _, point in located])
+    # Streets before the one nearest the driver are treated as already driven
+    to_each = haversine_km_array(start[0], start[1], points[:, 0], points[:, 1])
+    first = int(np.argmin(to_each))
+    legs = np.empty(len(points) - first)
+    legs[0] = to_each[first]
+    legs[1:] = haversine_km_array(points[first:-1, 0], points[first:-1, 1], points[first + 1:, 0], points[first + 1:, 1])
+    km_to_street = np.cumsum(legs)
+
+    position = {street.streetID: first + offset for offset, (street, _) in enumerate(located[first:])}
+    pending = [(stop, position[stop.streetID]) for stop in stops if stop.streetID in position]
+    pending.sort(key=lambda item: item[1])
+    if not pending:
+        return result
+    street_index = np.array([index - first for _, index in pending])
+    km = km_to_street[street_index]
+    # Every stop served before this one adds its dwell time
+    seconds = km / _settings['speed_kmh'] * 3600 + np.arange(len(pending)) * _settings['dwell_seconds']
+    for (stop, _), distance, wait in zip(pending, km, seconds):
+        result['stops'].append({
+            'stopID': stop.stopID,
+            'streetID': stop.streetID,
+            'residentID': stop.residentID,
+            'distanceKm': round(float(distance), 3),
+            'etaSeconds': int(wait),
+            'eta': (computed_at + timedelta(seconds=float(wait))).isoformat(timespec='seconds')
+        })
+    return result
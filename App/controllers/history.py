@@ -0,0 +1,407 @@
+import atexit, logging, os, struct, sys, threading, zlib
+from array import array
+from datetime import datetime, timezone
+from time import perf_counter, time as wall_clock
+
+from sqlalchemy import func, insert, update
+
+from App.models import (
+    Route, Street, Stop, LocationSegment,
+    ArchivedRoute, ArchivedStreet, ArchivedStop, ArchivedLocationSegment
+)
+from App.database import db
+from .location import on_location_change
+
+
+logger = logging.getLogger(__name__)
+_segments = LocationSegment.__table__
+_archived_segments = ArchivedLocationSegment.__table__
+
+# Coordinates are stored as integers of 1e-5 degrees, about a metre
+COORDINATE_SCALE = 100000
+_HEADER = struct.Struct('<q')
+# Deltas are stored as int32: a gap of more than about 24 days between pings starts a new segment
+_MAX_DELTA = 2 ** 31 - 1
+
+
+def encode_points(points):
+    """
+    Pack (ms, lat, lng) integer points, sorted by time, into bytes: the first
+    timestamp as a 64-bit header, then three int32 arrays holding the deltas
+    of timestamps, latitudes and longitudes from the previous point.
+    """
+    base = points[0][0]
+    columns = (array('i'), array('i'), array('i'))
+    previous = (base, 0, 0)
+    for point in points:
+        for column, value, last in zip(columns, point, previous):
+            column.append(value - last)
+        previous = point
+    if sys.byteorder != 'little':
+        for column in columns:
+            column.byteswap()
+    return _HEADER.pack(base) + b''.join(column.tobytes() for column in columns)
+
+
+def decode_points(data, count, compressed=False):
+    """Inverse of encode_points; returns a list of (ms, lat, lng) integer points"""
+    if compressed:
+        data = zlib.decompress(data)
+    base, = _HEADER.unpack_from(data)
+    deltas = array('i')
+    deltas.frombytes(data[_HEADER.size:])
+    if sys.byteorder != 'little':
+        deltas.byteswap()
+    points, ms, lat, lng = [], base, 0, 0
+    for i in range(count):
+        ms += deltas[i]
+        lat += deltas[count + i]
+        lng += deltas[2 * count + i]
+        points.append((ms, lat, lng))
+    return points
+
+
+class SegmentConflict(Exception):
+    """Another worker changed an open segment between our read and write"""
+
+
+class LocationHistory:
+    """
+    Keeps every location ping of a driver on an active route as compact
+    per-route segments. Pings are buffered in memory and written every
+    interval_seconds (or once max_pending are waiting). Each route has one
+    open segment that grows until it holds segment_points pings; it is then
+    sealed, zlib compressed and never rewritten. Writes to an open segment
+    are checked against its point count, so two workers appending to the
+    same route at once retry instead of losing pings. It records what
+    location_changed reports, so pings from drivers without an active route,
+    and pings the location buffer rejects as older than a known fix, are
+    not kept. Pings are matched to routes when they are written, so
+    update_route flushes before a route stops being active; pings still
+    buffered in other workers at that moment are not kept. A driver with two
+    active routes has their pings stored on the newer one. A batch that
+    fails max_retries flushes in a row is dropped and logged, so one bad
+    batch cannot stall history for every driver.
+    """
+
+    def __init__(self, segment_points=512, interval_seconds=5, max_pending=2000, max_retries=3):
+        self.segment_points = segment_points
+        self.interval_seconds = interval_seconds
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._failures = 0
+        self.app = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._exit_hook = False
+        self._stats = {
+            'points': 0,
+            'unrouted': 0,
+            'flushes': 0,
+            'conflicts': 0,
+            'errors': 0,
+            'dropped': 0,
+            'segments_sealed': 0,
+            'sealed_points': 0,
+            'sealed_raw_bytes': 0,
+            'sealed_bytes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.segment_points = app.config['LOCATION_SEGMENT_POINTS']
+        self.interval_seconds = app.config['LOCATION_HISTORY_FLUSH_SECONDS']
+        self.max_pending = app.config['LOCATION_HISTORY_MAX_PENDING']
+        self.max_retries = app.config['LOCATION_HISTORY_MAX_RETRIES']
+
+    def record(self, driver_id, lat, lng, recorded_at=None):
+        recorded_at = recorded_at if recorded_at is not None else wall_clock()
+        point = (driver_id, int(round(recorded_at * 1000)),
+                 int(round(lat * COORDINATE_SCALE)), int(round(lng * COORDINATE_SCALE)))
+        with self._lock:
+            self._pending.append(point)
+            full = len(self._pending) >= self.max_pending
+        self._ensure_flusher()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Append all pending pings to their routes' segments. Returns the number stored."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, []
+        started = perf_counter()
+        try:
+            with self.app.app_context():
+                stored = self._store(batch)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+                self._failures += 1
+                dropped = self._failures >= self.max_retries
+                if dropped:
+                    self._failures = 0
+                    self._stats['dropped'] += len(batch)
+                else:
+                    self._pending[:0] = batch
+            if dropped:
+                logger.error('Dropped %s location history pings after %s failed flushes',
+                             len(batch), self.max_retries)
+            raise
+        flush_ms = (perf_counter() - started) * 1000
+        with self._lock:
+            self._failures = 0
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['points'] += stored
+            stats['unrouted'] += len(batch) - stored
+            stats['last_flush_ms'] = flush_ms
+            stats['max_flush_ms'] = max(stats['max_flush_ms'], flush_ms)
+        return stored
+
+    def drain(self):
+        """Stop the flusher and write whatever is still pending."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.interval_seconds, 1.0) * 5)
+        self._thread = None
+        if self.app is not None:
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('Location history drain failed: %s', e)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        # Compare with 24 bytes for three plain 8-byte columns per ping
+        stats['sealed_bytes_per_point'] = (
+            stats['sealed_bytes'] / stats['sealed_points'] if stats['sealed_points'] else 0.0
+        )
+        stats['compression_ratio'] = (
+            stats['sealed_raw_bytes'] / stats['sealed_bytes'] if stats['sealed_bytes'] else 0.0
+        )
+        return stats
+
+    def _store(self, batch):
+        routes = dict(db.session.execute(
+            db.select(Route.driverID, func.max(Route.routeID))
+            .filter(Route.status == 'active', Route.driverID.in_({point[0] for point in batch}))
+            .group_by(Route.driverID)
+        ).all())
+        by_route = {}
+        for driver_id, ms, lat, lng in batch:
+            if driver_id in routes:
+                by_route.setdefault((routes[driver_id], driver_id), []).append((ms, lat, lng))
+        for attempt in range(3):
+            sealed = []
+            try:
+                for (route_id, driver_id), points in by_route.items():
+                    self._append(route_id, driver_id, list(points), sealed)
+                db.session.commit()
+                break
+            except SegmentConflict:
+                db.session.rollback()
+                with self._lock:
+                    self._stats['conflicts'] += 1
+        else:
+            raise SegmentConflict('Open location segments kept changing; will retry on the next flush')
+        db.session.remove()
+        with self._lock:
+            for points, raw_bytes, stored_bytes in sealed:
+                self._stats['segments_sealed'] += 1
+                self._stats['sealed_points'] += points
+                self._stats['sealed_raw_bytes'] += raw_bytes
+                self._stats['sealed_bytes'] += stored_bytes
+        return sum(len(points) for points in by_route.values())
+
+    def _append(self, route_id, driver_id, points, sealed_log):
+        open_segments = db.session.execute(
+            db.select(_segments.c.segmentID, _segments.c.pointCount, _segments.c.data)
+            .where(_segments.c.routeID == route_id, _segments.c.sealed.is_(False))
+            .order_by(_segments.c.segmentID)
+        ).all()
+        # Two workers can each open a segment for a new route; keep appending to the newest
+        for segment in open_segments[:-1]:
+            self._write(segment, decode_points(segment.data, segment.pointCount), True, sealed_log)
+        current = open_segments[-1] if open_segments else None
+        if current is not None:
+            points = decode_points(current.data, current.pointCount) + points
+        points.sort()
+        chunks = _split_points(points, self.segment_points)
+        for index, chunk in enumerate(chunks):
+            # Every chunk but the newest is closed, by its size or by a gap too long to encode
+            sealed = index < len(chunks) - 1 or len(chunk) == self.segment_points
+            if index == 0 and current is not None:
+                self._write(current, chunk, sealed, sealed_log)
+            else:
+                db.session.execute(insert(_segments).values(
+                    routeID=route_id, driverID=driver_id, **_segment_values(chunk, sealed, sealed_log)
+                ))
+
+    def _write(self, segment, points, sealed, sealed_log):
+        result = db.session.execute(
+            update(_segments)
+            .where(_segments.c.segmentID == segment.segmentID, _segments.c.pointCount == segment.pointCount,
+                   _segments.c.sealed.is_(False))
+            .values(**_segment_values(points, sealed, sealed_log))
+        )
+        if result.rowcount != 1:
+            raise SegmentConflict(segment.segmentID)
+
+    def _ensure_flusher(self):
+        # Started lazily so no thread exists in the gunicorn master before fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stopping = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='location-history', daemon=True)
+            self._thread.start()
+            if not self._exit_hook:
+                atexit.register(self.drain)
+                self._exit_hook = True
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('Location history flush failed: %s', e)
+
+
+def _split_points(points, size):
+    chunks, chunk = [], []
+    for point in points:
+        if chunk and (len(chunk) == size or point[0] - chunk[-1][0] > _MAX_DELTA):
+            chunks.append(chunk)
+            chunk = []
+        chunk.append(point)
+    chunks.append(chunk)
+    return chunks
+
+
+def _segment_values(points, sealed, sealed_log):
+    data = encode_points(points)
+    if sealed:
+        raw_bytes = len(data)
+        data = zlib.compress(data)
+        sealed_log.append((len(points), raw_bytes, len(data)))
+    return {
+        'startedAt': _to_datetime(points[0][0] / 1000),
+        'endedAt': _to_datetime(points[-1][0] / 1000),
+        'pointCount': len(points),
+        'sealed': sealed,
+        'data': data,
+    }
+
+
+def _to_datetime(timestamp):
+    # Segment bounds are naive UTC, like the epoch timestamps they come from
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+location_history = LocationHistory()
+
+
+def setup_location_history(app):
+    location_history.init_app(app)
+    return location_history
+
+
+@on_location_change
+def _record_location_history(driver_userID, lat, lng, recorded_at):
+    location_history.record(driver_userID, lat, lng, recorded_at)
+
+
+def flush_location_history(quiet=False):
+    """
+    Write all buffered history pings now. With quiet=True a failed flush is
+    logged instead of raised and returns None; its pings stay queued.
+    """
+    if not quiet:
+        return location_history.flush()
+    try:
+        return location_history.flush()
+    except Exception as e:
+        logger.warning('Location history flush failed: %s', e)
+        return None
+
+
+def get_location_history_stats():
+    return location_history.get_stats()
+
+
+def iter_route_path(route_id, start=None, end=None, batch_size=16):
+    """
+    Yield (timestamp, lat, lng) for a route's recorded pings in time order,
+    limited to start <= timestamp <= end (epoch seconds) when given. Only
+    segments overlapping the window are read, batch_size rows at a time, and
+    each is decoded only when reached, so memory stays flat for any history.
+    A ping that reached the server late can appear just after a later one.
+    Archived routes are only replayed when a window is given.
+    """
+    found = False
+    for point in _iter_segments(_segments, route_id, start, end, batch_size):
+        found = True
+        yield point
+    if not found and (start is not None or end is not None):
+        yield from _iter_segments(_archived_segments, route_id, start, end, batch_size)
+
+
+def _iter_segments(segments, route_id, start, end, batch_size):
+    query = (
+        db.select(segments.c.pointCount, segments.c.sealed, segments.c.data)
+        .where(segments.c.routeID == route_id)
+        .order_by(segments.c.startedAt, segments.c.segmentID)
+    )
+    if start is not None:
+        query = query.where(segments.c.endedAt >= _to_datetime(start))
+    if end is not None:
+        query = query.where(segments.c.startedAt <= _to_datetime(end))
+    for segment in db.session.execute(query.execution_options(yield_per=batch_size)):
+        for ms, lat, lng in decode_points(segment.data, segment.pointCount, segment.sealed):
+            timestamp = ms / 1000
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                yield timestamp, lat / COORDINATE_SCALE, lng / COORDINATE_SCALE
+
+
+def can_view_route_path(route_id, user_id):
+    """
+    A route's path may be replayed by its driver and by residents with a stop
+    on it, whether the route is live or archived.
+    """
+    for route, street, stop in ((Route, Street, Stop), (ArchivedRoute, ArchivedStreet, ArchivedStop)):
+        driver_id = db.session.scalar(db.select(route.driverID).filter(route.routeID == route_id))
+        if driver_id is None:
+            continue
+        if driver_id == user_id:
+            return True
+        resident_stop = (
+            db.select(stop.stopID)
+            .join(street, street.streetID == stop.streetID)
+            .filter(street.routeID == route_id, stop.residentID == user_id)
+            .limit(1)
+        )
+        return db.session.scalar(resident_stop) is not None
+    return False
+
+
+def get_route_path(route_id, start=None, end=None):
+    """Driver operation: replay a route's recorded path, optionally within a time window"""
+    return [{'t': t, 'lat': lat, 'lng': lng} for t, lat, lng in iter_route_path(route_id, start, end)]
@@ -0,0 +1,173 @@
+import csv, os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import perf_counter
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from App.models import User, Driver, Resident
+from App.database import db
+from App.hashing import password_hasher
+from App.response_cache import bump_versions
+from .location import location_changed
+
+
+def read_user_csv(path):
+    """
+    Stream user rows from a CSV file with a header line. Residents need the
+    columns username, password, name, address and phone; drivers need
+    username and password and may have route, lat and lng.
+    """
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        for record in reader:
+            record['line'] = reader.line_num
+            yield record
+
+
+def import_users(user_type, rows, chunk_size=500, processes=None, checkpoint_path=None):
+    """
+    Bulk version of create_driver/create_resident for onboarding.
+    Passwords are hashed on a pool of processes (processes=0 hashes inline)
+    while the previous chunk is inserted, and every chunk is committed on its
+    own. After each commit the last line is written to checkpoint_path, so a
+    rerun after an interruption skips straight past it; usernames that
+    already exist are skipped too, and a username repeated later in the file
+    is reported as a failed row. The checkpoint is removed once the whole
+    file has been imported.
+    """
+    model = {'driver': Driver, 'resident': Resident}[user_type]
+    resume_after = _read_checkpoint(checkpoint_path)
+    summary = {'imported': 0, 'skipped': 0, 'failed': [], 'resumedAfter': resume_after}
+    started = perf_counter()
+    processes = os.cpu_count() if processes is None else processes
+    pool = ProcessPoolExecutor(processes) if processes else None
+    rows = (row for row in rows if row['line'] > resume_after)
+    # Usernames of the whole run, including the chunk still waiting to be inserted
+    seen = set()
+    pending = None
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            prepared = _drop_existing_users(_prepare_users(user_type, chunk, seen, summary), summary)
+            hashing = _hash_passwords(pool, [password for _, _, password, _ in prepared], processes)
+            if pending is not None:
+                _insert_users(user_type, model, *pending, summary, checkpoint_path)
+            pending = (prepared, hashing, chunk[-1]['line'])
+        if pending is not None:
+            _insert_users(user_type, model, *pending, summary, checkpoint_path)
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    except Exception as e:
+        db.session.rollback()
+        summary['error'] = str(e)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    summary['failed'].sort(key=lambda failure: failure['row'])
+    summary['seconds'] = round(perf_counter() - started, 3)
+    summary['rowsPerSecond'] = round(summary['imported'] / summary['seconds'], 1) if summary['seconds'] else 0.0
+    return summary
+
+
+def _hash_batch(method, passwords):
+    return [generate_password_hash(password, method) for password in passwords]
+
+
+def _hash_passwords(pool, passwords, processes):
+    # Returns a callable that waits for the hashes, so hashing overlaps the previous insert
+    method = password_hasher.method
+    if pool is None:
+        return lambda: _hash_batch(method, passwords)
+    size = -(-len(passwords) // processes) or 1
+    futures = [pool.submit(_hash_batch, method, passwords[i:i + size]) for i in range(0, len(passwords), size)]
+    return lambda: [password for future in futures for password in future.result()]
+
+
+def _insert_users(user_type, model, prepared, hashing, last_line, summary, checkpoint_path):
+    user_ids = []
+    if prepared:
+        # Keyed by the unique username: SQLite can only batch RETURNING when row order is not needed
+        users = User.__table__
+        ids = dict(db.session.execute(
+            insert(users).returning(users.c.userName, users.c.userID),
+            [{'userName': username, 'password': password, 'user_type': user_type}
+             for (_, username, _, _), password in zip(prepared, hashing())]
+        ).all())
+        user_ids = [ids[username] for _, username, _, _ in prepared]
+        db.session.execute(insert(model.__table__), [
+            dict(row, userID=user_id) for user_id, (_, _, _, row) in zip(user_ids, prepared)
+        ])
+        bump_versions(user_type + 's')
+    db.session.commit()
+    summary['imported'] += len(user_ids)
+    _write_checkpoint(checkpoint_path, last_line)
+    if model is Driver:
+        for user_id, (_, _, _, row) in zip(user_ids, prepared):
+            if row['currentLat'] is not None and row['currentLng'] is not None:
+                location_changed(user_id, row['currentLat'], row['currentLng'])
+
+
+def _prepare_users(user_type, chunk, seen, summary):
+    prepared = []
+    for record in chunk:
+        try:
+            username = (record.get('username') or '').strip()
+            if not username or not record.get('password'):
+                raise ValueError('username and password are required')
+            if len(username) > 20:
+                raise ValueError('username is longer than 20 characters')
+            if username in seen:
+                raise ValueError(f'Duplicate username {username} in file')
+            if user_type == 'driver':
+                row = {
+                    'driverRoute': record.get('route') or None,
+                    'currentLat': _optional_float(record.get('lat')),
+                    'currentLng': _optional_float(record.get('lng')),
+                }
+            else:
+                if not record.get('name') or not record.get('address'):
+                    raise ValueError('name and address are required')
+                row = {
+                    'residentName': record['name'],
+                    'residentAddress': record['address'],
+                    'residentPhone': int(record['phone']),
+                }
+        except (KeyError, TypeError, ValueError) as e:
+            summary['failed'].append({'row': record['line'], 'error': str(e)})
+            continue
+        seen.add(username)
+        prepared.append((record['line'], username, record['password'], row))
+    return prepared
+
+
+def _drop_existing_users(prepared, summary):
+    usernames = [username for _, username, _, _ in prepared]
+    existing = set(db.session.scalars(
+        db.select(User.userName).filter(User.userName.in_(usernames))
+    ).all()) if usernames else set()
+    summary['skipped'] += len(existing)
+    return [user for user in prepared if user[1] not in existing]
+
+
+def _optional_float(value):
+    return float(value) if value not in (None, '') else None
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(f.read().strip() or 0)
+
+
+def _write_checkpoint(path, line):
+    if not path:
+        return
+    # Written beside the target and renamed so an interrupted write never leaves a torn file
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(line))
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,243 @@
+import atexit, logging, math, os, threading
+from time import perf_counter, time as wall_clock
+
+from sqlalchemy import bindparam, update
+
+from App.models import Driver
+from App.database import db
+from App.response_cache import bump_versions
+
+
+logger = logging.getLogger(__name__)
+_location_listeners = []
+
+
+class LocationBuffer:
+    """
+    Collects driver location pings in memory and writes them to the drivers
+    table in batches. Only the latest fix per driver is kept, so a driver
+    pinging many times between flushes costs a single row in the UPDATE.
+    A flush happens every interval_ms milliseconds or as soon as max_pings
+    distinct drivers are pending, whichever comes first. Pings with
+    coordinates off the globe, or timestamps more than max_ahead_seconds
+    ahead of or max_age_seconds behind the server clock, are rejected.
+    """
+
+    def __init__(self, interval_ms=500, max_pings=200, max_ahead_seconds=60, max_age_seconds=86400):
+        self.interval_ms = interval_ms
+        self.max_pings = max_pings
+        self.max_ahead_seconds = max_ahead_seconds
+        self.max_age_seconds = max_age_seconds
+        self.app = None
+        self._pending = {}
+        self._flushing = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._exit_hook = False
+        self._stats = {
+            'pings': 0,
+            'rejected': 0,
+            'coalesced': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'last_ping_lag_ms': 0.0,
+            'max_ping_lag_ms': 0.0,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.interval_ms = app.config['LOCATION_FLUSH_INTERVAL_MS']
+        self.max_pings = app.config['LOCATION_FLUSH_MAX_PINGS']
+        self.max_ahead_seconds = app.config['LOCATION_MAX_AHEAD_SECONDS']
+        self.max_age_seconds = app.config['LOCATION_MAX_AGE_SECONDS']
+
+    def check(self, lat, lng, recorded_at=None):
+        """Return why a ping is unusable, or None when it can be recorded."""
+        if not (math.isfinite(lat) and math.isfinite(lng)) or abs(lat) > 90 or abs(lng) > 180:
+            return 'lat must be within [-90, 90] and lng within [-180, 180]'
+        if recorded_at is not None:
+            now = wall_clock()
+            if not math.isfinite(recorded_at) or not (
+                    now - self.max_age_seconds <= recorded_at <= now + self.max_ahead_seconds):
+                return 'timestamp must be epoch seconds close to the server time'
+        return None
+
+    def record(self, driver_id, lat, lng, recorded_at=None):
+        """Buffer a valid ping unless a newer fix for the driver is already known."""
+        invalid = self.check(lat, lng, recorded_at)
+        recorded_at = recorded_at if recorded_at is not None else wall_clock()
+        with self._lock:
+            self._stats['pings'] += 1
+            if invalid:
+                self._stats['rejected'] += 1
+                return False
+            if driver_id in self._pending:
+                self._stats['coalesced'] += 1
+            previous = self._last_seen.get(driver_id)
+            if previous is not None and previous > recorded_at:
+                return False
+            self._pending[driver_id] = (lat, lng, recorded_at, perf_counter())
+            self._last_seen[driver_id] = recorded_at
+            full = len(self._pending) >= self.max_pings
+        self._ensure_flusher()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def latest(self, driver_id):
+        """
+        Return a driver's (lat, lng) that is not in the database yet, or
+        None. Flushed fixes are left to the database, which every worker shares.
+        """
+        with self._lock:
+            fix = self._pending.get(driver_id) or self._flushing.get(driver_id)
+        return (fix[0], fix[1]) if fix else None
+
+    def discard(self, driver_id):
+        """Forget a driver's buffered fix after it was written directly."""
+        with self._lock:
+            self._pending.pop(driver_id, None)
+            self._last_seen.pop(driver_id, None)
+
+    def flush(self):
+        """Write all pending fixes in one batched UPDATE. Returns the row count."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+        rows = [
+            {'b_userID': driver_id, 'b_lat': fix[0], 'b_lng': fix[1]}
+            for driver_id, fix in batch.items()
+        ]
+        statement = (
+            update(Driver.__table__)
+            .where(Driver.__table__.c.userID == bindparam('b_userID'))
+            .values(currentLat=bindparam('b_lat'), currentLng=bindparam('b_lng'))
+        )
+        started = perf_counter()
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(statement, rows)
+                    # Once per batch, not per ping: driver lists show positions, so their ETags must change
+                    bump_versions('drivers', connection=connection)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+                # Put the batch back unless a newer fix arrived meanwhile
+                for driver_id, fix in batch.items():
+                    self._pending.setdefault(driver_id, fix)
+                self._flushing = {}
+            raise
+        finished = perf_counter()
+        flush_ms = (finished - started) * 1000
+        lag_ms = (finished - min(fix[3] for fix in batch.values())) * 1000
+        with self._lock:
+            self._flushing = {}
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['rows_flushed'] += len(rows)
+            stats['last_flush_ms'] = flush_ms
+            stats['max_flush_ms'] = max(stats['max_flush_ms'], flush_ms)
+            stats['total_flush_ms'] += flush_ms
+            stats['last_ping_lag_ms'] = lag_ms
+            stats['max_ping_lag_ms'] = max(stats['max_ping_lag_ms'], lag_ms)
+        return len(rows)
+
+    def drain(self):
+        """Stop the flusher and write whatever is still pending."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.interval_ms / 1000.0, 1.0) * 5)
+        self._thread = None
+        if self.app is not None:
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('Location drain failed: %s', e)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+    def _ensure_flusher(self):
+        # Started lazily so no thread exists in the gunicorn master before fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stopping = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='location-flusher', daemon=True)
+            self._thread.start()
+            if not self._exit_hook:
+                atexit.register(self.drain)
+                self._exit_hook = True
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval_ms / 1000.0)
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('Location flush failed: %s', e)
+
+
+location_buffer = LocationBuffer()
+
+
+def setup_location_buffer(app):
+    location_buffer.init_app(app)
+    return location_buffer
+
+
+def on_location_change(listener):
+    """Register listener(driver_userID, lat, lng, recorded_at) for every location write"""
+    _location_listeners.append(listener)
+    return listener
+
+
+def location_changed(driver_userID, lat, lng, recorded_at=None):
+    """Tell every registered listener that a driver has a new position"""
+    for listener in _location_listeners:
+        listener(driver_userID, lat, lng, recorded_at)
+
+
+def check_driver_location(new_lat, new_lng, recorded_at=None):
+    """Why a location ping would be rejected, or None when it is usable"""
+    return location_buffer.check(new_lat, new_lng, recorded_at)
+
+
+def ingest_driver_location(driver_userID, new_lat, new_lng, recorded_at=None):
+    """Buffer a location ping; it reaches the database on the next flush"""
+    accepted = location_buffer.record(driver_userID, new_lat, new_lng, recorded_at)
+    if accepted:
+        location_changed(driver_userID, new_lat, new_lng, recorded_at)
+    return accepted
+
+
+def flush_driver_locations():
+    """Write all buffered location pings now"""
+    return location_buffer.flush()
+
+
+def get_location_buffer_stats():
+    """Ping, coalescing and flush latency counters for this worker"""
+    return location_buffer.get_stats()
@@ -0,0 +1,184 @@
+import json, logging, os, sqlite3, threading
+from datetime import datetime
+from itertools import groupby
+from time import perf_counter
+
+from App.models import Resident, Route, Street, Stop, Job
+from App.database import db
+from App.jobs import job, enqueue
+
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_STOP_STATUSES = ('requested', 'confirmed')
+
+
+class LogSink:
+    """Default sink: logs each batch. Swap in a real SMS/push sink for production."""
+
+    def write(self, notifications):
+        for notification in notifications:
+            logger.info('Notify resident %s: %s', notification['residentID'], notification['message'])
+
+
+class FileSink:
+    """Appends notifications to a file as JSON lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, notifications):
+        lines = [json.dumps(notification) + '\n' for notification in notifications]
+        with self._lock, open(self.path, 'a') as f:
+            f.writelines(lines)
+
+
+class SQLiteSink:
+    """Inserts notifications into a table in a local SQLite file, one transaction per batch"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY, residentID INTEGER NOT NULL, '
+                'routeID INTEGER NOT NULL, kind TEXT NOT NULL, message TEXT NOT NULL, payload TEXT NOT NULL, '
+                'createdAt TEXT NOT NULL)'
+            )
+
+    def write(self, notifications):
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT INTO notifications (residentID, routeID, kind, message, payload, createdAt) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(n['residentID'], n['routeID'], n['kind'], n['message'], json.dumps(n), n['createdAt'])
+                 for n in notifications]
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+
+def make_sink(spec):
+    """Build a sink from NOTIFICATION_SINK: 'log', 'file:<path>' or 'sqlite:<path>'"""
+    if not spec or spec == 'log':
+        return LogSink()
+    kind, _, path = spec.partition(':')
+    path = os.path.expanduser(path)
+    if kind == 'file':
+        return FileSink(path)
+    if kind == 'sqlite':
+        return SQLiteSink(path)
+    raise ValueError(f'Unknown notification sink {spec}')
+
+
+class Notifier:
+    """
+    Fans a route event out to every resident with an open stop on the
+    route. Recipients come from one join over stops, streets and residents,
+    streamed batch_size rows at a time and ordered by resident so each
+    resident gets a single notification listing all their stops. Each batch
+    is handed to the sink in one call. Delivery is at least once: a job that
+    fails part way through is retried from the start.
+    """
+
+    def __init__(self, sink=None, batch_size=1000):
+        self.sink = sink or LogSink()
+        self.batch_size = batch_size
+
+    def init_app(self, app):
+        self.sink = make_sink(app.config['NOTIFICATION_SINK'])
+        self.batch_size = app.config['NOTIFICATION_BATCH_SIZE']
+
+    def notify_route_active(self, route_id):
+        started = perf_counter()
+        route = db.session.get(Route, route_id)
+        if route is None:
+            return None
+        rows = db.session.execute(
+            db.select(Stop.residentID, Stop.stopID, Stop.stopTime, Street.streetName,
+                      Resident.residentName, Resident.residentPhone)
+            .join(Street, Street.streetID == Stop.streetID)
+            .join(Resident, Resident.userID == Stop.residentID)
+            .filter(Street.routeID == route_id, Stop.stopStatus.in_(NOTIFY_STOP_STATUSES))
+            .order_by(Stop.residentID, Stop.stopTime, Stop.stopID)
+            .execution_options(yield_per=self.batch_size)
+        )
+        created_at = datetime.now().isoformat()
+        batch, recipients, stops, batches = [], 0, 0, 0
+        for resident_id, resident_stops in groupby(rows, key=lambda row: row.residentID):
+            resident_stops = list(resident_stops)
+            batch.append(_route_active_notification(route, resident_stops, created_at))
+            recipients += 1
+            stops += len(resident_stops)
+            if len(batch) >= self.batch_size:
+                self.sink.write(batch)
+                batches += 1
+                batch = []
+        if batch:
+            self.sink.write(batch)
+            batches += 1
+        elapsed_ms = (perf_counter() - started) * 1000
+        logger.info('Route %s active: notified %s residents about %s stops in %.1f ms',
+                    route_id, recipients, stops, elapsed_ms)
+        return {'routeID': route_id, 'recipients': recipients, 'stops': stops,
+                'batches': batches, 'ms': round(elapsed_ms, 3)}
+
+
+def _route_active_notification(route, resident_stops, created_at):
+    first = resident_stops[0]
+    streets = ', '.join(dict.fromkeys(row.streetName for row in resident_stops))
+    return {
+        'kind': 'route_active',
+        'routeID': route.routeID,
+        'residentID': first.residentID,
+        'phone': first.residentPhone,
+        'stops': [row.stopID for row in resident_stops],
+        'message': f'{first.residentName}, the bread van is on its way to {streets} '
+                   f'(first stop around {first.stopTime.strftime("%H:%M")}).',
+        'createdAt': created_at
+    }
+
+
+notifier = Notifier()
+
+
+def setup_notifications(app):
+    notifier.init_app(app)
+    return notifier
+
+
+def queue_route_notifications(route_id):
+    """Queue the fan-out for a route that has just gone active, in the caller's transaction"""
+    return enqueue('notifications.route_active', {'route_id': route_id})
+
+
+@job('notifications.route_active')
+def notify_route_active(route_id):
+    """Tell every resident with an open stop on the route that the van is on its way"""
+    return notifier.notify_route_active(route_id)
+
+
+def get_notification_stats():
+    """
+    Fan-out counts and latency summed from the results of finished
+    notification jobs. The fan-out runs in worker processes, so the jobs
+    table is where every web worker can see it; purged jobs drop out.
+    """
+    stats = {'fanouts': 0, 'notifications': 0, 'stops': 0, 'last_ms': 0.0, 'max_ms': 0.0, 'total_ms': 0.0}
+    results = db.session.scalars(
+        db.select(Job.result)
+        .filter(Job.name == 'notifications.route_active', Job.status == 'done', Job.result.isnot(None))
+        .order_by(Job.finishedAt, Job.jobID)
+    )
+    for result in map(json.loads, results):
+        if not result:
+            continue
+        stats['fanouts'] += 1
+        stats['notifications'] += result['recipients']
+        stats['stops'] += result['stops']
+        stats['last_ms'] = result['ms']
+        stats['max_ms'] = max(stats['max_ms'], result['ms'])
+        stats['total_ms'] += result['ms']
+    stats['avg_ms'] = stats['total_ms'] / stats['fanouts'] if stats['fanouts'] else 0.0
+    return stats
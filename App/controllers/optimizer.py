@@ -0,0 +1,164 @@
+import re
+from time import perf_counter
+
+import numpy as np
+
+from App.models import Route, Street, Stop
+from App.database import db
+from .location import location_buffer
+from .spatial import EARTH_RADIUS_KM
+
+
+# The whole location must be the pair, so house and lot numbers in an address are not read as one
+_COORDINATES = re.compile(r'\s*\(?\s*(-?\d+(?:\.\d+)?)\s*[,;]\s*(-?\d+(?:\.\d+)?)\s*\)?\s*')
+
+
+def parse_street_location(location):
+    """
+    Read Street.streetLocation as a (lat, lng) pair such as '10.65,-61.51' or
+    '(10.65, -61.51)'. Returns None for anything else, e.g. a street address.
+    """
+    match = _COORDINATES.fullmatch(location or '')
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def haversine_km_array(lat1, lng1, lat2, lng2):
+    """Element-wise great-circle distance in kilometres; inputs broadcast"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(points):
+    """Pairwise great-circle distances in kilometres for an (n, 2) lat/lng array"""
+    points = np.asarray(points, dtype=float)
+    lat, lng = points[:, 0:1], points[:, 1:2]
+    return haversine_km_array(lat, lng, lat.T, lng.T)
+
+
+def path_length(path, dist):
+    path = np.asarray(path)
+    return float(dist[path[:-1], path[1:]].sum()) if len(path) > 1 else 0.0
+
+
+def nearest_neighbour_path(dist, start=0):
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    path = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[path[-1]])
+        nxt = int(np.argmin(row))
+        path.append(nxt)
+        visited[nxt] = True
+    return path
+
+
+def two_opt(path, dist, deadline):
+    """
+    Improve an open path with 2-opt moves until no move helps or the
+    deadline passes. The first node stays fixed as the starting point. For
+    each segment start every segment end is scored in one NumPy step.
+    """
+    path = np.array(path)
+    n = len(path)
+    improved = True
+    while improved and perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = path[i - 1], path[i]
+            ends = path[i + 1:]
+            # Node after each candidate segment end; -1 marks the end of the route
+            after = np.append(path[i + 2:], -1)
+            has_after = after >= 0
+            old = dist[a, b] + np.where(has_after, dist[ends, after], 0.0)
+            new = dist[a, ends] + np.where(has_after, dist[b, after], 0.0)
+            delta = new - old
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = i + 1 + best
+                path[i:j + 1] = path[i:j + 1][::-1].copy()
+                improved = True
+            if perf_counter() >= deadline:
+                break
+    return path.tolist()
+
+
+def optimize_route(route_id, time_budget_ms=50, only_with_stops=False):
+    """
+    Suggest a visit order for a route's streets that is close to the shortest.
+    Street coordinates come from Street.streetLocation and the drive starts
+    from the driver's current position when it is known. A nearest-neighbour
+    tour is refined with 2-opt until time_budget_ms runs out. Streets whose
+    location has no coordinates are kept at the end in their original order.
+    """
+    try:
+        route = db.session.get(Route, route_id)
+        if not route:
+            return None
+        streets = db.session.scalars(
+            db.select(Street).filter(Street.routeID == route_id).order_by(Street.streetID)
+        ).all()
+        stops = db.session.scalars(
+            db.select(Stop).join(Stop.street)
+            .filter(Street.routeID == route_id, Stop.stopStatus != 'cancelled')
+            .order_by(Stop.stopTime, Stop.stopID)
+        ).all()
+    except Exception as e:
+        return None
+
+    started = perf_counter()
+    stops_by_street = {}
+    for stop in stops:
+        stops_by_street.setdefault(stop.streetID, []).append(stop)
+    if only_with_stops:
+        streets = [street for street in streets if street.streetID in stops_by_street]
+
+    located, unlocated, points = [], [], []
+    for street in streets:
+        point = parse_street_location(street.streetLocation)
+        if point is None:
+            unlocated.append(street)
+        else:
+            located.append(street)
+            points.append(point)
+
+    start = location_buffer.latest(route.driverID)
+    if start is None and route.driver and route.driver.currentLat is not None and route.driver.currentLng is not None:
+        start = (route.driver.currentLat, route.driver.currentLng)
+    offset = 1 if start is not None else 0
+    if start is not None:
+        points.insert(0, start)
+
+    order, distance, original = [], 0.0, 0.0
+    if located:
+        dist = distance_matrix(points)
+        original_path = list(range(len(points)))
+        path = nearest_neighbour_path(dist)
+        path = two_opt(path, dist, started + time_budget_ms / 1000.0)
+        distance, original = path_length(path, dist), path_length(original_path, dist)
+        legs = np.concatenate(([0.0], dist[path[:-1], path[1:]]))
+        for node, leg in zip(path, legs):
+            if node >= offset:
+                order.append((located[node - offset], float(leg)))
+
+    visits = []
+    for street, leg in order + [(street, None) for street in unlocated]:
+        visit = street.get_json()
+        visit['legKm'] = round(leg, 3) if leg is not None else None
+        visit['stops'] = [stop.get_json() for stop in stops_by_street.get(street.streetID, [])]
+        visits.append(visit)
+    return {
+        'routeID': route_id,
+        'startsFromDriver': start is not None,
+        'distanceKm': round(distance, 3),
+        'originalDistanceKm': round(original, 3),
+        'unlocatedStreets': [street.streetID for street in unlocated],
+        'elapsedMs': round((perf_counter() - started) * 1000, 2),
+        'visits': visits
+    }
@@ -0,0 +1,178 @@
+import csv, json
+from datetime import datetime, date, time
+from itertools import islice
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from App.models import Driver, Route, Street
+from App.database import db
+from .summary import record_new_routes
+
+
+def schedule_routes_bulk(route_rows, chunk_size=500):
+    """
+    Bulk version of schedule_route for weekly plans.
+    route_rows is any iterable of dicts with driver_id, date, time and an
+    optional streets list of (name, location) tuples or dicts. Rows are
+    consumed in chunks so the input can be streamed from a file. Every chunk
+    inserts its routes and streets with executemany-style statements inside
+    a savepoint; rows that fail are reported and skipped while the rest of
+    the batch is committed in one transaction at the end.
+    """
+    summary = {'created': [], 'failed': []}
+    rows = iter(route_rows)
+    position = 0
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            prepared = []
+            for row in chunk:
+                position += 1
+                line = row.get('line', position) if isinstance(row, dict) else position
+                try:
+                    prepared.append((line, _prepare_route_row(row)))
+                except (AttributeError, KeyError, TypeError, ValueError) as e:
+                    summary['failed'].append({'row': line, 'error': _describe_error(e)})
+            prepared = _drop_unknown_drivers(prepared, summary)
+            if not prepared:
+                continue
+            try:
+                with db.session.begin_nested():
+                    summary['created'].extend(_insert_routes([route for _, route in prepared]))
+            except SQLAlchemyError:
+                # Fall back to one savepoint per row so a bad row only fails itself
+                for line, route in prepared:
+                    try:
+                        with db.session.begin_nested():
+                            summary['created'].extend(_insert_routes([route]))
+                    except SQLAlchemyError as e:
+                        summary['failed'].append({'row': line, 'error': str(e.orig if hasattr(e, 'orig') else e)})
+        db.session.commit()
+        summary['failed'].sort(key=lambda failure: failure['row'])
+    except Exception as e:
+        db.session.rollback()
+        summary['created'] = []
+        summary['error'] = str(e)
+    return summary
+
+
+def read_route_plan(path):
+    """
+    Stream route rows from a CSV or NDJSON (.ndjson/.jsonl) file.
+    CSV files have the columns driver_id, date, time, street_name and
+    street_location with one street per line; consecutive lines for the same
+    driver, date and time make up one route.
+    """
+    if path.endswith(('.ndjson', '.jsonl')):
+        return _read_ndjson_plan(path)
+    return _read_csv_plan(path)
+
+
+def _read_ndjson_plan(path):
+    with open(path, newline='') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {'error': f'Invalid JSON: {e}'}
+            if not isinstance(row, dict):
+                row = {'error': 'Expected a JSON object'}
+            row['line'] = line_no
+            yield row
+
+
+def _read_csv_plan(path):
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        current = None
+        for record in reader:
+            key = (record.get('driver_id'), record.get('date'), record.get('time'))
+            if current is None or key != current['key']:
+                if current is not None:
+                    yield current['row']
+                current = {
+                    'key': key,
+                    'row': {'line': reader.line_num, 'driver_id': key[0], 'date': key[1],
+                            'time': key[2], 'streets': []},
+                }
+            if record.get('street_name'):
+                current['row']['streets'].append((record['street_name'], record.get('street_location') or ''))
+        if current is not None:
+            yield current['row']
+
+
+def _prepare_route_row(row):
+    if 'error' in row:
+        raise ValueError(row['error'])
+    streets = []
+    for street_info in row.get('streets') or []:
+        if isinstance(street_info, dict):
+            name, location = street_info['name'], street_info['location']
+        else:
+            name, location = street_info[0], street_info[1]
+        if not name or not location:
+            raise ValueError('Street name and location are required')
+        streets.append({'streetName': name, 'streetLocation': location})
+    return {
+        'driverID': int(row['driver_id']),
+        'driveDate': _parse_date(row['date']),
+        'driveTime': _parse_time(row['time']),
+        'status': row.get('status') or 'scheduled',
+        'streets': streets,
+    }
+
+
+def _drop_unknown_drivers(prepared, summary):
+    driver_ids = {route['driverID'] for _, route in prepared}
+    known = set(db.session.scalars(
+        db.select(Driver.userID).filter(Driver.userID.in_(driver_ids))
+    ).all())
+    valid = []
+    for line, route in prepared:
+        if route['driverID'] in known:
+            valid.append((line, route))
+        else:
+            summary['failed'].append({'row': line, 'error': f"Driver {route['driverID']} not found"})
+    return valid
+
+
+def _insert_routes(routes):
+    route_ids = db.session.scalars(
+        insert(Route).returning(Route.routeID, sort_by_parameter_order=True),
+        [{key: route[key] for key in ('driverID', 'driveDate', 'driveTime', 'status')} for route in routes]
+    ).all()
+    street_rows = []
+    for route_id, route in zip(route_ids, routes):
+        for street in route['streets']:
+            street_rows.append(dict(street, routeID=route_id))
+    if street_rows:
+        db.session.execute(insert(Street), street_rows)
+    record_new_routes([
+        dict({key: route[key] for key in ('driverID', 'driveDate', 'driveTime', 'status')},
+             routeID=route_id, streetCount=len(route['streets']))
+        for route_id, route in zip(route_ids, routes)
+    ])
+    return route_ids
+
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _parse_time(value):
+    if isinstance(value, time):
+        return value
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def _describe_error(e):
+    if isinstance(e, KeyError):
+        return f'Missing field {e}'
+    return str(e)
@@ -0,0 +1,151 @@
+import heapq, math, threading
+from time import monotonic
+
+from App.models import Driver
+from App.database import db
+from .location import on_location_change
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class DriverGridIndex:
+    """
+    Uniform lat/lng grid over driver positions. Each driver sits in exactly
+    one cell, so a radius query only measures drivers in the handful of cells
+    that overlap the search circle instead of every driver in the table.
+    The index is filled from the drivers table on first use, kept current by
+    every location write in this worker and reloaded every refresh_seconds
+    to pick up writes made by other workers.
+    """
+
+    def __init__(self, cell_degrees=0.01, refresh_seconds=30):
+        self.cell_degrees = cell_degrees
+        self.refresh_seconds = refresh_seconds
+        self._cells = {}
+        self._positions = {}
+        self._lock = threading.RLock()
+        self._loaded_at = None
+
+    def init_app(self, app):
+        self.cell_degrees = app.config['SPATIAL_INDEX_CELL_DEGREES']
+        self.refresh_seconds = app.config['SPATIAL_INDEX_REFRESH_SECONDS']
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._cells = {}
+            self._positions = {}
+            self._loaded_at = None
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees)))
+
+    def update(self, driver_id, lat, lng):
+        """Move a driver to a new position, or drop it when lat/lng is None."""
+        with self._lock:
+            previous = self._positions.pop(driver_id, None)
+            if previous is not None:
+                cell = self._cells.get(previous[2])
+                if cell is not None:
+                    cell.discard(driver_id)
+                    if not cell:
+                        del self._cells[previous[2]]
+            if lat is None or lng is None:
+                return
+            key = self._cell(lat, lng)
+            self._positions[driver_id] = (lat, lng, key, monotonic())
+            self._cells.setdefault(key, set()).add(driver_id)
+
+    def load(self):
+        """Rebuild the grid from the drivers table in one query."""
+        started = monotonic()
+        rows = db.session.execute(
+            db.select(Driver.userID, Driver.currentLat, Driver.currentLng)
+            .filter(Driver.currentLat.isnot(None), Driver.currentLng.isnot(None))
+        ).all()
+        with self._lock:
+            since = self._loaded_at
+            # Writes seen by this worker since the last load are newer than the table
+            local = {
+                driver_id: position for driver_id, position in self._positions.items()
+                if since is not None and position[3] >= since
+            }
+            self._cells = {}
+            self._positions = {}
+            for driver_id, lat, lng in rows:
+                if driver_id not in local:
+                    self.update(driver_id, lat, lng)
+            for driver_id, position in local.items():
+                self.update(driver_id, position[0], position[1])
+            self._loaded_at = started
+
+    def nearest(self, lat, lng, radius_km, k):
+        """Return up to k (distance_km, driver_id, lat, lng) tuples within radius_km."""
+        self._ensure_fresh()
+        lat_span = radius_km / KM_PER_DEGREE
+        lng_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        low = self._cell(lat - lat_span, lng - lng_span)
+        high = self._cell(lat + lat_span, lng + lng_span)
+        with self._lock:
+            cell_count = (high[0] - low[0] + 1) * (high[1] - low[1] + 1)
+            if cell_count > len(self._cells):
+                candidates = self._positions.keys()
+            else:
+                candidates = []
+                for x in range(low[0], high[0] + 1):
+                    for y in range(low[1], high[1] + 1):
+                        candidates.extend(self._cells.get((x, y), ()))
+            matches = []
+            for driver_id in candidates:
+                d_lat, d_lng = self._positions[driver_id][:2]
+                distance = haversine_km(lat, lng, d_lat, d_lng)
+                if distance <= radius_km:
+                    matches.append((distance, driver_id, d_lat, d_lng))
+        return heapq.nsmallest(k, matches)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or monotonic() - loaded_at > self.refresh_seconds:
+            self.load()
+
+
+driver_index = DriverGridIndex()
+
+
+def setup_spatial_index(app):
+    driver_index.init_app(app)
+    return driver_index
+
+
+@on_location_change
+def _index_driver_location(driver_userID, lat, lng, recorded_at):
+    # Keep the nearest-driver index in step with every location write
+    driver_index.update(driver_userID, lat, lng)
+
+
+def nearest_drivers(lat, lng, radius=5.0, k=10):
+    """
+    Resident operation: find the closest vans to a point.
+    Returns up to k drivers within radius kilometres, nearest first.
+    """
+    return [
+        {
+            'userID': driver_id,
+            'latitude': d_lat,
+            'longitude': d_lng,
+            'distanceKm': round(distance, 3)
+        }
+        for distance, driver_id, d_lat, d_lng in driver_index.nearest(lat, lng, radius, k)
+    ]
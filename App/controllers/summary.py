@@ -0,0 +1,163 @@
+from datetime import date
+
+from sqlalchemy import case, delete, func, insert, update
+
+from App.models import Route, Street, Stop, RouteSummary, ArchivedRoute
+from App.database import db, read_only
+from App.jobs import job
+
+
+STOP_COUNT_COLUMNS = {
+    'requested': 'requestedStops',
+    'confirmed': 'confirmedStops',
+    'completed': 'completedStops',
+    'cancelled': 'cancelledStops',
+}
+
+_summaries = RouteSummary.__table__
+
+
+def record_new_route(route, street_count=0):
+    """Add the summary row for a route created in the current transaction"""
+    db.session.execute(insert(_summaries).values(
+        routeID=route.routeID, driverID=route.driverID, driveDate=route.driveDate,
+        driveTime=route.driveTime, status=route.status, streetCount=street_count,
+        requestedStops=0, confirmedStops=0, completedStops=0, cancelledStops=0
+    ))
+
+
+def record_new_routes(rows):
+    """Bulk form of record_new_route for rows of route columns plus streetCount"""
+    if rows:
+        db.session.execute(insert(_summaries), [
+            dict(row, requestedStops=0, confirmedStops=0, completedStops=0, cancelledStops=0)
+            for row in rows
+        ])
+
+
+def adjust_route_summary(route_id=None, street_id=None, streets=0, stops=None):
+    """
+    Apply count deltas to a route's summary row inside the current
+    transaction. The route is given directly or through one of its streets.
+    stops maps stop statuses to deltas, e.g. {'requested': -1, 'cancelled': 1}.
+    Each column is incremented in SQL so concurrent writers never lose counts.
+    """
+    values = {}
+    if streets:
+        values['streetCount'] = _summaries.c.streetCount + streets
+    for status, delta in (stops or {}).items():
+        column = STOP_COUNT_COLUMNS.get(status)
+        if column and delta:
+            values[column] = _summaries.c[column] + delta
+    if not values:
+        return
+    target = route_id
+    if target is None:
+        target = db.select(Street.routeID).filter(Street.streetID == street_id).scalar_subquery()
+    result = db.session.execute(update(_summaries).where(_summaries.c.routeID == target).values(**values))
+    if result.rowcount == 0:
+        # No summary yet (e.g. the route predates the table): compute it whole
+        if route_id is None:
+            route_id = db.session.scalar(db.select(Street.routeID).filter(Street.streetID == street_id))
+        if route_id is not None:
+            _insert_summaries([route_id])
+
+
+def sync_route_summary(route):
+    """Copy a route's own columns onto its summary row after an update"""
+    result = db.session.execute(update(_summaries).where(_summaries.c.routeID == route.routeID).values(
+        driverID=route.driverID, driveDate=route.driveDate, driveTime=route.driveTime, status=route.status
+    ))
+    if result.rowcount == 0:
+        _insert_summaries([route.routeID])
+
+
+def rebuild_route_summaries(start_date=None, end_date=None):
+    """
+    Recompute summary rows from routes, streets and stops, for every route or
+    only those driven between start_date and end_date. Returns the number of
+    routes summarised, or None when the rebuild failed.
+    """
+    try:
+        routes = db.select(Route.routeID)
+        if start_date:
+            routes = routes.filter(Route.driveDate >= start_date)
+        if end_date:
+            routes = routes.filter(Route.driveDate <= end_date)
+        route_ids = db.session.scalars(routes).all()
+        db.session.execute(delete(_summaries).where(_summaries.c.routeID.in_(routes.scalar_subquery())))
+        # Summaries whose route was deleted; archived routes keep theirs
+        db.session.execute(delete(_summaries).where(
+            ~_summaries.c.routeID.in_(db.select(Route.routeID)),
+            ~_summaries.c.routeID.in_(db.select(ArchivedRoute.routeID))
+        ))
+        for start in range(0, len(route_ids), 500):
+            _insert_summaries(route_ids[start:start + 500])
+        db.session.commit()
+        return len(route_ids)
+    except Exception as e:
+        db.session.rollback()
+        return None
+
+
+@job('route_summaries.rebuild')
+def rebuild_route_summaries_job(start_date=None, end_date=None):
+    """Background form of rebuild_route_summaries; dates are ISO strings"""
+    count = rebuild_route_summaries(
+        date.fromisoformat(start_date) if start_date else None,
+        date.fromisoformat(end_date) if end_date else None
+    )
+    if count is None:
+        raise RuntimeError('Route summary rebuild failed')
+    return count
+
+
+@read_only
+def get_daily_summary(drive_date):
+    """
+    Driver operation: today's runs.
+    Returns every route driven on drive_date with its street and stop counts,
+    plus totals by route status and stop status, from one indexed lookup.
+    """
+    try:
+        summaries = db.session.scalars(
+            db.select(RouteSummary).filter(RouteSummary.driveDate == drive_date)
+            .order_by(RouteSummary.driveTime, RouteSummary.routeID)
+        ).all()
+    except Exception as e:
+        return None
+    routes = [summary.get_json() for summary in summaries]
+    totals = {'routes': len(routes), 'byStatus': {}, 'streets': 0, 'stops': dict.fromkeys(STOP_COUNT_COLUMNS, 0)}
+    for route in routes:
+        totals['byStatus'][route['status']] = totals['byStatus'].get(route['status'], 0) + 1
+        totals['streets'] += route['streets']
+        for status, count in route['stops'].items():
+            totals['stops'][status] += count
+    return {'driveDate': drive_date.isoformat(), 'routes': routes, 'totals': totals}
+
+
+def _insert_summaries(route_ids):
+    street_counts = (
+        db.select(Street.routeID, func.count().label('streets'))
+        .filter(Street.routeID.in_(route_ids)).group_by(Street.routeID).subquery()
+    )
+    stop_counts = (
+        db.select(Street.routeID, *[
+            func.sum(case((Stop.stopStatus == status, 1), else_=0)).label(status)
+            for status in STOP_COUNT_COLUMNS
+        ])
+        .join(Stop, Stop.streetID == Street.streetID)
+        .filter(Street.routeID.in_(route_ids)).group_by(Street.routeID).subquery()
+    )
+    source = (
+        db.select(
+            Route.routeID, Route.driverID, Route.driveDate, Route.driveTime, Route.status,
+            func.coalesce(street_counts.c.streets, 0),
+            *[func.coalesce(stop_counts.c[status], 0) for status in STOP_COUNT_COLUMNS]
+        )
+        .outerjoin(street_counts, street_counts.c.routeID == Route.routeID)
+        .outerjoin(stop_counts, stop_counts.c.routeID == Route.routeID)
+        .filter(Route.routeID.in_(route_ids))
+    )
+    columns = ['routeID', 'driverID', 'driveDate', 'driveTime', 'status', 'streetCount'] + list(STOP_COUNT_COLUMNS.values())
+    db.session.execute(insert(_summaries).from_select(columns, source))
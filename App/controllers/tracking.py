@@ -0,0 +1,129 @@
+import json, queue, threading
+from time import time as wall_clock
+
+from .location import on_location_change
+
+
+class Subscription:
+    """One subscriber's mailbox of ready-to-send Server-Sent Event frames."""
+
+    def __init__(self, hub, channels, maxsize):
+        self.hub = hub
+        self.channels = channels
+        self._frames = queue.Queue(maxsize)
+
+    def offer(self, frame):
+        # A slow client loses its oldest frames rather than holding up publishers
+        while True:
+            try:
+                self._frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._frames.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def next_frame(self, timeout):
+        """Wait for the next frame; None when the timeout passes first."""
+        try:
+            return self._frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class TrackingHub:
+    """
+    In-process publish/subscribe hub for live driver updates.
+    Each published event is serialised to an SSE frame once and the same
+    bytes are handed to every subscriber of that driver. It only uses
+    threading and queue primitives, which gevent's monkey patching turns
+    into cooperative ones, so waiting subscribers never block the worker.
+    Subscribers only see updates published in their own worker process.
+    """
+
+    def __init__(self, queue_size=32):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0}
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, tuple(channels), self.queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+            self._stats['published'] += 1
+            self._stats['delivered'] += len(subscribers)
+        if not subscribers:
+            return 0
+        frame = format_sse(event, data)
+        for subscription in subscribers:
+            subscription.offer(frame)
+        return len(subscribers)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['channels'] = len(self._channels)
+            stats['subscriptions'] = len({s for subs in self._channels.values() for s in subs})
+        return stats
+
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+tracking_hub = TrackingHub()
+
+
+def setup_tracking_hub(app):
+    tracking_hub.queue_size = app.config['TRACKING_QUEUE_SIZE']
+    return tracking_hub
+
+
+def publish_driver_location(driver_userID, lat, lng, recorded_at=None):
+    """Push a driver's new position to residents tracking that driver"""
+    return tracking_hub.publish(driver_userID, 'location', {
+        'driverID': driver_userID,
+        'latitude': lat,
+        'longitude': lng,
+        'timestamp': recorded_at if recorded_at is not None else wall_clock()
+    })
+
+
+@on_location_change
+def _publish_location_change(driver_userID, lat, lng, recorded_at):
+    if lat is not None and lng is not None:
+        publish_driver_location(driver_userID, lat, lng, recorded_at)
+
+
+def publish_route_update(route):
+    """Push a route change to residents tracking the route's driver"""
+    return tracking_hub.publish(route.driverID, 'route', route.get_json())
+
+
+def subscribe_to_drivers(driver_ids):
+    """Open a subscription to live updates for the given drivers"""
+    return tracking_hub.subscribe(driver_ids)
+
+
+def get_tracking_hub_stats():
+    return tracking_hub.get_stats()
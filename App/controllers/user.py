@@ -1,12 +1,22 @@
-from App.models import Driver, Resident
-from App.database import db
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached, with_polymorphic
+from sqlalchemy.orm.attributes import set_committed_value
+
+from App.models import User, Driver, Resident
+from App.database import db, read_only
+from App.cache import TTLCache
+from App.response_cache import bump_versions
+from .location import location_changed
 
 # Driver functions
 def create_driver(userName, password, driverRoute=None, currentLng=None, currentLat=None):
     new_driver = Driver(userName=userName, password=password, driverRoute=driverRoute, 
                        currentLng=currentLng, currentLat=currentLat)
     db.session.add(new_driver)
+    bump_versions('drivers')
     db.session.commit()
+    if currentLat is not None and currentLng is not None:
+        location_changed(new_driver.userID, currentLat, currentLng)
     return new_driver
 
 def get_driver_by_username(userName):
@@ -16,6 +26,7 @@ def get_driver_by_username(userName):
 def get_driver(userID):
     return db.session.get(Driver, userID)
 
+@read_only
 def get_all_drivers():
     return db.session.scalars(db.select(Driver)).all()
 
@@ -36,7 +47,11 @@ def update_driver(userID, userName=None, driverRoute=None, currentLng=None, curr
             driver.currentLng = currentLng
         if currentLat is not None:
             driver.currentLat = currentLat
+        bump_versions('drivers')
         db.session.commit()
+        if currentLng is not None or currentLat is not None:
+            location_changed(userID, driver.currentLat, driver.currentLng)
+        invalidate_user_identity(userID)
         return True
     return None
 
@@ -45,6 +60,7 @@ def create_resident(userName, password, residentName, residentAddress, residentP
     new_resident = Resident(userName=userName, password=password, residentName=residentName,
                            residentAddress=residentAddress, residentPhone=residentPhone)
     db.session.add(new_resident)
+    bump_versions('residents')
     db.session.commit()
     return new_resident
 
@@ -55,6 +71,7 @@ def get_resident_by_username(userName):
 def get_resident(userID):
     return db.session.get(Resident, userID)
 
+@read_only
 def get_all_residents():
     return db.session.scalars(db.select(Resident)).all()
 
@@ -75,43 +92,99 @@ def update_resident(userID, userName=None, residentName=None, residentAddress=No
             resident.residentAddress = residentAddress
         if residentPhone:
             resident.residentPhone = residentPhone
+        bump_versions('residents')
         db.session.commit()
+        invalidate_user_identity(userID)
         return True
     return None
 
 # Legacy functions for backward compatibility
+# Users are loaded through one polymorphic query that LEFT OUTER JOINs both
+# subclass tables, so a lookup never probes drivers and residents separately
+_any_user = with_polymorphic(User, [Driver, Resident])
+
 def create_user(username, password):
     # Default to creating a driver for backward compatibility
     return create_driver(username, password)
 
 def get_user_by_username(username):
-    # Try to find driver first, then resident
-    driver = get_driver_by_username(username)
-    if driver:
-        return driver
-    return get_resident_by_username(username)
+    result = db.session.execute(db.select(_any_user).filter(_any_user.userName == username))
+    return result.scalar_one_or_none()
 
 def get_user(id):
-    # Try to find driver first, then resident
-    driver = get_driver(id)
-    if driver:
-        return driver
-    return get_resident(id)
+    result = db.session.execute(db.select(_any_user).filter(_any_user.userID == id))
+    return result.scalar_one_or_none()
 
-def get_all_users():
-    # Return all drivers and residents
-    drivers = get_all_drivers()
-    residents = get_all_residents()
-    return drivers + residents
+def _users_query(after_id=None, limit=None):
+    # Keyset pagination: pass the last userID seen to get the next page
+    query = db.select(_any_user).order_by(_any_user.userID)
+    if after_id:
+        query = query.filter(_any_user.userID > after_id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def get_all_users(after_id=None, limit=None):
+    return db.session.scalars(_users_query(after_id, limit)).all()
 
-def get_all_users_json():
-    users = get_all_users()
+def get_all_users_json(after_id=None, limit=None):
+    users = get_all_users(after_id, limit)
     if not users:
         return []
     return [user.get_json() for user in users]
 
+def iter_users_json(after_id=None, limit=None, batch_size=500):
+    # Rows come off a server-side cursor batch_size at a time, so memory
+    # stays flat however many users there are
+    query = _users_query(after_id, limit).execution_options(yield_per=batch_size)
+    for user in db.session.scalars(query):
+        yield user.get_json()
+
 def update_user(id, username):
-    # Try updating as driver first, then resident
-    if update_driver(id, userName=username):
+    user = get_user(id)
+    if user:
+        if username:
+            user.userName = username
+        bump_versions('drivers' if isinstance(user, Driver) else 'residents')
+        db.session.commit()
+        invalidate_user_identity(id)
         return True
-    return update_resident(id, userName=username)
+    return None
+
+# Identity cache for authenticated requests
+# Entries are column snapshots rather than ORM objects so they never outlive
+# the session that loaded them; a hit is merged into the current session
+# without a query. Other workers only see a change once their entry expires.
+# Location pings are deliberately not invalidated, so currentLat/currentLng
+# on a cached identity can lag; track_driver reads the live position.
+identity_cache = TTLCache()
+
+def setup_identity_cache(app):
+    identity_cache.configure(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'])
+    return identity_cache
+
+def get_user_identity(id):
+    snapshot = identity_cache.get(id)
+    if snapshot is not None:
+        return _restore_user(*snapshot)
+    user = get_user(id)
+    if user:
+        identity_cache.set(id, _snapshot_user(user))
+    return user
+
+def invalidate_user_identity(id):
+    identity_cache.invalidate(id)
+
+def get_identity_cache_stats():
+    return identity_cache.get_stats()
+
+def _snapshot_user(user):
+    columns = inspect(type(user)).column_attrs
+    return type(user), {attr.key: getattr(user, attr.key) for attr in columns}
+
+def _restore_user(user_class, values):
+    user = user_class.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
@@ -1,8 +1,72 @@
+from contextlib import contextmanager
+from functools import wraps
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """
+    Sends reads made inside replica_reads() to the replica bind when one is
+    configured, and everything else to the primary. Once the session has
+    written anything it stays on the primary until it is removed at the end
+    of the request, so a request always reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('replica_reads') and not self.info.get('wrote')
+                and not self._flushing):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements write without flushing
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@contextmanager
+def replica_reads():
+    """Route the current session's reads to the replica while inside the block"""
+    session = db.session()
+    previous = session.info.get('replica_reads', False)
+    session.info['replica_reads'] = True
+    try:
+        yield session
+    finally:
+        session.info['replica_reads'] = previous
+
+
+def read_only(fn):
+    """Mark a controller function as safe to serve from the replica"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def upsert(entity):
+    """INSERT for the primary's dialect, with on_conflict_do_nothing/do_update"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(entity)
 
 def get_migrate(app):
     return Migrate(app, db)
@@ -11,4 +75,31 @@ def create_db():
     db.create_all()
     
 def init_db(app):
-    db.init_app(app)
\ No newline at end of file
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                apply_sqlite_pragmas(engine, app.config)
+
+def sqlite_pragmas(config):
+    """PRAGMA statements run on every new SQLite connection; None skips one"""
+    settings = [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+    ]
+    return [f'PRAGMA {name}={value}' for name, value in settings if value is not None]
+
+def apply_sqlite_pragmas(engine, config):
+    # WAL lets readers carry on while a writer commits, and with it
+    # synchronous=NORMAL only syncs at checkpoints instead of every commit
+    pragmas = sqlite_pragmas(config)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    event.listen(engine, 'connect', on_connect)
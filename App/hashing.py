@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasher:
+    """
+    Runs password hashing on a bounded pool of native threads.
+    hashlib's scrypt and pbkdf2 release the GIL, so hashes run in parallel
+    and, under gevent workers, the hub keeps serving other greenlets while a
+    login is being checked. With workers=0 hashing runs inline.
+    """
+
+    def __init__(self, method='scrypt', workers=4):
+        self.method = method
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._method_prefix = None
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self._method_prefix = None
+        self._pool = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different method or cost."""
+        if self._method_prefix is None:
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        return self._get_pool().apply(fn, args)
+
+    def _get_pool(self):
+        # Created lazily so each forked worker gets its own threads
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = _make_pool(self.workers)
+        return self._pool
+
+
+class _ExecutorPool:
+
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def apply(self, fn, args):
+        return self._executor.submit(fn, *args).result()
+
+
+def _make_pool(workers):
+    try:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+    except ImportError:
+        return _ExecutorPool(workers)
+    if monkey.is_module_patched('threading'):
+        # Patched threads are greenlets; gevent's pool uses real OS threads
+        # and only blocks the calling greenlet while it waits
+        return ThreadPool(workers)
+    return _ExecutorPool(workers)
+
+
+password_hasher = PasswordHasher()
+
+
+def setup_password_hashing(app):
+    password_hasher.init_app(app)
+    return password_hasher
@@ -0,0 +1,259 @@
+import json, logging, multiprocessing, os, signal, socket, threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, update
+
+from App.database import db
+from App.models import Job
+
+
+logger = logging.getLogger(__name__)
+_jobs = Job.__table__
+_handlers = {}
+
+
+def job(name):
+    """Register fn as the handler for jobs called name; the payload is passed as keyword arguments"""
+    def decorator(fn):
+        _handlers[name] = fn
+        return fn
+    return decorator
+
+
+class JobQueue:
+    """
+    Durable queue of deferred work kept in the jobs table. Controllers call
+    enqueue inside their own transaction, so a job exists exactly when the
+    write that asked for it commits. Workers claim up to batch_size due jobs
+    in one UPDATE, giving each a lease of lease_seconds, run them one
+    transaction at a time and retry failures with exponential backoff
+    (retry_base_seconds doubling up to retry_max_seconds) until maxAttempts
+    is reached. A job's lease is renewed when its turn in the batch comes,
+    and its outcome is only recorded while the worker still holds it, so a
+    job another worker took over after the lease ran out is neither run
+    twice by this worker nor overwritten by it.
+    """
+
+    def __init__(self, batch_size=10, poll_interval=1.0, max_attempts=5,
+                 retry_base_seconds=5, retry_max_seconds=600, lease_seconds=300):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease_seconds = lease_seconds
+
+    def init_app(self, app):
+        self.batch_size = app.config['JOB_BATCH_SIZE']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+        self.retry_base_seconds = app.config['JOB_RETRY_BASE_SECONDS']
+        self.retry_max_seconds = app.config['JOB_RETRY_MAX_SECONDS']
+        self.lease_seconds = app.config['JOB_LEASE_SECONDS']
+
+    def enqueue(self, name, payload=None, delay=0, max_attempts=None):
+        """Add a job to the current session; workers see it once the caller commits."""
+        if name not in _handlers:
+            raise ValueError(f'Unknown job {name}')
+        now = datetime.now()
+        new_job = Job(name=name, payload=json.dumps(payload or {}), status='queued', attempts=0,
+                      maxAttempts=max_attempts or self.max_attempts,
+                      runAt=now + timedelta(seconds=delay), createdAt=now)
+        db.session.add(new_job)
+        return new_job
+
+    def claim(self, worker_id, limit=None):
+        """Lease up to limit due jobs to worker_id and return their rows"""
+        now = datetime.now()
+        due = or_(
+            and_(_jobs.c.status == 'queued', _jobs.c.runAt <= now),
+            and_(_jobs.c.status == 'running', _jobs.c.lockedUntil < now)
+        )
+        candidates = (
+            db.select(_jobs.c.jobID).where(due)
+            .order_by(_jobs.c.runAt, _jobs.c.jobID).limit(limit or self.batch_size)
+        )
+        if db.engine.dialect.name == 'postgresql':
+            # Concurrent workers skip each other's candidates instead of queueing on them
+            candidates = candidates.with_for_update(skip_locked=True)
+        rows = db.session.execute(
+            update(_jobs).where(_jobs.c.jobID.in_(candidates), due)
+            .values(status='running', attempts=_jobs.c.attempts + 1, lockedBy=worker_id,
+                    lockedUntil=now + timedelta(seconds=self.lease_seconds))
+            .returning(_jobs.c.jobID, _jobs.c.name, _jobs.c.payload, _jobs.c.attempts, _jobs.c.maxAttempts)
+        ).all()
+        db.session.commit()
+        return sorted(rows, key=lambda row: row.jobID)
+
+    def renew(self, job_id, worker_id):
+        """Restart the lease on a job this worker holds. Returns False when the job is no longer ours."""
+        result = db.session.execute(
+            update(_jobs).where(_owned(job_id, worker_id))
+            .values(lockedUntil=datetime.now() + timedelta(seconds=self.lease_seconds))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def run_job(self, row, worker_id):
+        """
+        Run one claimed job and record the outcome. Returns True when it
+        succeeded, False when it failed or its lease had passed to another worker.
+        """
+        if not self.renew(row.jobID, worker_id):
+            logger.warning('Job %s (%s) lease expired before it started; left to its new owner', row.jobID, row.name)
+            return False
+        try:
+            value = _handlers[row.name](**json.loads(row.payload))
+            result = db.session.execute(update(_jobs).where(_owned(row.jobID, worker_id)).values(
+                status='done', lockedBy=None, lockedUntil=None, lastError=None, result=_encode_result(value),
+                finishedAt=datetime.now()
+            ))
+            if result.rowcount != 1:
+                db.session.rollback()
+                logger.warning('Job %s (%s) lease expired while it ran; its result was discarded', row.jobID, row.name)
+                return False
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            error = f'{type(e).__name__}: {e}'[:2000]
+            now = datetime.now()
+            if row.attempts >= row.maxAttempts:
+                logger.warning('Job %s (%s) failed permanently after %s attempts: %s',
+                               row.jobID, row.name, row.attempts, error)
+                values = {'status': 'failed', 'finishedAt': now}
+            else:
+                logger.info('Job %s (%s) failed, retrying: %s', row.jobID, row.name, error)
+                values = {'status': 'queued', 'runAt': now + timedelta(seconds=self.backoff(row.attempts))}
+            db.session.execute(update(_jobs).where(_owned(row.jobID, worker_id)).values(
+                lockedBy=None, lockedUntil=None, lastError=error, **values
+            ))
+            db.session.commit()
+            return False
+
+    def backoff(self, attempts):
+        return min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempts - 1))
+
+    def run_batch(self, worker_id):
+        """Claim one batch and run it. Returns the number of jobs run."""
+        rows = self.claim(worker_id)
+        for row in rows:
+            self.run_job(row, worker_id)
+        db.session.remove()
+        return len(rows)
+
+    def work(self, worker_id=None, burst=False, stop=None):
+        """
+        Run batches until stop is set, sleeping poll_interval whenever the
+        queue is empty. With burst=True return as soon as it is empty.
+        Returns the number of jobs run.
+        """
+        worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        stop = stop or threading.Event()
+        processed = 0
+        while not stop.is_set():
+            count = self.run_batch(worker_id)
+            processed += count
+            if count == 0:
+                if burst:
+                    break
+                stop.wait(self.poll_interval)
+        return processed
+
+    def purge(self, older_than_seconds):
+        """Delete jobs that finished successfully more than older_than_seconds ago"""
+        cutoff = datetime.now() - timedelta(seconds=older_than_seconds)
+        result = db.session.execute(delete(_jobs).where(_jobs.c.status == 'done', _jobs.c.finishedAt < cutoff))
+        db.session.commit()
+        return result.rowcount
+
+    def get_stats(self):
+        counts = dict(db.session.execute(
+            db.select(_jobs.c.status, func.count()).group_by(_jobs.c.status)
+        ).all())
+        oldest = db.session.scalar(db.select(func.min(_jobs.c.runAt)).where(_jobs.c.status == 'queued'))
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'oldestQueued': oldest.isoformat() if oldest else None,
+            'handlers': sorted(_handlers)
+        }
+
+
+def _encode_result(value):
+    # Kept for whoever reads the job later, e.g. stats served by the web workers
+    try:
+        return json.dumps(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _owned(job_id, worker_id):
+    return and_(_jobs.c.jobID == job_id, _jobs.c.status == 'running', _jobs.c.lockedBy == worker_id)
+
+
+job_queue = JobQueue()
+
+
+def setup_jobs(app):
+    job_queue.init_app(app)
+    return job_queue
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    return job_queue.enqueue(name, payload, delay, max_attempts)
+
+
+def run_workers(processes=1, burst=False):
+    """
+    Run the worker loop here, or in `processes` forked children. SIGTERM
+    lets every worker finish the job in hand before exiting. Returns the
+    number of jobs run.
+    """
+    if processes <= 1:
+        return _work_until_terminated(burst)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    children = [context.Process(target=_child, args=(burst, results)) for _ in range(processes)]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    previous = signal.signal(signal.SIGTERM, forward)
+    try:
+        processed = 0
+        for child in children:
+            child.join()
+        while not results.empty():
+            processed += results.get()
+        return processed
+    except KeyboardInterrupt:
+        forward(None, None)
+        for child in children:
+            child.join()
+        return None
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+def _child(burst, results):
+    # Connections inherited from the parent must not be shared with it
+    db.engine.dispose(close=False)
+    results.put(_work_until_terminated(burst) or 0)
+
+
+def _work_until_terminated(burst):
+    stop = threading.Event()
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        return job_queue.work(burst=burst, stop=stop)
+    except KeyboardInterrupt:
+        return None
+    finally:
+        signal.signal(signal.SIGTERM, previous)
@@ -1,17 +1,27 @@
 import os
 from flask import Flask, render_template
-from flask_uploads import DOCUMENTS, IMAGES, TEXT, UploadSet, configure_uploads
-from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import  FileStorage
 
 from App.database import init_db
+from App.hashing import setup_password_hashing
+from App.metrics import setup_query_stats
+from App.response_cache import setup_response_cache
+from App.jobs import setup_jobs
 from App.config import load_config
 
 
 from App.controllers import (
     setup_jwt,
-    add_auth_context
+    add_auth_context,
+    setup_location_buffer,
+    setup_spatial_index,
+    setup_identity_cache,
+    setup_tracking_hub,
+    setup_eta,
+    setup_notifications,
+    setup_location_history,
+    setup_archive
 )
 
 from App.views import views, setup_admin
@@ -22,17 +32,40 @@ def add_views(app):
     for view in views:
         app.register_blueprint(view)
 
-def create_app(overrides={}):
-    app = Flask(__name__, static_url_path='/static')
-    load_config(app, overrides)
-    CORS(app)
-    add_auth_context(app)
+def setup_uploads(app):
+    from flask_uploads import DOCUMENTS, IMAGES, TEXT, UploadSet, configure_uploads
     photos = UploadSet('photos', TEXT + DOCUMENTS + IMAGES)
     configure_uploads(app, photos)
+
+def setup_web(app):
+    # Only needed to serve requests; CLI commands skip it (web=False)
+    from flask_cors import CORS
+    CORS(app)
+    add_auth_context(app)
+    setup_uploads(app)
     add_views(app)
+
+def create_app(overrides={}, web=True):
+    app = Flask(__name__, static_url_path='/static')
+    load_config(app, overrides)
+    if web:
+        setup_web(app)
     init_db(app)
+    setup_query_stats(app)
+    setup_password_hashing(app)
     jwt = setup_jwt(app)
-    setup_admin(app)
+    setup_location_buffer(app)
+    setup_spatial_index(app)
+    setup_identity_cache(app)
+    setup_response_cache(app)
+    setup_jobs(app)
+    setup_tracking_hub(app)
+    setup_eta(app)
+    setup_location_history(app)
+    setup_notifications(app)
+    setup_archive(app)
+    if web:
+        setup_admin(app)
     @jwt.invalid_token_loader
     @jwt.unauthorized_loader
     def custom_unauthorized_response(error):
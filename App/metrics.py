@@ -0,0 +1,227 @@
+import bisect, logging, threading
+from contextvars import ContextVar
+from time import perf_counter
+
+import click
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_current_scope = ContextVar('query_scope', default=None)
+
+
+class QueryScope:
+    """Statements run while serving one request or one CLI command."""
+
+    __slots__ = ('name', 'budgeted', 'statements', 'seconds', 'slowest_seconds', 'slowest_statement')
+
+    def __init__(self, name, budgeted=True):
+        self.name = name
+        self.budgeted = budgeted
+        self.statements = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+
+    def add(self, statement, seconds):
+        self.statements += 1
+        self.seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.seconds = Histogram(SECONDS_BUCKETS)
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.over_budget = 0
+
+
+class QueryStats:
+    """
+    Counts the SQL statements and database time spent on each request and
+    CLI command through engine events. Totals are kept per endpoint as
+    histograms, rendered in the Prometheus text format, and a warning is
+    logged for any request over the statement or time budget. Figures are
+    per worker process, like the other in-memory stats.
+    """
+
+    def __init__(self, statement_budget=20, time_budget_ms=250, enabled=True):
+        self.statement_budget = statement_budget
+        self.time_budget_ms = time_budget_ms
+        self.enabled = enabled
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.statement_budget = app.config['QUERY_BUDGET_STATEMENTS']
+        self.time_budget_ms = app.config['QUERY_BUDGET_MS']
+        self.enabled = app.config['QUERY_STATS_ENABLED']
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(_begin_request)
+        app.teardown_request(_end_request)
+
+    def begin(self, name, budgeted=True):
+        scope = QueryScope(name, budgeted) if self.enabled else None
+        _current_scope.set(scope)
+        return scope
+
+    def end(self):
+        scope = _current_scope.get()
+        _current_scope.set(None)
+        if scope is not None:
+            self.record(scope)
+        return scope
+
+    def current(self):
+        scope = _current_scope.get()
+        if scope is None and self.enabled:
+            # CLI commands have no request hooks; open a scope on their first
+            # statement. Commands are batch jobs, so the request budget does not apply
+            ctx = click.get_current_context(silent=True)
+            if ctx is not None:
+                scope = self.begin(f'cli:{ctx.command_path}', budgeted=False)
+                ctx.call_on_close(self.end)
+        return scope
+
+    def record(self, scope):
+        with self._lock:
+            stats = self._endpoints.get(scope.name)
+            if stats is None:
+                stats = self._endpoints[scope.name] = EndpointStats()
+            stats.statements.observe(scope.statements)
+            stats.seconds.observe(scope.seconds)
+            if scope.slowest_seconds >= stats.slowest_seconds:
+                stats.slowest_seconds = scope.slowest_seconds
+                stats.slowest_statement = scope.slowest_statement
+            over_budget = scope.budgeted and (scope.statements > self.statement_budget
+                                              or scope.seconds * 1000 > self.time_budget_ms)
+            if over_budget:
+                stats.over_budget += 1
+        if over_budget:
+            logger.warning(
+                'Query budget exceeded by %s: %d statements, %.1f ms in the database '
+                '(budget %d statements, %d ms); slowest %.1f ms: %s',
+                scope.name, scope.statements, scope.seconds * 1000, self.statement_budget,
+                self.time_budget_ms, scope.slowest_seconds * 1000, _shorten(scope.slowest_statement)
+            )
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'count': stats.statements.count,
+                    'statements': stats.statements.sum,
+                    'dbMs': round(stats.seconds.sum * 1000, 3),
+                    'slowestMs': round(stats.slowest_seconds * 1000, 3),
+                    'slowestStatement': _shorten(stats.slowest_statement),
+                    'overBudget': stats.over_budget
+                }
+                for name, stats in self._endpoints.items()
+            }
+
+    def render_prometheus(self):
+        lines = [
+            '# HELP db_statements_per_request SQL statements run per request or CLI command.',
+            '# TYPE db_statements_per_request histogram',
+        ]
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            for name, stats in endpoints:
+                lines.extend(_histogram_lines('db_statements_per_request', name, stats.statements))
+            lines.append('# HELP db_seconds_per_request Database time per request or CLI command.')
+            lines.append('# TYPE db_seconds_per_request histogram')
+            for name, stats in endpoints:
+                lines.extend(_histogram_lines('db_seconds_per_request', name, stats.seconds))
+            lines.append('# HELP db_slowest_statement_seconds Slowest single statement seen per endpoint.')
+            lines.append('# TYPE db_slowest_statement_seconds gauge')
+            for name, stats in endpoints:
+                lines.append(f'db_slowest_statement_seconds{{endpoint="{_label(name)}"}} {stats.slowest_seconds!r}')
+            lines.append('# HELP db_query_budget_exceeded_total Requests over the query budget.')
+            lines.append('# TYPE db_query_budget_exceeded_total counter')
+            for name, stats in endpoints:
+                lines.append(f'db_query_budget_exceeded_total{{endpoint="{_label(name)}"}} {stats.over_budget}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, name, histogram):
+    endpoint = _label(name)
+    for bound, total in histogram.cumulative():
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        yield f'{metric}_bucket{{endpoint="{endpoint}",le="{le}"}} {total}'
+    yield f'{metric}_sum{{endpoint="{endpoint}"}} {histogram.sum!r}'
+    yield f'{metric}_count{{endpoint="{endpoint}"}} {histogram.count}'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _shorten(statement, limit=300):
+    if statement is None:
+        return None
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+query_stats = QueryStats()
+
+
+def setup_query_stats(app):
+    query_stats.init_app(app)
+    return query_stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    scope = query_stats.current()
+    if scope is not None and started is not None:
+        scope.add(statement, perf_counter() - started)
+
+
+def _begin_request():
+    query_stats.begin(f'{request.method} {request.endpoint or "unmatched"}')
+
+
+def _end_request(error=None):
+    query_stats.end()
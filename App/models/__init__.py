@@ -1 +1,2 @@
-from .user import User, Driver, Resident, Route, Street, Stop
\ No newline at end of file
+from .user import User, Driver, Resident, Route, Street, Stop, RouteSummary, EntityVersion, Job, LocationSegment, \
+    ArchivedRoute, ArchivedStreet, ArchivedStop, ArchivedLocationSegment
@@ -1,5 +1,6 @@
-from werkzeug.security import check_password_hash, generate_password_hash
 from App.database import db
+from App.hashing import password_hasher
+import json
 from datetime import datetime, date, time
 
 class User(db.Model):
@@ -27,11 +28,15 @@ class User(db.Model):
 
     def set_password(self, password):
         """Create hashed password."""
-        self.password = generate_password_hash(password)
+        self.password = password_hasher.hash(password)
     
     def check_password(self, password):
         """Check hashed password."""
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
+
+    def password_needs_rehash(self):
+        """Check whether the stored hash uses an outdated method or cost."""
+        return password_hasher.needs_rehash(self.password)
     
     # Legacy properties for backward compatibility
     @property
@@ -51,7 +56,7 @@ class Driver(User):
     currentLat = db.Column(db.Float, nullable=True)
     
     # Relationships
-    routes = db.relationship('Route', backref='driver', lazy=True)
+    routes = db.relationship('Route', back_populates='driver', lazy=True)
     
     __mapper_args__ = {
         'polymorphic_identity': 'driver'
@@ -81,7 +86,7 @@ class Resident(User):
     residentPhone = db.Column(db.BigInteger, nullable=False)
     
     # Relationships
-    stops = db.relationship('Stop', backref='resident', lazy=True)
+    stops = db.relationship('Stop', back_populates='resident', lazy=True)
     
     __mapper_args__ = {
         'polymorphic_identity': 'resident'
@@ -110,9 +115,17 @@ class Route(db.Model):
     driveDate = db.Column(db.Date, nullable=False)
     driveTime = db.Column(db.Time, nullable=False)
     status = db.Column(db.String(50), nullable=False, default='scheduled')
+
+    __table_args__ = (
+        db.Index('ix_routes_driverID_driveDate', 'driverID', 'driveDate'),
+        db.Index('ix_routes_status_driveDate', 'status', 'driveDate'),
+        # Never hand out the ID of an archived route again
+        {'sqlite_autoincrement': True},
+    )
     
     # Relationships
-    streets = db.relationship('Street', backref='route', lazy=True)
+    driver = db.relationship('Driver', back_populates='routes')
+    streets = db.relationship('Street', back_populates='route', lazy=True)
 
     def __init__(self, driverID, driveDate, driveTime, status='scheduled'):
         self.driverID = driverID
@@ -136,9 +149,15 @@ class Street(db.Model):
     routeID = db.Column(db.Integer, db.ForeignKey('routes.routeID'), nullable=False)
     streetName = db.Column(db.String(100), nullable=False)
     streetLocation = db.Column(db.String(200), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_streets_routeID', 'routeID'),
+        {'sqlite_autoincrement': True},
+    )
     
     # Relationships
-    stops = db.relationship('Stop', backref='street', lazy=True)
+    route = db.relationship('Route', back_populates='streets')
+    stops = db.relationship('Stop', back_populates='street', lazy=True)
 
     def __init__(self, routeID, streetName, streetLocation):
         self.routeID = routeID
@@ -162,6 +181,17 @@ class Stop(db.Model):
     stopTime = db.Column(db.Time, nullable=False)
     stopStatus = db.Column(db.String(50), nullable=False, default='requested')
 
+    __table_args__ = (
+        # One stop per resident per street; also serves lookups by resident
+        db.Index('uq_stops_residentID_streetID', 'residentID', 'streetID', unique=True),
+        db.Index('ix_stops_streetID', 'streetID'),
+        {'sqlite_autoincrement': True},
+    )
+
+    # Relationships
+    resident = db.relationship('Resident', back_populates='stops')
+    street = db.relationship('Street', back_populates='stops')
+
     def __init__(self, residentID, streetID, stopTime, stopStatus='requested'):
         self.residentID = residentID
         self.streetID = streetID
@@ -177,3 +207,229 @@ class Stop(db.Model):
             'stopStatus': self.stopStatus
         }
 
+
+
+class RouteSummary(db.Model):
+    """
+    Denormalised per-route counts for the daily runs dashboard. Kept in step
+    by the route, street and stop controllers in the same transaction as
+    their writes; rebuild_route_summaries recomputes it from scratch. Rows
+    outlive their route when it is archived, so routeID is not a foreign key.
+    """
+    __tablename__ = 'route_summaries'
+    routeID = db.Column(db.Integer, primary_key=True)
+    driverID = db.Column(db.Integer, nullable=False)
+    driveDate = db.Column(db.Date, nullable=False)
+    driveTime = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    streetCount = db.Column(db.Integer, nullable=False, default=0)
+    requestedStops = db.Column(db.Integer, nullable=False, default=0)
+    confirmedStops = db.Column(db.Integer, nullable=False, default=0)
+    completedStops = db.Column(db.Integer, nullable=False, default=0)
+    cancelledStops = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_route_summaries_driveDate_driveTime', 'driveDate', 'driveTime'),
+    )
+
+    def get_json(self):
+        return {
+            'routeID': self.routeID,
+            'driverID': self.driverID,
+            'driveDate': self.driveDate.isoformat() if self.driveDate else None,
+            'driveTime': self.driveTime.isoformat() if self.driveTime else None,
+            'status': self.status,
+            'streets': self.streetCount,
+            'stops': {
+                'requested': self.requestedStops,
+                'confirmed': self.confirmedStops,
+                'completed': self.completedStops,
+                'cancelled': self.cancelledStops
+            }
+        }
+
+
+class EntityVersion(db.Model):
+    """Change counter per entity type, bumped by every write to that type."""
+    __tablename__ = 'entity_versions'
+    entity = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """
+    A unit of deferred work for the background worker. Jobs are claimed in
+    batches by moving them to running with a lease; a job whose lease runs
+    out (its worker died) becomes claimable again. result holds the
+    handler's return value as JSON once the job is done.
+    """
+    __tablename__ = 'jobs'
+    jobID = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    maxAttempts = db.Column(db.Integer, nullable=False, default=5)
+    runAt = db.Column(db.DateTime, nullable=False)
+    lockedBy = db.Column(db.String(100))
+    lockedUntil = db.Column(db.DateTime)
+    lastError = db.Column(db.Text)
+    result = db.Column(db.Text)
+    createdAt = db.Column(db.DateTime, nullable=False)
+    finishedAt = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_runAt', 'status', 'runAt'),
+    )
+
+    def get_json(self):
+        return {
+            'jobID': self.jobID,
+            'name': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'maxAttempts': self.maxAttempts,
+            'runAt': self.runAt.isoformat() if self.runAt else None,
+            'lastError': self.lastError,
+            'result': json.loads(self.result) if self.result else None,
+            'createdAt': self.createdAt.isoformat() if self.createdAt else None,
+            'finishedAt': self.finishedAt.isoformat() if self.finishedAt else None
+        }
+
+
+class LocationSegment(db.Model):
+    """
+    A block of up to LOCATION_SEGMENT_POINTS pings from one route. data holds
+    delta-encoded timestamp, latitude and longitude arrays; it is zlib
+    compressed once the segment is sealed. See App/controllers/history.py.
+    """
+    __tablename__ = 'location_segments'
+    segmentID = db.Column(db.Integer, primary_key=True)
+    routeID = db.Column(db.Integer, db.ForeignKey('routes.routeID'), nullable=False)
+    driverID = db.Column(db.Integer, nullable=False)
+    startedAt = db.Column(db.DateTime, nullable=False)
+    endedAt = db.Column(db.DateTime, nullable=False)
+    pointCount = db.Column(db.Integer, nullable=False, default=0)
+    sealed = db.Column(db.Boolean, nullable=False, default=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_location_segments_routeID_startedAt', 'routeID', 'startedAt'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ArchivedRoute(db.Model):
+    """
+    A completed or cancelled route moved out of routes by archive_routes.
+    IDs are kept, so archived streets and stops still point at their route;
+    the live tables never reuse them (AUTOINCREMENT on SQLite).
+    The archived models are read-only copies with the same columns and
+    relationships as the live ones, so code that reads a Route, Street or
+    Stop works on them unchanged; get_json adds 'archived': True.
+    """
+    __tablename__ = 'routes_archive'
+    routeID = db.Column(db.Integer, primary_key=True)
+    driverID = db.Column(db.Integer, nullable=False)
+    driveDate = db.Column(db.Date, nullable=False)
+    driveTime = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    archivedAt = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_routes_archive_driverID_driveDate', 'driverID', 'driveDate'),
+        db.Index('ix_routes_archive_driveDate', 'driveDate'),
+    )
+
+    # Relationships
+    driver = db.relationship('Driver', primaryjoin='ArchivedRoute.driverID == Driver.userID',
+                             foreign_keys='ArchivedRoute.driverID', viewonly=True)
+    streets = db.relationship('ArchivedStreet', primaryjoin='ArchivedRoute.routeID == ArchivedStreet.routeID',
+                              foreign_keys='ArchivedStreet.routeID', viewonly=True)
+
+    def get_json(self):
+        return {
+            'routeID': self.routeID,
+            'driverID': self.driverID,
+            'driveDate': self.driveDate.isoformat() if self.driveDate else None,
+            'driveTime': self.driveTime.isoformat() if self.driveTime else None,
+            'status': self.status,
+            'archived': True
+        }
+
+
+class ArchivedStreet(db.Model):
+    __tablename__ = 'streets_archive'
+    streetID = db.Column(db.Integer, primary_key=True)
+    routeID = db.Column(db.Integer, nullable=False)
+    streetName = db.Column(db.String(100), nullable=False)
+    streetLocation = db.Column(db.String(200), nullable=False)
+    archivedAt = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_streets_archive_routeID', 'routeID'),
+    )
+
+    # Relationships
+    route = db.relationship('ArchivedRoute', primaryjoin='ArchivedStreet.routeID == ArchivedRoute.routeID',
+                            foreign_keys='ArchivedStreet.routeID', viewonly=True)
+    stops = db.relationship('ArchivedStop', primaryjoin='ArchivedStreet.streetID == ArchivedStop.streetID',
+                            foreign_keys='ArchivedStop.streetID', viewonly=True)
+
+    def get_json(self):
+        return {
+            'streetID': self.streetID,
+            'routeID': self.routeID,
+            'streetName': self.streetName,
+            'streetLocation': self.streetLocation,
+            'archived': True
+        }
+
+
+class ArchivedStop(db.Model):
+    __tablename__ = 'stops_archive'
+    stopID = db.Column(db.Integer, primary_key=True)
+    residentID = db.Column(db.Integer, nullable=False)
+    streetID = db.Column(db.Integer, nullable=False)
+    stopTime = db.Column(db.Time, nullable=False)
+    stopStatus = db.Column(db.String(50), nullable=False)
+    archivedAt = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_stops_archive_residentID', 'residentID'),
+        db.Index('ix_stops_archive_streetID', 'streetID'),
+    )
+
+    # Relationships
+    resident = db.relationship('Resident', primaryjoin='ArchivedStop.residentID == Resident.userID',
+                               foreign_keys='ArchivedStop.residentID', viewonly=True)
+    street = db.relationship('ArchivedStreet', primaryjoin='ArchivedStop.streetID == ArchivedStreet.streetID',
+                             foreign_keys='ArchivedStop.streetID', viewonly=True)
+
+    def get_json(self):
+        return {
+            'stopID': self.stopID,
+            'residentID': self.residentID,
+            'streetID': self.streetID,
+            'stopTime': self.stopTime.isoformat() if self.stopTime else None,
+            'stopStatus': self.stopStatus,
+            'archived': True
+        }
+
+
+class ArchivedLocationSegment(db.Model):
+    """Location history of an archived route, moved unchanged from location_segments"""
+    __tablename__ = 'location_segments_archive'
+    segmentID = db.Column(db.Integer, primary_key=True)
+    routeID = db.Column(db.Integer, nullable=False)
+    driverID = db.Column(db.Integer, nullable=False)
+    startedAt = db.Column(db.DateTime, nullable=False)
+    endedAt = db.Column(db.DateTime, nullable=False)
+    pointCount = db.Column(db.Integer, nullable=False)
+    sealed = db.Column(db.Boolean, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    archivedAt = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_location_segments_archive_routeID_startedAt', 'routeID', 'startedAt'),
+    )
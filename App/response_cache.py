@@ -0,0 +1,141 @@
+import hashlib, threading
+from functools import wraps
+from time import monotonic
+
+from flask import Response, make_response, request
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from App.cache import TTLCache
+from App.database import db
+from App.models import EntityVersion
+
+
+_versions = EntityVersion.__table__
+
+
+class ResponseCache:
+    """
+    Versioned cache for read endpoints. Every write bumps a counter per
+    entity type in the entity_versions table, inside the write's own
+    transaction. A read endpoint's ETag is derived from the request and the
+    counters of the entity types it depends on, so an unchanged resource is
+    answered with 304 Not Modified, and a changed one is rendered once and
+    then served from a bounded per-worker store. Each worker re-reads the
+    counters at most every version_ttl seconds, which bounds how long a
+    write made by another worker can go unseen; this worker's own writes
+    are seen immediately.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, version_ttl=1.0):
+        self.bodies = TTLCache(maxsize, ttl)
+        self.version_ttl = version_ttl
+        self._snapshot = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._stats = {'not_modified': 0, 'hits': 0, 'renders': 0, 'version_loads': 0}
+
+    def init_app(self, app):
+        self.bodies.configure(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+        self.version_ttl = app.config['RESPONSE_CACHE_VERSION_TTL']
+        self.expire_versions()
+
+    def versions(self, entities):
+        """Current counters for the entity types, or None when unavailable."""
+        loaded_at = self._loaded_at
+        if loaded_at is None or monotonic() - loaded_at > self.version_ttl:
+            started = monotonic()
+            try:
+                rows = db.session.execute(db.select(_versions.c.entity, _versions.c.version)).all()
+            except Exception:
+                db.session.rollback()
+                return None
+            with self._lock:
+                self._snapshot = dict(rows)
+                self._loaded_at = started
+                self._stats['version_loads'] += 1
+        snapshot = self._snapshot
+        return tuple(snapshot.get(entity, 0) for entity in entities)
+
+    def expire_versions(self):
+        self._loaded_at = None
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['bodies'] = self.bodies.get_stats()
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def setup_response_cache(app):
+    response_cache.init_app(app)
+    return response_cache
+
+
+def bump_versions(*entities, connection=None):
+    """
+    Mark entity types as changed in the current transaction, on the session
+    or on the given Core connection.
+    """
+    executor = connection if connection is not None else db.session
+    result = executor.execute(
+        update(_versions).where(_versions.c.entity.in_(entities)).values(version=_versions.c.version + 1)
+    )
+    if result.rowcount < len(entities):
+        existing = set(executor.execute(
+            db.select(_versions.c.entity).where(_versions.c.entity.in_(entities))
+        ).scalars())
+        missing = [{'entity': entity, 'version': 1} for entity in entities if entity not in existing]
+        if missing:
+            try:
+                with executor.begin_nested():
+                    executor.execute(insert(_versions), missing)
+            except IntegrityError:
+                # Another writer created the counter first; its bump is enough
+                pass
+    response_cache.expire_versions()
+
+
+def versioned(*entities):
+    """
+    Serve a read endpoint through the response cache. The ETag covers the
+    path, query string and negotiated content type along with the counters
+    of the given entity types. Streamed and non-200 responses pass through.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = response_cache.versions(entities)
+            if versions is None:
+                return view(*args, **kwargs)
+            key = (request.endpoint, request.full_path, str(request.accept_mimetypes), versions)
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                response_cache.count('not_modified')
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            cached = response_cache.bodies.get(key)
+            if cached is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                headers = [(name, value) for name, value in response.headers
+                           if name not in ('Content-Length', 'ETag', 'Set-Cookie')]
+                cached = (response.get_data(), response.status_code, headers)
+                response_cache.bodies.set(key, cached)
+                response_cache.count('renders')
+            else:
+                response_cache.count('hits')
+            response = Response(cached[0], status=cached[1], headers=cached[2])
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
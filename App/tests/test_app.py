@@ -1,16 +1,63 @@
-import os, tempfile, pytest, logging, unittest
+import os, tempfile, pytest, logging, unittest, json
 from werkzeug.security import check_password_hash, generate_password_hash
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import create_engine, event
+from flask_jwt_extended import create_access_token
 
 from App.main import create_app
 from App.database import db, create_db
-from App.models import User
+from App.config import engine_options
+from App.models import User, Driver, Route, Street, Stop, RouteSummary, Job, LocationSegment, \
+    ArchivedRoute, ArchivedStreet, ArchivedStop, ArchivedLocationSegment
+from App.metrics import query_stats
+from App.response_cache import response_cache
+from App.jobs import job, job_queue, enqueue
+from App.controllers.notifications import FileSink, notifier
+from App.controllers.history import location_history, flush_location_history, get_route_path, iter_route_path
 from App.controllers import (
     create_user,
     get_all_users_json,
     login,
     get_user,
     get_user_by_username,
-    update_user
+    update_user,
+    create_driver,
+    create_resident,
+    schedule_route,
+    request_stop,
+    cancel_stop,
+    view_stops,
+    schedule_routes_bulk,
+    get_streets_by_route,
+    get_driver,
+    track_driver,
+    ingest_driver_location,
+    flush_driver_locations,
+    get_location_buffer_stats,
+    update_driver_location,
+    nearest_drivers,
+    get_all_users,
+    update_resident,
+    get_user_identity,
+    get_identity_cache_stats,
+    get_tracking_hub_stats,
+    optimize_route,
+    distance_matrix,
+    parse_street_location,
+    haversine_km,
+    update_route,
+    get_route_etas,
+    get_stop_eta,
+    get_eta_cache_stats,
+    import_users,
+    read_user_csv,
+    get_all_drivers,
+    add_street_to_route,
+    get_daily_summary,
+    get_stops_by_resident,
+    get_routes_by_driver,
+    rebuild_route_summaries,
+    archive_routes
 )
 
 
@@ -56,6 +103,13 @@ def empty_db():
     db.drop_all()
 
 
+# Writes such as update_route queue background jobs; start each test with an empty queue
+@pytest.fixture(autouse=True)
+def no_leftover_jobs(empty_db):
+    db.session.execute(db.delete(Job))
+    db.session.commit()
+
+
 def test_authenticate():
     user = create_user("bob", "bobpass")
     assert login("bob", "bobpass") != None
@@ -77,3 +131,754 @@ class UsersIntegrationTests(unittest.TestCase):
         assert user.username == "ronnie"
         
 
+
+
+class StopsIntegrationTests(unittest.TestCase):
+
+    def test_view_stops_filters_and_pages(self):
+        driver = create_driver("stopdriver", "driverpass")
+        resident = create_resident("stopres", "respass", "Stop Resident", "1 Main St", 8681234567)
+        monday = schedule_route(driver.userID, date(2025, 1, 6), time(9, 0), [("Main St", "10.65,-61.51"), ("Second St", "10.66,-61.52")])
+        friday = schedule_route(driver.userID, date(2025, 1, 10), time(9, 0), [("Third St", "10.67,-61.53")])
+        first = request_stop(resident.userID, monday.streets[0].streetID, time(9, 15))
+        second = request_stop(resident.userID, monday.streets[1].streetID, time(9, 30))
+        third = request_stop(resident.userID, friday.streets[0].streetID, time(9, 45))
+        cancel_stop(resident.userID, second.stopID)
+
+        all_stops = view_stops(driver.userID)
+        assert [s.stopID for s in all_stops] == [first.stopID, second.stopID, third.stopID]
+        assert [s.stopID for s in view_stops(driver.userID, route_id=friday.routeID)] == [third.stopID]
+        assert [s.stopID for s in view_stops(driver.userID, start_date=date(2025, 1, 7))] == [third.stopID]
+        assert [s.stopID for s in view_stops(driver.userID, end_date=date(2025, 1, 6), status='requested')] == [first.stopID]
+
+        page = view_stops(driver.userID, limit=2)
+        assert [s.stopID for s in page] == [first.stopID, second.stopID]
+        page = view_stops(driver.userID, after_stop_id=page[-1].stopID, limit=2)
+        assert [s.stopID for s in page] == [third.stopID]
+
+    def test_view_stops_other_driver_route(self):
+        other = create_driver("otherdriver", "driverpass")
+        route = schedule_route(other.userID, date(2025, 1, 6), time(8, 0), [("Fourth St", "10.68,-61.54")])
+        driver = get_user_by_username("stopdriver")
+        assert view_stops(driver.userID, route_id=route.routeID) == []
+
+
+class BulkScheduleIntegrationTests(unittest.TestCase):
+
+    def test_schedule_routes_bulk_reports_failed_rows(self):
+        driver = create_driver("bulkdriver", "driverpass")
+        summary = schedule_routes_bulk([
+            {'driver_id': driver.userID, 'date': '2025-03-03', 'time': '08:00',
+             'streets': [('Main St', '10.65,-61.51'), ('Second St', '10.66,-61.52')]},
+            {'driver_id': 9999, 'date': '2025-03-03', 'time': '08:00'},
+            {'driver_id': driver.userID, 'date': '2025-03-40', 'time': '08:00'},
+            {'driver_id': driver.userID, 'date': date(2025, 3, 4), 'time': time(9, 0)},
+        ], chunk_size=2)
+        assert len(summary['created']) == 2
+        assert [failure['row'] for failure in summary['failed']] == [2, 3]
+        streets = get_streets_by_route(summary['created'][0])
+        assert [street.streetName for street in streets] == ['Main St', 'Second St']
+
+
+class LocationBufferIntegrationTests(unittest.TestCase):
+
+    def test_pings_are_coalesced_into_one_flush(self):
+        driver = create_driver("pingdriver", "driverpass")
+        flush_driver_locations()
+        before = get_location_buffer_stats()
+        ingest_driver_location(driver.userID, 10.60, -61.40)
+        ingest_driver_location(driver.userID, 10.61, -61.41)
+        # Plausible but older than the fix already buffered: loses to it
+        assert not ingest_driver_location(driver.userID, 10.50, -61.30, recorded_at=datetime.now().timestamp() - 30)
+
+        location = track_driver(None, driver.userID)['currentLocation']
+        assert (location['latitude'], location['longitude']) == (10.61, -61.41)
+
+        flush_driver_locations()
+        db.session.expire_all()
+        driver = get_driver(driver.userID)
+        assert (driver.currentLat, driver.currentLng) == (10.61, -61.41)
+        stats = get_location_buffer_stats()
+        assert stats['pings'] - before['pings'] == 3
+        assert stats['rejected'] - before['rejected'] == 0
+        assert stats['rows_flushed'] - before['rows_flushed'] == 1
+
+    def test_flushed_fixes_are_read_from_the_database_and_bad_pings_are_rejected(self):
+        driver = create_driver("skewdriver", "driverpass")
+        ingest_driver_location(driver.userID, 10.60, -61.40)
+        flush_driver_locations()
+        # Another worker flushes a newer fix; this worker's flushed one must not shadow it
+        db.session.execute(db.update(Driver).filter_by(userID=driver.userID).values(currentLat=10.70, currentLng=-61.50))
+        db.session.commit()
+        location = track_driver(None, driver.userID)['currentLocation']
+        assert (location['latitude'], location['longitude']) == (10.70, -61.50)
+
+        now = datetime.now().timestamp()
+        assert not ingest_driver_location(driver.userID, 10.80, -61.60, recorded_at=now * 1000)
+        assert not ingest_driver_location(driver.userID, 10.80, -61.60, recorded_at=0)
+        assert not ingest_driver_location(driver.userID, float('nan'), -61.60)
+        assert not ingest_driver_location(driver.userID, 95.0, -61.60)
+        # A rejected future timestamp does not block the driver's next pings
+        assert ingest_driver_location(driver.userID, 10.80, -61.60, recorded_at=now)
+
+
+class NearestDriversIntegrationTests(unittest.TestCase):
+
+    def test_nearest_drivers_follow_location_writes(self):
+        near = create_driver("neardriver", "driverpass", currentLat=10.6500, currentLng=-61.5000)
+        far = create_driver("fardriver", "driverpass", currentLat=10.7000, currentLng=-61.5000)
+        moving = create_driver("movingdriver", "driverpass")
+
+        found = [d['userID'] for d in nearest_drivers(10.6510, -61.5000, radius=10, k=5)]
+        assert found.index(near.userID) < found.index(far.userID)
+        assert moving.userID not in found
+
+        update_driver_location(moving.userID, 10.6505, -61.5000)
+        assert nearest_drivers(10.6505, -61.5000, radius=0.5, k=1)[0]['userID'] == moving.userID
+
+        ingest_driver_location(far.userID, 20.0, 20.0)
+        found = [d['userID'] for d in nearest_drivers(10.6510, -61.5000, radius=10, k=5)]
+        assert far.userID not in found
+        flush_driver_locations()
+
+
+class PolymorphicUserIntegrationTests(unittest.TestCase):
+
+    def test_user_lookup_is_a_single_query(self):
+        resident_id = create_resident("polyres", "respass", "Poly Resident", "2 Main St", 8687654321).userID
+        db.session.expunge_all()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            user = get_user(resident_id)
+            assert user.residentName == "Poly Resident"
+            assert get_user_by_username("polyres").userID == resident_id
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        assert len(statements) == 2
+
+    def test_get_all_users_pages_by_id(self):
+        create_driver("pagedriver1", "driverpass")
+        create_driver("pagedriver2", "driverpass")
+        create_driver("pagedriver3", "driverpass")
+        first_page = get_all_users(limit=2)
+        second_page = get_all_users(after_id=first_page[-1].userID, limit=2)
+        assert len(first_page) == 2
+        assert second_page[0].userID > first_page[-1].userID
+
+
+def test_users_api_pages_and_streams_ndjson(empty_db):
+    response = empty_db.get("/api/users?limit=1")
+    assert len(response.json) == 1
+    cursor = response.headers["X-Next-Cursor"]
+    assert cursor == str(response.json[0]["userID"])
+
+    response = empty_db.get(f"/api/users?after={cursor}", headers={"Accept": "application/x-ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert rows == get_all_users_json(after_id=int(cursor))
+
+
+class PasswordHashingIntegrationTests(unittest.TestCase):
+
+    def test_login_upgrades_outdated_hash(self):
+        driver = create_driver("rehashdriver", "driverpass")
+        driver.password = generate_password_hash("driverpass", method="pbkdf2:sha256:1000")
+        db.session.commit()
+        assert driver.password_needs_rehash()
+
+        assert login("rehashdriver", "driverpass") != None
+        assert not driver.password_needs_rehash()
+        assert driver.check_password("driverpass")
+        assert login("rehashdriver", "wrongpass") == None
+
+
+class IdentityCacheIntegrationTests(unittest.TestCase):
+
+    def test_identity_cache_hits_and_invalidates(self):
+        resident_id = create_resident("cachedres", "respass", "Cached Resident", "3 Main St", 8681112222).userID
+        db.session.expunge_all()
+        get_user_identity(resident_id)
+        before = get_identity_cache_stats()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            db.session.expunge_all()
+            user = get_user_identity(resident_id)
+            assert user.residentName == "Cached Resident"
+            assert user in db.session
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        assert statements == []
+        assert get_identity_cache_stats()["hits"] == before["hits"] + 1
+
+        update_resident(resident_id, residentName="Renamed Resident")
+        db.session.expunge_all()
+        assert get_user_identity(resident_id).residentName == "Renamed Resident"
+
+
+def test_tracking_stream_pushes_location_updates(empty_db):
+    driver = create_driver("streamdriver", "driverpass", currentLat=10.1, currentLng=-61.1)
+    token = create_access_token(identity=str(driver.userID))
+    response = empty_db.get(f"/api/drivers/track?driver={driver.userID}",
+                            headers={"Authorization": f"Bearer {token}"}, buffered=False)
+    frames = iter(response.response)
+    assert b'"latitude":10.1' in next(frames)
+
+    update_driver_location(driver.userID, 10.2, -61.2)
+    frame = next(frames)
+    assert frame.startswith(b"event: location")
+    assert b'"latitude":10.2' in frame
+    response.close()
+    assert get_tracking_hub_stats()["subscriptions"] == 0
+
+
+class RouteOptimizerIntegrationTests(unittest.TestCase):
+
+    def test_optimize_route_orders_streets_by_distance(self):
+        driver = create_driver("optdriver", "driverpass", currentLat=10.600, currentLng=-61.400)
+        route = schedule_route(driver.userID, date(2025, 4, 7), time(8, 0), [
+            ("Far St", "10.630,-61.400"),
+            ("Near St", "10.610,-61.400"),
+            ("Unknown St", "behind the church"),
+            ("Middle St", "10.620, -61.400"),
+        ])
+        resident = create_resident("optres", "respass", "Opt Resident", "4 Main St", 8683334444)
+        near_street = [s for s in route.streets if s.streetName == "Near St"][0]
+        request_stop(resident.userID, near_street.streetID, time(8, 30))
+
+        plan = optimize_route(route.routeID)
+        assert [v["streetName"] for v in plan["visits"]] == ["Near St", "Middle St", "Far St", "Unknown St"]
+        assert plan["distanceKm"] < plan["originalDistanceKm"]
+        assert len(plan["visits"][0]["stops"]) == 1
+        assert plan["unlocatedStreets"] == [s.streetID for s in route.streets if s.streetName == "Unknown St"]
+
+    def test_distance_matrix_matches_haversine(self):
+        points = [(10.6, -61.4), (10.7, -61.3), (11.0, -60.9)]
+        matrix = distance_matrix(points)
+        assert abs(matrix[0, 2] - haversine_km(10.6, -61.4, 11.0, -60.9)) < 1e-9
+        assert parse_street_location("(10.65, -61.51)") == (10.65, -61.51)
+        assert parse_street_location("Lot 5, 12 Bay Rd") is None
+        assert parse_street_location("12 34 Main St") is None
+
+
+class ETAIntegrationTests(unittest.TestCase):
+
+    def test_route_etas_are_cached_until_the_driver_moves(self):
+        driver = create_driver("etadriver", "driverpass", currentLat=10.600, currentLng=-61.400)
+        route = schedule_route(driver.userID, date(2025, 5, 5), time(8, 0), [
+            ("First St", "10.610,-61.400"),
+            ("Second St", "10.620,-61.400"),
+        ])
+        resident = create_resident("etares", "respass", "ETA Resident", "5 Main St", 8685556666)
+        near = request_stop(resident.userID, route.streets[0].streetID, time(8, 10))
+        far = request_stop(resident.userID, route.streets[1].streetID, time(8, 20))
+        assert get_route_etas(route.routeID) == {"error": "Route is not active"}
+        update_route(driver.userID, route.routeID, new_status="active")
+
+        etas = get_route_etas(route.routeID)
+        assert [eta["stopID"] for eta in etas["stops"]] == [near.stopID, far.stopID]
+        assert etas["stops"][0]["etaSeconds"] < etas["stops"][1]["etaSeconds"]
+        computations = get_eta_cache_stats()["computations"]
+        assert get_route_etas(route.routeID) is etas
+        assert get_stop_eta(far.stopID, resident.userID)["stopID"] == far.stopID
+        assert get_eta_cache_stats()["computations"] == computations
+
+        update_driver_location(driver.userID, 10.619, -61.400)
+        assert [eta["stopID"] for eta in get_route_etas(route.routeID)["stops"]] == [far.stopID]
+        assert get_eta_cache_stats()["computations"] == computations + 1
+
+
+def test_query_stats_per_endpoint_and_budget(empty_db, caplog):
+    query_stats.reset()
+    response_cache.bodies.clear()
+    empty_db.get("/api/users?limit=1")
+    stats = query_stats.get_stats()["GET user_views.get_users_action"]
+    assert stats["count"] == 1 and stats["statements"] >= 1
+    assert stats["slowestStatement"].startswith("SELECT")
+
+    metrics = empty_db.get("/metrics").data.decode()
+    assert 'db_statements_per_request_count{endpoint="GET user_views.get_users_action"} 1' in metrics
+    assert 'db_seconds_per_request_bucket{endpoint="GET user_views.get_users_action",le="+Inf"} 1' in metrics
+
+    budget = query_stats.statement_budget
+    query_stats.statement_budget = 0
+    try:
+        with caplog.at_level(logging.WARNING, logger="App.metrics"):
+            empty_db.get("/api/users?limit=2")
+    finally:
+        query_stats.statement_budget = budget
+    assert "Query budget exceeded by GET user_views.get_users_action" in caplog.text
+    assert query_stats.get_stats()["GET user_views.get_users_action"]["overBudget"] == 1
+
+
+def test_sqlite_pragmas_and_pool_sizing(empty_db):
+    assert db.session.execute(db.text("PRAGMA journal_mode")).scalar() == "wal"
+    assert db.session.execute(db.text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+    assert db.session.execute(db.text("PRAGMA busy_timeout")).scalar() == 5000
+
+    config = dict(empty_db.application.config, SQLALCHEMY_DATABASE_URI="postgresql://localhost/app")
+    options = engine_options(config)
+    assert options["pool_size"] == 11 and options["max_overflow"] == 11
+    assert options["pool_pre_ping"] and options["pool_recycle"] == 1800
+    options = engine_options(dict(config, SERVER_WORKER_CLASS="gthread", SERVER_THREADS=8))
+    assert options["pool_size"] == 8 and options["max_overflow"] == 14
+    assert engine_options(empty_db.application.config) == {}
+
+
+
+def test_import_residents_resumes_after_last_committed_chunk(tmp_path):
+    path = tmp_path / "residents.csv"
+    lines = ["username,password,name,address,phone"]
+    lines += [f"importres{i},pass{i},Import {i},{i} Hill Rd,86800000{i:02d}" for i in range(5)]
+    lines += ["importbad,,No Password,1 Rd,8680000000"]
+    path.write_text("\n".join(lines) + "\n")
+    checkpoint = str(tmp_path / "residents.csv.progress")
+    with open(checkpoint, "w") as f:
+        f.write("3")  # header plus two rows were committed before an interruption
+
+    summary = import_users("resident", read_user_csv(str(path)), chunk_size=2, processes=0, checkpoint_path=checkpoint)
+    assert summary["resumedAfter"] == 3
+    assert summary["imported"] == 3
+    assert summary["failed"] == [{"row": 7, "error": "username and password are required"}]
+    assert get_user_by_username("importres0") is None
+    assert login("importres4", "pass4") is not None
+    assert not os.path.exists(checkpoint)
+
+    summary = import_users("resident", read_user_csv(str(path)), chunk_size=2, processes=0)
+    assert summary["imported"] == 2 and summary["skipped"] == 3
+
+
+def test_import_reports_a_username_repeated_in_a_later_chunk(tmp_path):
+    path = tmp_path / "residents.csv"
+    rows = [f"{name},pass,Dup {name},1 Dup Rd,8681234567" for name in ("dupa", "dupb", "dupc", "dupa")]
+    path.write_text("\n".join(["username,password,name,address,phone"] + rows) + "\n")
+
+    summary = import_users("resident", read_user_csv(str(path)), chunk_size=2, processes=0)
+    assert "error" not in summary
+    assert summary["imported"] == 3
+    assert summary["failed"] == [{"row": 5, "error": "Duplicate username dupa in file"}]
+    assert get_user_by_username("dupc") is not None
+
+
+def test_read_only_controllers_use_replica_until_the_request_writes(tmp_path):
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    db.metadata.create_all(replica)
+    with replica.begin() as connection:
+        connection.execute(User.__table__.insert(), {"userID": 9001, "userName": "replicaonly", "password": "x", "user_type": "driver"})
+        connection.execute(Driver.__table__.insert(), {"userID": 9001})
+    db.session.remove()
+    db.engines["replica"] = replica
+    try:
+        assert [d.userName for d in get_all_drivers()] == ["replicaonly"]
+        assert get_user_by_username("replicaonly") is None  # not marked read-only, so the primary answers
+
+        create_driver("primarywrite", "driverpass")
+        names = [d.userName for d in get_all_drivers()]
+        assert "primarywrite" in names and "replicaonly" not in names
+    finally:
+        db.session.remove()
+        del db.engines["replica"]
+        replica.dispose()
+
+
+class RouteSummaryIntegrationTests(unittest.TestCase):
+
+    def test_summary_tracks_route_street_and_stop_writes(self):
+        driver = create_driver("sumdriver", "driverpass")
+        resident = create_resident("sumres", "respass", "Sum Resident", "6 Main St", 8687778888)
+        route = schedule_route(driver.userID, date(2025, 6, 2), time(7, 0), [("Sum St", "10.6,-61.4")])
+        street = add_street_to_route(route.routeID, "Other St", "10.7,-61.4")
+        first = request_stop(resident.userID, route.streets[0].streetID, time(7, 30))
+        request_stop(resident.userID, street.streetID, time(7, 45))
+        cancel_stop(resident.userID, first.stopID)
+        update_route(driver.userID, route.routeID, new_status="active")
+
+        summary = get_daily_summary(date(2025, 6, 2))
+        assert summary["routes"] == [{
+            "routeID": route.routeID, "driverID": driver.userID, "driveDate": "2025-06-02",
+            "driveTime": "07:00:00", "status": "active", "streets": 2,
+            "stops": {"requested": 1, "confirmed": 0, "completed": 0, "cancelled": 1}
+        }]
+        assert summary["totals"]["byStatus"] == {"active": 1}
+
+        db.session.execute(db.delete(RouteSummary))
+        db.session.commit()
+        assert get_daily_summary(date(2025, 6, 2))["routes"] == []
+        assert rebuild_route_summaries() >= 1
+        assert get_daily_summary(date(2025, 6, 2))["routes"] == summary["routes"]
+
+
+def test_users_api_answers_304_until_a_write_bumps_the_version(empty_db):
+    driver = create_driver("etagdriver", "driverpass")
+    first = empty_db.get("/api/users")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and not first.headers.get("Set-Cookie")
+
+    response = empty_db.get("/api/users", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    assert response.headers["ETag"] == etag
+    assert empty_db.get("/api/users").data == first.data
+
+    # The lists show positions, so a batch of pings is a change too
+    ingest_driver_location(driver.userID, 10.4, -61.1)
+    flush_driver_locations()
+    response = empty_db.get("/api/users", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    update_driver_location(driver.userID, 10.5, -61.2)
+    response = empty_db.get("/api/users", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_nearest_drivers_api_rejects_non_finite_and_out_of_range_arguments(empty_db):
+    resident = create_resident("nearestres", "respass", "Dee", "4 Bay Rd", 8684440000)
+    headers = {"Authorization": f"Bearer {create_access_token(identity=str(resident.userID))}"}
+    for query in ("lat=nan&lng=-61.5", "lat=10.6&lng=inf", "lat=95&lng=-61.5",
+                  "lat=10.6&lng=-61.5&radius=-1", "lat=10.6&lng=-61.5&radius=nan", "lat=10.6&lng=-61.5&k=0"):
+        response = empty_db.get(f"/api/drivers/nearest?{query}", headers=headers)
+        assert response.status_code == 400 and response.is_json, query
+    assert empty_db.get("/api/drivers/nearest?lat=10.6&lng=-61.5&radius=500", headers=headers).status_code == 200
+
+
+def test_concurrent_stop_requests_from_greenlets_keep_one_stop(empty_db):
+    import gevent
+    driver = create_driver("racedriver", "driverpass")
+    resident = create_resident("raceres", "respass", "Race Resident", "7 Main St", 8689990000)
+    route = schedule_route(driver.userID, date(2025, 6, 3), time(7, 0), [("Race St", "10.6,-61.4")])
+    resident_id, street_id = resident.userID, route.streets[0].streetID
+
+    # Switch greenlets before every statement until the transaction writes, the
+    # way gevent interleaves requests at each database round trip
+    def switch_before_write(conn, cursor, statement, parameters, context, executemany):
+        if not conn.info.get("writing"):
+            gevent.sleep(0)
+            conn.info["writing"] = not statement.lstrip().upper().startswith("SELECT")
+
+    def transaction_ended(conn):
+        conn.info.pop("writing", None)
+
+    def request():
+        with empty_db.application.app_context():
+            try:
+                stop = request_stop(resident_id, street_id, time(7, 30))
+                return stop if isinstance(stop, dict) else stop.stopID
+            finally:
+                db.session.remove()
+
+    def hammer():
+        greenlets = [gevent.spawn(request) for _ in range(10)]
+        gevent.joinall(greenlets, raise_error=True)
+        return [greenlet.value for greenlet in greenlets]
+
+    hooks = [("before_cursor_execute", switch_before_write), ("commit", transaction_ended),
+             ("rollback", transaction_ended)]
+    for name, hook in hooks:
+        event.listen(db.engine, name, hook)
+    try:
+        created = hammer()
+        stop_ids = [result for result in created if not isinstance(result, dict)]
+        assert len(stop_ids) == 1
+        assert created.count({"error": "Stop already requested for this street"}) == 9
+
+        cancel_stop(resident_id, stop_ids[0])
+        reactivated = hammer()
+        assert [result for result in reactivated if not isinstance(result, dict)] == stop_ids
+    finally:
+        for name, hook in hooks:
+            event.remove(db.engine, name, hook)
+
+    stops = get_stops_by_resident(resident_id)
+    assert [(stop.stopID, stop.stopStatus) for stop in stops] == [(stop_ids[0], "requested")]
+    summary = get_daily_summary(date(2025, 6, 3))["routes"][0]
+    assert summary["stops"] == {"requested": 1, "confirmed": 0, "completed": 0, "cancelled": 0}
+
+
+def test_job_queue_runs_batches_and_retries_with_backoff(empty_db):
+    ran = []
+
+    @job("tests.record")
+    def record(value):
+        ran.append(value)
+
+    @job("tests.fail")
+    def fail():
+        raise RuntimeError("sink unavailable")
+
+    job_queue.purge(0)
+    for value in range(3):
+        enqueue("tests.record", {"value": value})
+    failing = enqueue("tests.fail", max_attempts=2)
+    db.session.commit()
+    failing_id = failing.jobID
+
+    assert job_queue.run_batch("test-worker") == 4
+    assert ran == [0, 1, 2]
+    retry = db.session.get(Job, failing_id)
+    assert (retry.status, retry.attempts, retry.lastError) == ("queued", 1, "RuntimeError: sink unavailable")
+    assert retry.runAt > datetime.now() + timedelta(seconds=job_queue.retry_base_seconds - 1)
+    assert job_queue.work(burst=True) == 0
+
+    db.session.execute(db.update(Job).filter(Job.jobID == failing_id).values(runAt=datetime.now()))
+    db.session.commit()
+    assert job_queue.work(burst=True) == 1
+    assert db.session.get(Job, failing_id).status == "failed"
+    stats = job_queue.get_stats()
+    assert (stats["queued"], stats["done"], stats["failed"]) == (0, 3, 1)
+    assert "route_summaries.rebuild" in stats["handlers"]
+
+
+def test_route_going_active_notifies_each_resident_once(empty_db, tmp_path):
+    driver = create_driver("notifydriver", "driverpass")
+    first = create_resident("notifyres1", "respass", "Ann", "1 Bay Rd", 8681110000)
+    second = create_resident("notifyres2", "respass", "Ben", "2 Bay Rd", 8682220000)
+    route = schedule_route(driver.userID, date(2025, 6, 4), time(7, 0),
+                           [("Bay Rd", "10.6,-61.4"), ("Hill Rd", "10.7,-61.4")])
+    bay, hill = route.streets[0].streetID, route.streets[1].streetID
+    first_id, second_id, driver_id = first.userID, second.userID, driver.userID
+    request_stop(first.userID, bay, time(7, 20))
+    request_stop(first.userID, hill, time(7, 10))
+    cancelled = request_stop(second.userID, hill, time(7, 40))
+    cancel_stop(second.userID, cancelled.stopID)
+    request_stop(second.userID, bay, time(7, 30))
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sink, notifier.sink = notifier.sink, FileSink(str(tmp_path / "notifications.jsonl"))
+    try:
+        update_route(driver.userID, route.routeID, new_status="active")
+        update_route(driver.userID, route.routeID, new_status="active")
+        event.listen(db.engine, "before_cursor_execute", record)
+        assert job_queue.work(burst=True) == 1
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+        notifier.sink = sink
+
+    lines = (tmp_path / "notifications.jsonl").read_text().splitlines()
+    notifications = {n["residentID"]: n for n in map(json.loads, lines)}
+    assert len(lines) == 2 and set(notifications) == {first_id, second_id}
+    assert len(notifications[first_id]["stops"]) == 2
+    assert "Hill Rd, Bay Rd" in notifications[first_id]["message"]
+    assert "07:10" in notifications[first_id]["message"]
+    assert len(notifications[second_id]["stops"]) == 1
+    # Only the recipient query touches stops: no lazy loads per street or resident
+    assert len([statement for statement in statements if "FROM stops" in statement]) == 1
+
+    # Stats come from the finished job, not the memory of the process that ran it
+    done = db.session.scalars(db.select(Job).filter_by(name="notifications.route_active")).one()
+    assert done.get_json()["result"]["recipients"] == 2
+    token = create_access_token(identity=str(driver_id))
+    stats = empty_db.get("/api/notifications/stats", headers={"Authorization": f"Bearer {token}"}).get_json()
+    assert stats["fanouts"] == 1 and stats["notifications"] == 2 and stats["stops"] == 3
+
+
+def test_location_history_packs_route_pings_into_sealed_segments(empty_db):
+    driver = create_driver("historydriver", "driverpass")
+    idle = create_driver("idledriver", "driverpass")
+    resident = create_resident("historyres", "respass", "Dee", "4 Path St", 8684440000)
+    route = schedule_route(driver.userID, date(2025, 6, 5), time(7, 0), [("Path St", "10.6,-61.4")])
+    request_stop(resident.userID, route.streets[0].streetID, time(7, 15))
+    update_route(driver.userID, route.routeID, new_status="active")
+    driver_id, idle_id, resident_id, route_id = driver.userID, idle.userID, resident.userID, route.routeID
+    start = float(int(datetime.now().timestamp())) - 600
+    pings = [(start + i * 2.5, 10.65 + i * 0.0001, -61.5 - i * 0.00013) for i in range(10)]
+
+    size, location_history.segment_points = location_history.segment_points, 4
+    try:
+        for t, lat, lng in pings[:6]:
+            ingest_driver_location(driver_id, lat, lng, recorded_at=t)
+        ingest_driver_location(idle_id, 10.0, -61.0, recorded_at=start)
+        flush_location_history()
+        for t, lat, lng in pings[6:]:
+            ingest_driver_location(driver_id, lat, lng, recorded_at=t)
+        flush_location_history()
+        flush_driver_locations()
+    finally:
+        location_history.segment_points = size
+
+    segments = db.session.scalars(
+        db.select(LocationSegment).filter_by(routeID=route_id).order_by(LocationSegment.startedAt)
+    ).all()
+    assert [(segment.pointCount, segment.sealed) for segment in segments] == [(4, True), (4, True), (2, False)]
+    assert db.session.scalar(db.select(db.func.count()).select_from(LocationSegment)
+                             .filter(LocationSegment.driverID == idle_id)) == 0
+
+    path = get_route_path(route_id)
+    assert [point["t"] for point in path] == [t for t, _, _ in pings]
+    assert all(abs(point["lat"] - lat) < 1e-5 and abs(point["lng"] - lng) < 1e-5
+               for point, (_, lat, lng) in zip(path, pings))
+    window = list(iter_route_path(route_id, start=pings[3][0], end=pings[5][0]))
+    assert [t for t, _, _ in window] == [t for t, _, _ in pings[3:6]]
+
+    token = create_access_token(identity=str(driver_id))
+    response = empty_db.get(f"/api/routes/{route_id}/path?from={pings[8][0]}",
+                            headers={"Authorization": f"Bearer {token}"})
+    assert [json.loads(line)["t"] for line in response.data.decode().splitlines()] == [pings[8][0], pings[9][0]]
+    for bad in ("nan", "inf", "-inf", "1e300"):
+        response = empty_db.get(f"/api/routes/{route_id}/path?from={bad}", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 400
+    # Only the route's driver and residents with a stop on it see the trace
+    for user_id, status in ((resident_id, 200), (idle_id, 404)):
+        token = create_access_token(identity=str(user_id))
+        response = empty_db.get(f"/api/routes/{route_id}/path", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status
+
+
+def test_archive_moves_old_finished_routes_and_ranges_read_them_back(empty_db):
+    driver = create_driver("archivedriver", "driverpass")
+    resident = create_resident("archiveres", "respass", "Cal", "3 Bay Rd", 8683330000)
+    today = date.today()
+    old = schedule_route(driver.userID, today - timedelta(days=60), time(7, 0),
+                         [("Old Rd", "10.6,-61.4"), ("Older Rd", "10.7,-61.4")])
+    waiting = schedule_route(driver.userID, today - timedelta(days=45), time(7, 0), [("Late Rd", "10.6,-61.5")])
+    recent = schedule_route(driver.userID, today - timedelta(days=5), time(7, 0), [("New Rd", "10.6,-61.6")])
+    driver_id, resident_id = driver.userID, resident.userID
+    old_id, waiting_id, recent_id = old.routeID, waiting.routeID, recent.routeID
+    old_streets = [street.streetID for street in old.streets]
+    old_stops = [request_stop(resident_id, street_id, time(7, 15)).stopID for street_id in old_streets]
+    request_stop(resident_id, waiting.streets[0].streetID, time(7, 15))
+    request_stop(resident_id, recent.streets[0].streetID, time(7, 15))
+
+    update_route(driver_id, old_id, new_status="active")
+    start = float(int(datetime.now().timestamp())) - 600
+    for i in range(3):
+        ingest_driver_location(driver_id, 10.6 + i * 0.001, -61.4, recorded_at=start + i)
+    flush_driver_locations()
+    update_route(driver_id, old_id, new_status="completed")
+    update_route(driver_id, recent_id, new_status="completed")
+
+    result = archive_routes(older_than_days=30, batch_size=1)
+    assert result is not None and not result["remaining"]
+    assert (result["routes"], result["streets"], result["stops"], result["segments"]) == (1, 2, 2, 1)
+    assert db.session.get(Route, old_id) is None
+    # The daily summary still covers archived days, also after a rebuild
+    assert rebuild_route_summaries() is not None
+    old_summary = get_daily_summary(today - timedelta(days=60))
+    assert [(route["routeID"], route["streets"], route["stops"]["requested"]) for route in old_summary["routes"]] \
+        == [(old_id, 2, 2)]
+    assert db.session.get(ArchivedRoute, old_id).status == "completed"
+    assert db.session.scalar(db.select(db.func.count()).select_from(Street)
+                             .filter(Street.streetID.in_(old_streets))) == 0
+    assert sorted(db.session.scalars(db.select(ArchivedStreet.streetID)
+                                     .filter_by(routeID=old_id)).all()) == sorted(old_streets)
+    assert sorted(db.session.scalars(db.select(ArchivedStop.stopID)
+                                     .filter_by(residentID=resident_id)).all()) == sorted(old_stops)
+    assert db.session.scalar(db.select(db.func.count()).select_from(ArchivedLocationSegment)
+                             .filter_by(routeID=old_id)) == 1
+    # Scheduled and recent routes stay where they are
+    assert db.session.get(Route, waiting_id) is not None and db.session.get(Route, recent_id) is not None
+    assert archive_routes(older_than_days=30)["routes"] == 0
+
+    # Hot reads see live rows only; an explicit range reaches into the archive
+    assert [route.routeID for route in get_routes_by_driver(driver_id)] == [waiting_id, recent_id]
+    assert len(get_stops_by_resident(resident_id)) == 2
+    history = get_routes_by_driver(driver_id, start_date=today - timedelta(days=90))
+    assert [route.routeID for route in history] == [old_id, waiting_id, recent_id]
+    assert history[0].get_json()["archived"] is True
+    assert history[0].driver.userID == driver_id
+    assert sorted(street.streetName for street in history[0].streets) == ["Old Rd", "Older Rd"]
+    stops = get_stops_by_resident(resident_id, start_date=today - timedelta(days=90), end_date=today - timedelta(days=50))
+    assert sorted(stop.stopID for stop in stops) == sorted(old_stops)
+    assert {stop.street.route.routeID for stop in stops} == {old_id}
+    assert all(stop.resident.userID == resident_id and stop in stop.street.stops for stop in stops)
+    # A driver's ranged stop listing pages across live and archived stops by stopID
+    since = today - timedelta(days=90)
+    first_page = view_stops(driver_id, start_date=since, status="requested", limit=2)
+    assert [stop.stopID for stop in first_page] == sorted(old_stops)
+    second_page = view_stops(driver_id, start_date=since, status="requested", after_stop_id=first_page[-1].stopID)
+    assert [stop.street.route.routeID for stop in second_page] == [waiting_id, recent_id]
+    assert view_stops(driver_id, start_date=since, status="cancelled") == []
+    assert len(view_stops(driver_id)) == 2
+    assert list(iter_route_path(old_id)) == []
+    assert [t for t, _, _ in iter_route_path(old_id, start=start)] == [start, start + 1, start + 2]
+
+
+def test_archiving_the_newest_route_does_not_free_its_ids(empty_db):
+    driver = create_driver("reusedriver", "driverpass")
+    resident = create_resident("reuseres", "respass", "Eve", "5 Bay Rd", 8685550000)
+    old = schedule_route(driver.userID, date.today() - timedelta(days=60), time(7, 0), [("Last Rd", "10.6,-61.4")])
+    stop = request_stop(resident.userID, old.streets[0].streetID, time(7, 15))
+    driver_id, resident_id, old_id, street_id, stop_id = \
+        driver.userID, resident.userID, old.routeID, old.streets[0].streetID, stop.stopID
+    update_route(driver_id, old_id, new_status="completed")
+    assert archive_routes(older_than_days=30)["routes"] == 1
+
+    route = schedule_route(driver_id, date.today(), time(7, 0), [("Next Rd", "10.6,-61.5")])
+    assert route is not None and route.routeID > old_id
+    assert route.streets[0].streetID > street_id
+    assert request_stop(resident_id, route.streets[0].streetID, time(7, 15)).stopID > stop_id
+    assert db.session.get(RouteSummary, old_id) is not None
+
+
+def test_location_history_splits_long_gaps_and_drops_a_batch_that_keeps_failing(empty_db, monkeypatch):
+    driver = create_driver("gapdriver", "driverpass")
+    route = schedule_route(driver.userID, date.today(), time(7, 0), [("Gap St", "10.6,-61.4")])
+    update_route(driver.userID, route.routeID, new_status="active")
+    driver_id, route_id = driver.userID, route.routeID
+    later = float(int(datetime.now().timestamp()))
+    start = later - 40 * 86400  # too far apart for one int32 millisecond delta
+    location_history.record(driver_id, 10.6, -61.4, start)
+    location_history.record(driver_id, 10.61, -61.41, later)
+    flush_location_history()
+
+    segments = db.session.scalars(
+        db.select(LocationSegment).filter_by(routeID=route_id).order_by(LocationSegment.startedAt)
+    ).all()
+    assert [(segment.pointCount, segment.sealed) for segment in segments] == [(1, True), (1, False)]
+    assert [t for t, _, _ in iter_route_path(route_id)] == [start, later]
+
+    def broken_store(batch):
+        raise RuntimeError("database unavailable")
+
+    before = location_history.get_stats()
+    monkeypatch.setattr(location_history, "_store", broken_store)
+    location_history.record(driver_id, 10.62, -61.42, later + 1)
+    for _ in range(location_history.max_retries):
+        try:
+            flush_location_history()
+        except RuntimeError:
+            pass
+    stats = location_history.get_stats()
+    assert stats["dropped"] - before["dropped"] == 1 and stats["pending"] == 0
+
+
+def test_job_lease_is_renewed_per_job_and_only_the_holder_records_the_outcome(empty_db):
+    ran = []
+
+    @job("tests.steal")
+    def steal(value):
+        ran.append(value)
+        # Another worker takes the job over while it runs
+        with db.engine.begin() as connection:
+            connection.execute(db.update(Job).filter(Job.status == "running").values(lockedBy="other-worker"))
+
+    @job("tests.plain")
+    def plain(value):
+        ran.append(value)
+
+    first, second = enqueue("tests.plain", {"value": 1}), enqueue("tests.steal", {"value": 2})
+    db.session.commit()
+    first_id, second_id = first.jobID, second.jobID
+    rows = job_queue.claim("worker-a")
+    assert [row.jobID for row in rows] == [first_id, second_id]
+
+    # The first job's lease ran out while the batch waited and worker b claimed it
+    db.session.execute(db.update(Job).filter(Job.jobID == first_id).values(lockedUntil=datetime.now() - timedelta(seconds=1)))
+    db.session.commit()
+    assert [row.jobID for row in job_queue.claim("worker-b")] == [first_id]
+    assert job_queue.run_job(rows[0], "worker-a") is False
+    assert ran == []
+
+    assert job_queue.run_job(rows[1], "worker-a") is False
+    assert ran == [2]
+    db.session.expire_all()
+    stolen = db.session.get(Job, second_id)
+    assert (stolen.status, stolen.lockedBy) == ("running", "other-worker")
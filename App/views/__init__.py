@@ -3,8 +3,16 @@
 from .user import user_views
 from .index import index_views
 from .auth import auth_views
-from .admin import setup_admin
+from .driver import driver_views
+from .route import route_views
 
 
-views = [user_views, index_views, auth_views] 
+def setup_admin(app):
+    # Flask-Admin and its model views are imported on first use so that
+    # CLI commands, which never build the admin, do not pay for them
+    from .admin import setup_admin
+    return setup_admin(app)
+
+
+views = [user_views, index_views, auth_views, driver_views, route_views] 
 # blueprints must be added to this list
\ No newline at end of file
@@ -2,11 +2,16 @@ from flask_admin.contrib.sqla import ModelView
 from flask_jwt_extended import jwt_required, current_user, unset_jwt_cookies, set_access_cookies
 from flask_admin import Admin
 from flask import flash, redirect, url_for, request
-from App.database import db
+from App.database import db, replica_reads
 from App.models import Driver, Resident, Route, Street, Stop
 
 class AdminView(ModelView):
 
+    def get_list(self, *args, **kwargs):
+        # List pages are read-only, so they can be served by the replica
+        with replica_reads():
+            return super().get_list(*args, **kwargs)
+
     @jwt_required()
     def is_accessible(self):
         return current_user is not None
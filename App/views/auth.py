@@ -6,7 +6,7 @@ from.index import index_views
 
 from App.controllers import (
     login,
-
+    get_identity_cache_stats
 )
 
 auth_views = Blueprint('auth_views', __name__, template_folder='../templates')
@@ -66,4 +66,9 @@ def identify_user():
 def logout_api():
     response = jsonify(message="Logged Out!")
     unset_jwt_cookies(response)
-    return response
\ No newline at end of file
+    return response
+
+@auth_views.route('/api/identity-cache', methods=['GET'])
+@jwt_required()
+def identity_cache_stats_api():
+    return jsonify(get_identity_cache_stats())
@@ -0,0 +1,107 @@
+import math
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, current_user
+
+from App.response_cache import versioned
+from App.controllers import (
+    get_all_drivers_json,
+    ingest_driver_location,
+    check_driver_location,
+    get_location_buffer_stats,
+    nearest_drivers,
+    track_driver,
+    subscribe_to_drivers,
+    format_sse
+)
+
+driver_views = Blueprint('driver_views', __name__, template_folder='../templates')
+
+'''
+API Routes
+'''
+
+@driver_views.route('/api/drivers', methods=['GET'])
+@jwt_required()
+@versioned('drivers')
+def get_drivers_action():
+    return jsonify(get_all_drivers_json())
+
+@driver_views.route('/api/drivers/<int:driver_id>/location', methods=['POST'])
+@jwt_required()
+def driver_location_action(driver_id):
+    if current_user.id != driver_id or current_user.user_type != 'driver':
+        return jsonify(message='cannot update another driver\'s location'), 403
+    data = request.json or {}
+    try:
+        lat, lng = float(data['lat']), float(data['lng'])
+        recorded_at = float(data['timestamp']) if data.get('timestamp') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify(message='lat and lng are required, timestamp must be a number'), 400
+    error = check_driver_location(lat, lng, recorded_at)
+    if error:
+        return jsonify(message=error), 400
+    ingest_driver_location(driver_id, lat, lng, recorded_at)
+    return jsonify(message='location received'), 202
+
+@driver_views.route('/api/drivers/nearest', methods=['GET'])
+@jwt_required()
+def nearest_drivers_action():
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        radius = float(request.args.get('radius', 5))
+        k = int(request.args.get('k', 10))
+    except (KeyError, ValueError):
+        return jsonify(message='lat and lng are required, radius and k must be numbers'), 400
+    error = check_driver_location(lat, lng)
+    if error:
+        return jsonify(message=error), 400
+    if not math.isfinite(radius) or radius <= 0 or k < 1:
+        return jsonify(message='radius must be a positive number of kilometres and k at least 1'), 400
+    radius, k = min(radius, 50.0), min(k, 100)
+    return jsonify(nearest_drivers(lat, lng, radius, k))
+
+@driver_views.route('/api/drivers/track', methods=['GET'])
+@jwt_required()
+def track_drivers_stream():
+    # Accepts ?driver=1&driver=2 or ?drivers=1,2
+    try:
+        driver_ids = request.args.getlist('driver', type=int)
+        driver_ids += [int(i) for i in request.args.get('drivers', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify(message='driver ids must be integers'), 400
+    driver_ids = list(dict.fromkeys(driver_ids))
+    if not driver_ids or len(driver_ids) > 20:
+        return jsonify(message='track between 1 and 20 drivers'), 400
+
+    # Subscribe before reading current positions so no update falls in between
+    subscription = subscribe_to_drivers(driver_ids)
+    initial = []
+    for driver_id in driver_ids:
+        info = track_driver(current_user.id, driver_id)
+        if info:
+            initial.append(format_sse('location', {
+                'driverID': driver_id,
+                'latitude': info['currentLocation']['latitude'],
+                'longitude': info['currentLocation']['longitude'],
+                'timestamp': None
+            }))
+    keepalive = current_app.config['TRACKING_KEEPALIVE_SECONDS']
+
+    def stream():
+        try:
+            yield from initial
+            while True:
+                frame = subscription.next_frame(keepalive)
+                yield frame if frame is not None else b': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
+
+@driver_views.route('/api/drivers/location-buffer', methods=['GET'])
+@jwt_required()
+def location_buffer_stats_action():
+    return jsonify(get_location_buffer_stats())
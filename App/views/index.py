@@ -1,5 +1,9 @@
-from flask import Blueprint, redirect, render_template, request, send_from_directory, jsonify
-from App.controllers import create_user, initialize
+from flask import Blueprint, Response, redirect, render_template, request, send_from_directory, jsonify
+from flask_jwt_extended import jwt_required
+from App.controllers import create_user, initialize, get_notification_stats
+from App.metrics import query_stats
+from App.response_cache import response_cache
+from App.jobs import job_queue
 
 index_views = Blueprint('index_views', __name__, template_folder='../templates')
 
@@ -14,4 +18,28 @@ def init():
 
 @index_views.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status':'healthy'})
\ No newline at end of file
+    return jsonify({'status':'healthy'})
+
+@index_views.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(query_stats.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@index_views.route('/api/query-stats', methods=['GET'])
+@jwt_required()
+def query_stats_action():
+    return jsonify(query_stats.get_stats())
+
+@index_views.route('/api/response-cache', methods=['GET'])
+@jwt_required()
+def response_cache_action():
+    return jsonify(response_cache.get_stats())
+
+@index_views.route('/api/jobs', methods=['GET'])
+@jwt_required()
+def jobs_action():
+    return jsonify(job_queue.get_stats())
+
+@index_views.route('/api/notifications/stats', methods=['GET'])
+@jwt_required()
+def notification_stats_action():
+    return jsonify(get_notification_stats())
@@ -0,0 +1,85 @@
+import json, math
+from datetime import date, datetime, timezone
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required, current_user
+
+from App.controllers import (
+    get_route_etas,
+    get_stop_eta,
+    get_daily_summary,
+    can_view_route_path,
+    iter_route_path
+)
+
+route_views = Blueprint('route_views', __name__, template_folder='../templates')
+
+'''
+API Routes
+'''
+
+@route_views.route('/api/routes/summary', methods=['GET'])
+@jwt_required()
+def route_summary_action():
+    try:
+        drive_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if 'date' in request.args else date.today()
+    except ValueError:
+        return jsonify(message='date must be YYYY-MM-DD'), 400
+    summary = get_daily_summary(drive_date)
+    if summary is None:
+        return jsonify(message='summary unavailable'), 500
+    return jsonify(summary)
+
+@route_views.route('/api/routes/<int:route_id>/eta', methods=['GET'])
+@jwt_required()
+def route_eta_action(route_id):
+    etas = get_route_etas(route_id)
+    if etas is None:
+        return jsonify(message='route not found'), 404
+    if 'error' in etas:
+        return jsonify(message=etas['error']), 409
+    return jsonify(etas)
+
+@route_views.route('/api/stops/<int:stop_id>/eta', methods=['GET'])
+@jwt_required()
+def stop_eta_action(stop_id):
+    eta = get_stop_eta(stop_id, current_user.id)
+    if eta is None:
+        return jsonify(message='stop not found'), 404
+    if 'error' in eta:
+        return jsonify(message=eta['error']), 409
+    return jsonify(eta)
+
+@route_views.route('/api/routes/<int:route_id>/path', methods=['GET'])
+@jwt_required()
+def route_path_action(route_id):
+    """Recorded pings as NDJSON lines of {t, lat, lng}; from/to are epoch seconds or ISO-8601 (UTC)"""
+    try:
+        start, end = (_parse_timestamp(request.args.get(name)) for name in ('from', 'to'))
+    except ValueError:
+        return jsonify(message='from and to must be epoch seconds or ISO-8601'), 400
+    if not can_view_route_path(route_id, current_user.id):
+        return jsonify(message='route not found'), 404
+    lines = (
+        json.dumps({'t': t, 'lat': lat, 'lng': lng}) + '\n'
+        for t, lat, lng in iter_route_path(route_id, start, end)
+    )
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        timestamp = float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    if not math.isfinite(timestamp):
+        raise ValueError('timestamp must be finite')
+    try:
+        datetime.fromtimestamp(timestamp, timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError('timestamp out of range')
+    return timestamp
@@ -1,12 +1,16 @@
-from flask import Blueprint, render_template, jsonify, request, send_from_directory, flash, redirect, url_for
+import json
+
+from flask import Blueprint, Response, render_template, jsonify, request, send_from_directory, flash, redirect, url_for, stream_with_context
 from flask_jwt_extended import jwt_required, current_user as jwt_current_user
 
 from.index import index_views
 
+from App.response_cache import versioned
 from App.controllers import (
     create_user,
     get_all_users,
     get_all_users_json,
+    iter_users_json,
     jwt_required
 )
 
@@ -25,9 +29,23 @@ def create_user_action():
     return redirect(url_for('user_views.get_user_page'))
 
 @user_views.route('/api/users', methods=['GET'])
+@versioned('drivers', 'residents')
 def get_users_action():
-    users = get_all_users_json()
-    return jsonify(users)
+    after_id = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, 1000))
+    ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+    if ndjson:
+        lines = (json.dumps(user) + '\n' for user in iter_users_json(after_id, limit))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    users = get_all_users_json(after_id, limit)
+    response = jsonify(users)
+    if limit and len(users) == limit:
+        # Clients pass this back as ?after= to fetch the next page
+        response.headers['X-Next-Cursor'] = str(users[-1]['userID'])
+    return response
 
 @user_views.route('/api/users', methods=['POST'])
 def create_user_endpoint():
@@ -0,0 +1,102 @@
+'''
+Location history benchmark.
+
+Simulates drivers pinging every two seconds along a random walk on their
+active routes, stores the pings as packed segments through LocationHistory
+and, for comparison, as one row per ping in a plain table, then prints the
+bytes each takes in the SQLite file and how fast a route's path and a
+ten-minute window are replayed.
+
+    python -m benchmarks.location_history
+    python -m benchmarks.location_history --routes 20 --pings 20000
+'''
+import argparse, os, random, tempfile, time
+
+import sqlalchemy as sa
+from flask_migrate import upgrade
+
+from App.main import create_app
+from App.database import db, get_migrate
+from App.models import Route
+from App.controllers.history import location_history, iter_route_path
+from benchmarks.query_plans import MIGRATIONS, seed
+
+
+def table_bytes(name):
+    # dbstat is compiled into most SQLite builds; fall back to the file size difference
+    try:
+        return db.session.scalar(sa.text('SELECT SUM(pgsize) FROM dbstat WHERE name = :name'), {'name': name}) or 0
+    except Exception:
+        db.session.rollback()
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', type=int, default=10)
+    parser.add_argument('--pings', type=int, default=10000, help='pings per route')
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        get_migrate(app)
+        upgrade(directory=MIGRATIONS)
+        seed(drivers=args.routes, residents=10, routes_per_driver=1, streets_per_route=1, stops_per_street=1)
+        db.session.execute(sa.update(Route).values(status='active'))
+        db.session.execute(sa.text('CREATE TABLE location_pings ("routeID" INTEGER, t FLOAT, lat FLOAT, lng FLOAT)'))
+        db.session.execute(sa.text('CREATE INDEX ix_location_pings ON location_pings ("routeID", t)'))
+        db.session.commit()
+        routes = db.session.execute(sa.select(Route.driverID, Route.routeID)).all()
+
+        rng = random.Random(7)
+        start = time.time() - args.pings * 2
+        naive_seconds = packed_seconds = 0.0
+        for driver_id, route_id in routes:
+            lat, lng = 10.6 + rng.random() / 10, -61.4 - rng.random() / 10
+            rows = []
+            for i in range(args.pings):
+                lat += rng.gauss(0, 0.00005)
+                lng += rng.gauss(0, 0.00005)
+                rows.append({'routeID': route_id, 't': start + i * 2, 'lat': lat, 'lng': lng})
+            started = time.perf_counter()
+            for row in rows:
+                location_history.record(driver_id, row['lat'], row['lng'], row['t'])
+            location_history.flush()
+            packed_seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            db.session.execute(sa.text('INSERT INTO location_pings VALUES (:routeID, :t, :lat, :lng)'), rows)
+            db.session.commit()
+            naive_seconds += time.perf_counter() - started
+
+        total = args.routes * args.pings
+        for label, tables, seconds in (
+            ('row per ping', ['location_pings', 'ix_location_pings'], naive_seconds),
+            ('packed segments', ['location_segments', 'ix_location_segments_routeID_startedAt'], packed_seconds),
+        ):
+            sizes = [table_bytes(name) for name in tables]
+            size = sum(sizes) if None not in sizes else None
+            per_ping = f'{size / total:6.1f} bytes/ping' if size is not None else 'size unavailable'
+            print(f'{label:16} {per_ping}  written in {seconds:6.2f} s')
+        stats = location_history.get_stats()
+        print(f'sealed segments: {stats["sealed_bytes_per_point"]:.2f} bytes/ping of data, '
+              f'{stats["compression_ratio"]:.1f}x zlib on top of delta packing')
+
+        route_id = routes[0][1]
+        started = time.perf_counter()
+        points = sum(1 for _ in iter_route_path(route_id))
+        full_ms = (time.perf_counter() - started) * 1000
+        window_start = start + args.pings  # the middle of the route
+        started = time.perf_counter()
+        window = sum(1 for _ in iter_route_path(route_id, window_start, window_start + 600))
+        window_ms = (time.perf_counter() - started) * 1000
+        print(f'replay whole route: {points} pings in {full_ms:.1f} ms; ten-minute window: {window} pings in {window_ms:.1f} ms')
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Login throughput benchmark.
+
+Runs concurrent logins from gevent greenlets, the way a gevent gunicorn
+worker serves them, first with password hashing inline and then on the
+native hashing pool. Prints logins per second and the longest time a
+heartbeat greenlet was kept waiting, which is how long the worker could not
+serve any other request.
+
+    python -m benchmarks.login_throughput --concurrency 50 --logins 200
+'''
+from gevent import monkey
+monkey.patch_all()
+
+import argparse, os, tempfile, time
+
+import gevent
+from gevent.pool import Pool
+from sqlalchemy import insert
+
+from App.main import create_app
+from App.database import db, create_db
+from App.hashing import password_hasher
+from App.models import User, Driver
+from App.controllers import login
+
+
+def seed(users, password):
+    password_hash = password_hasher.hash(password)
+    db.session.execute(insert(User.__table__), [
+        {'userID': i, 'userName': f'bench{i}', 'password': password_hash, 'user_type': 'driver'}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(insert(Driver.__table__), [{'userID': i} for i in range(1, users + 1)])
+    db.session.commit()
+
+
+def run(app, users, logins, concurrency, workers, password):
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    password_hasher.init_app(app)
+    password_hasher.needs_rehash('')  # warm the method lookup outside the timing
+    longest_stall = [0.0]
+    running = [True]
+
+    def heartbeat():
+        last = time.perf_counter()
+        while running[0]:
+            gevent.sleep(0.001)
+            now = time.perf_counter()
+            longest_stall[0] = max(longest_stall[0], now - last)
+            last = now
+
+    def one_login(i):
+        with app.app_context():
+            try:
+                assert login(f'bench{i % users + 1}', password)
+            finally:
+                db.session.remove()
+
+    monitor = gevent.spawn(heartbeat)
+    started = time.perf_counter()
+    Pool(concurrency).map(one_login, range(logins))
+    elapsed = time.perf_counter() - started
+    running[0] = False
+    monitor.join()
+    return logins / elapsed, longest_stall[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4, help='hashing pool size to compare against inline')
+    parser.add_argument('--method', default=None, help='hash method, e.g. scrypt or pbkdf2:sha256:600000')
+    args = parser.parse_args()
+
+    handle, scratch = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    overrides = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{scratch}'}
+    if args.method:
+        overrides['PASSWORD_HASH_METHOD'] = args.method
+    app = create_app(overrides)
+    try:
+        create_db()
+        seed(args.users, 'benchpass')
+        print(f'{args.logins} logins, {args.concurrency} concurrent, method {app.config["PASSWORD_HASH_METHOD"]}')
+        for label, workers in (('inline', 0), (f'pool of {args.workers}', args.workers)):
+            rate, stall = run(app, args.users, args.logins, args.concurrency, workers, 'benchpass')
+            print(f'{label:>12}: {rate:8.1f} logins/s, longest event loop stall {stall:8.1f} ms')
+    finally:
+        db.session.remove()
+        os.remove(scratch)
+
+
+if __name__ == '__main__':
+    main()
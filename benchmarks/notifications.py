@@ -0,0 +1,91 @@
+'''
+Notification fan-out benchmark.
+
+Seeds one route with thousands of stops, where most residents have stops
+on several of its streets, then times telling every resident the van is
+coming two ways: the naive loop over route.streets and street.stops that
+lazy-loads each resident, and Notifier.notify_route_active, which reads
+the recipients with one join and sends one notification per resident in
+batches. Both write to the same sink.
+
+    python -m benchmarks.notifications
+    python -m benchmarks.notifications --streets 400 --stops-per-street 50 --sink sqlite
+'''
+import argparse, os, tempfile, time
+from datetime import datetime
+
+from flask_migrate import upgrade
+
+from App.main import create_app
+from App.database import db, get_migrate
+from App.models import Route
+from App.controllers.notifications import FileSink, SQLiteSink, notifier
+from benchmarks.query_plans import MIGRATIONS, capture_statements, seed
+
+
+class NullSink:
+
+    def write(self, notifications):
+        pass
+
+
+def naive_fanout(route_id, sink):
+    route = db.session.get(Route, route_id)
+    notifications = []
+    for street in route.streets:
+        for stop in street.stops:
+            if stop.stopStatus in ('requested', 'confirmed'):
+                resident = stop.resident
+                notifications.append({'kind': 'route_active', 'routeID': route_id, 'residentID': resident.userID,
+                                      'message': f'{resident.residentName}, the bread van is on its way to {street.streetName}',
+                                      'createdAt': datetime.now().isoformat()})
+    sink.write(notifications)
+    return len(notifications)
+
+
+def make_sink(kind, directory):
+    if kind == 'file':
+        return FileSink(os.path.join(directory, 'notifications.jsonl'))
+    if kind == 'sqlite':
+        return SQLiteSink(os.path.join(directory, 'notifications.db'))
+    return NullSink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streets', type=int, default=200)
+    parser.add_argument('--stops-per-street', type=int, default=25)
+    parser.add_argument('--residents', type=int, default=1500)
+    parser.add_argument('--sink', choices=['null', 'file', 'sqlite'], default='file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    get_migrate(app)
+    upgrade(directory=MIGRATIONS)
+    seed(drivers=1, residents=args.residents, routes_per_driver=1,
+         streets_per_route=args.streets, stops_per_street=args.stops_per_street)
+    route_id = db.session.scalar(db.select(Route.routeID))
+    print(f'route with {args.streets * args.stops_per_street} stops, {args.sink} sink\n')
+
+    for label, run in (
+        ('naive lazy-loading loop', lambda: naive_fanout(route_id, make_sink(args.sink, directory))),
+        ('batched join + dedupe', lambda: notifier.notify_route_active(route_id)),
+    ):
+        notifier.sink = make_sink(args.sink, directory)
+        db.session.remove()
+        started = time.perf_counter()
+        result = []
+        statements = capture_statements(lambda: result.append(run()))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        sent = result[0] if isinstance(result[0], int) else result[0]['recipients']
+        print(f'{label:26} {elapsed_ms:9.1f} ms  {len(statements):6} statements  {sent:6} notifications')
+
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+'''
+Query plan benchmark for the hot lookup paths.
+
+Seeds a scratch database at the schema revision before the index migration,
+prints the EXPLAIN plan and latency of each controller's SQL, then upgrades
+to the index migration and prints them again.
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --database-url postgresql://localhost/breadvan_bench
+
+The database is dropped back to an empty schema afterwards, so never point
+--database-url at a database you care about.
+'''
+import argparse, os, random, statistics, tempfile, time
+from datetime import date, time as dtime, timedelta
+
+from flask_migrate import upgrade, downgrade
+from sqlalchemy import event, insert
+
+from App.main import create_app
+from App.database import db, get_migrate
+from App.models import User, Driver, Resident, Route, Street, Stop
+from App.controllers import request_stop, get_active_routes, get_routes_by_driver, view_stops
+
+
+BEFORE_INDEXES = '8dabdbd6739e'
+AFTER_INDEXES = 'b5151cded0ac'
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def seed(drivers, residents, routes_per_driver, streets_per_route, stops_per_street, batch=5000, password_hash='x'):
+    rng = random.Random(42)
+    driver_ids = list(range(1, drivers + 1))
+    resident_ids = list(range(drivers + 1, drivers + residents + 1))
+    db.session.execute(insert(User.__table__), [
+        {'userID': i, 'userName': f'driver{i}', 'password': password_hash, 'user_type': 'driver'} for i in driver_ids
+    ] + [
+        {'userID': i, 'userName': f'resident{i}', 'password': password_hash, 'user_type': 'resident'} for i in resident_ids
+    ])
+    db.session.execute(insert(Driver.__table__), [{'userID': i} for i in driver_ids])
+    db.session.execute(insert(Resident.__table__), [
+        {'userID': i, 'residentName': f'Resident {i}', 'residentAddress': f'{i} Main St', 'residentPhone': 8680000000 + i}
+        for i in resident_ids
+    ])
+    routes, streets, stops = [], [], []
+    route_id = street_id = 0
+    for driver_id in driver_ids:
+        for day in range(routes_per_driver):
+            route_id += 1
+            status = rng.choices(['completed', 'scheduled', 'active'], weights=[90, 9, 1])[0]
+            routes.append({'routeID': route_id, 'driverID': driver_id, 'driveDate': date(2024, 1, 1) + timedelta(days=day),
+                           'driveTime': dtime(8, 0), 'status': status})
+            for _ in range(streets_per_route):
+                street_id += 1
+                streets.append({'streetID': street_id, 'routeID': route_id, 'streetName': f'Street {street_id}',
+                                'streetLocation': f'{10 + rng.random():.5f},{-61 - rng.random():.5f}'})
+                for resident_id in rng.sample(resident_ids, stops_per_street):
+                    stops.append({'residentID': resident_id, 'streetID': street_id, 'stopTime': dtime(9, 0),
+                                  'stopStatus': 'requested'})
+    for table, rows in ((Route.__table__, routes), (Street.__table__, streets), (Stop.__table__, stops)):
+        for start in range(0, len(rows), batch):
+            db.session.execute(insert(table), rows[start:start + batch])
+    db.session.commit()
+    return rng.choice(driver_ids), stops[len(stops) // 2]
+
+
+def capture_statements(fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def explain(statement, parameters):
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+    if db.engine.dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def report(label, cases, repeat):
+    print(f'\n=== {label} ===')
+    for name, fn in cases:
+        db.session.expunge_all()
+        statements = capture_statements(fn)
+        median, p95 = measure(fn, repeat)
+        print(f'\n{name}: median {median:.3f} ms, p95 {p95:.3f} ms, {len(statements)} statement(s)')
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            for line in explain(statement, parameters):
+                print(f'    {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None, help='scratch database (default: temporary SQLite file)')
+    parser.add_argument('--drivers', type=int, default=100)
+    parser.add_argument('--residents', type=int, default=2000)
+    parser.add_argument('--routes-per-driver', type=int, default=50)
+    parser.add_argument('--streets-per-route', type=int, default=5)
+    parser.add_argument('--stops-per-street', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    scratch = None
+    url = args.database_url
+    if url is None:
+        handle, scratch = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        url = f'sqlite:///{scratch}'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url})
+    get_migrate(app)
+    try:
+        upgrade(directory=MIGRATIONS, revision=BEFORE_INDEXES)
+        print('Seeding...')
+        driver_id, stop = seed(args.drivers, args.residents, args.routes_per_driver,
+                               args.streets_per_route, args.stops_per_street)
+        cases = [
+            ('request_stop (duplicate check)', lambda: request_stop(stop['residentID'], stop['streetID'], stop['stopTime'])),
+            ('get_active_routes', get_active_routes),
+            ('get_routes_by_driver', lambda: list(get_routes_by_driver(driver_id))),
+            ('view_stops (first page)', lambda: view_stops(driver_id, limit=50)),
+        ]
+        report(f'before {BEFORE_INDEXES}', cases, args.repeat)
+        upgrade(directory=MIGRATIONS, revision=AFTER_INDEXES)
+        report(f'after {AFTER_INDEXES}', cases, args.repeat)
+    finally:
+        db.session.remove()
+        downgrade(directory=MIGRATIONS, revision='base')
+        if scratch:
+            os.remove(scratch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+SQLite concurrency benchmark.
+
+Starts several worker processes against one seeded SQLite file, the way
+gunicorn runs the app, and has each mix driver location writes with
+view_stops reads for a fixed time. It runs once with SQLite's defaults
+(rollback journal, synchronous=FULL, no busy timeout) and once with the
+pragmas the app applies, then prints reads and writes per second and how
+many calls failed because the database was locked.
+
+    python -m benchmarks.sqlite_concurrency
+    python -m benchmarks.sqlite_concurrency --workers 8 --seconds 10 --write-ratio 0.5
+'''
+import argparse, multiprocessing, os, random, tempfile, time
+
+from flask_migrate import upgrade
+
+from App.main import create_app
+from App.database import db, get_migrate
+from App.controllers import update_driver_location, view_stops
+from benchmarks.query_plans import MIGRATIONS, seed
+
+
+DRIVERS = 50
+
+MODES = [
+    ('rollback journal (SQLite defaults)', {
+        'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_BUSY_TIMEOUT_MS': 0, 'SQLITE_MMAP_SIZE': 0,
+    }),
+    ('WAL + synchronous=NORMAL + busy_timeout + mmap', {}),
+]
+
+
+def prepare(path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    get_migrate(app)
+    upgrade(directory=MIGRATIONS)
+    seed(drivers=DRIVERS, residents=1000, routes_per_driver=20, streets_per_route=5, stops_per_street=2)
+    db.session.remove()
+    db.engine.dispose()
+
+
+def worker(path, overrides, seconds, write_ratio, seed_value, results):
+    # sqlite3's own busy wait would hide the journal mode's locking
+    overrides = dict(overrides, SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 0}})
+    create_app(dict(overrides, SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}'))
+    rng = random.Random(seed_value)
+    counts = {'reads': 0, 'writes': 0, 'failed_reads': 0, 'failed_writes': 0}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        driver_id = rng.randint(1, DRIVERS)
+        if rng.random() < write_ratio:
+            ok = update_driver_location(driver_id, 10 + rng.random(), -61 - rng.random()) is not None
+            counts['writes' if ok else 'failed_writes'] += 1
+        else:
+            ok = len(view_stops(driver_id, limit=50)) > 0
+            counts['reads' if ok else 'failed_reads'] += 1
+        db.session.remove()
+    results.put(counts)
+
+
+def run(path, overrides, workers, seconds, write_ratio):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(path, overrides, seconds, write_ratio, n, results))
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    totals = {'reads': 0, 'writes': 0, 'failed_reads': 0, 'failed_writes': 0}
+    for _ in processes:
+        for key, value in results.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    try:
+        prepare(path)
+        for label, overrides in MODES:
+            totals = run(path, overrides, args.workers, args.seconds, args.write_ratio)
+            print(f'\n{label}')
+            print(f'  reads:  {totals["reads"] / args.seconds:8.1f}/s, {totals["failed_reads"]} failed')
+            print(f'  writes: {totals["writes"] / args.seconds:8.1f}/s, {totals["failed_writes"]} failed')
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Startup benchmark.
+
+Every flask command imports wsgi.py, which builds the app before the
+command runs, so that cost is paid by every one-line CLI call. For each
+command this starts fresh interpreters and reports the medians of:
+
+    imports  importing the App package (models, controllers, views)
+    factory  create_app() as wsgi.py calls it for that command
+    wsgi     the whole wsgi.py import, including both of the above
+    total    running `flask <command>` end to end
+
+The "gunicorn" row imports wsgi.py the way a web worker does, with the
+full web setup. Commands run against a scratch SQLite database.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --command "route summary"
+'''
+import argparse, json, os, shlex, statistics, subprocess, sys, tempfile, time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    'gunicorn',
+    '--help',
+    'user list json',
+    'driver update-location 1 10.65 -61.5',
+    'route summary',
+    'routes',
+]
+
+# Runs in the child: times the imports and the factory separately, then the rest of wsgi.py
+PROBE = '''
+import json, sys, time
+sys.argv = json.loads(sys.argv[1])
+started = time.perf_counter()
+import App.main
+imported = time.perf_counter()
+timings = {'imports': imported - started}
+create_app = App.main.create_app
+def timed_create_app(*args, **kwargs):
+    factory_started = time.perf_counter()
+    app = create_app(*args, **kwargs)
+    timings['factory'] = time.perf_counter() - factory_started
+    return app
+App.main.create_app = timed_create_app
+import wsgi
+timings['wsgi'] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+
+def probe(argv, env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, json.dumps(argv)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_command(args, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'flask'] + args, cwd=ROOT, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def measure(command, repeat, env):
+    if command == 'gunicorn':
+        argv, args = ['gunicorn', 'wsgi:app'], None
+    else:
+        args = shlex.split(command)
+        argv = [os.path.join(os.path.dirname(sys.executable), 'flask')] + args
+    samples = {'imports': [], 'factory': [], 'wsgi': [], 'total': []}
+    for _ in range(repeat):
+        for key, value in probe(argv, env).items():
+            samples[key].append(value)
+        if args is not None:
+            samples['total'].append(run_command(args, env))
+    return {key: statistics.median(values) * 1000 if values else None for key, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--command', action='append', help='flask command to time, repeatable')
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    env = dict(os.environ, FLASK_APP='wsgi', FLASK_SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    try:
+        subprocess.run([sys.executable, '-m', 'flask', 'db', 'upgrade'], cwd=ROOT, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        print(f'{"command":40} {"imports":>9} {"factory":>9} {"wsgi":>9} {"total":>9}  (median ms)')
+        for command in args.command or COMMANDS:
+            result = measure(command, args.repeat, env)
+            cells = ''.join(f' {value:9.1f}' if value is not None else f' {"-":>9}' for value in result.values())
+            print(f'{command:40}{cells}')
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+'''
+Controller benchmark suite.
+
+Seeds a scratch database at each dataset size, times the controller hot
+paths and writes the results as JSON. When a baseline file exists the
+medians are compared against it and any case slower than the tolerance
+is reported as a regression.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --size small --size large --repeat 50
+    python -m benchmarks.suite --database-url postgresql://localhost/breadvan_bench
+    python -m benchmarks.suite --save-baseline
+
+The same run is available as `flask test bench`. A temporary SQLite file is
+always benchmarked; every --database-url is benchmarked as well and is
+dropped back to an empty schema afterwards, so never point it at a database
+you care about.
+'''
+import argparse, json, os, platform, random, statistics, sys, tempfile, time
+from datetime import date, time as dtime, timedelta
+
+import sqlalchemy
+from flask_migrate import upgrade, downgrade
+from sqlalchemy.engine import make_url
+
+from App.main import create_app
+from App.database import db, get_migrate
+from App.hashing import password_hasher
+from App.models import Stop
+from App.controllers import (
+    schedule_route, request_stop, cancel_stop, view_stops, track_driver,
+    update_driver_location, get_all_users_json, login
+)
+from benchmarks.query_plans import MIGRATIONS, seed
+
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARKS, 'results.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS, 'baseline.json')
+PASSWORD = 'benchpass'
+WARMUP = 3
+
+SIZES = {
+    'small': {'drivers': 10, 'residents': 200, 'routes_per_driver': 10, 'streets_per_route': 5, 'stops_per_street': 2},
+    'medium': {'drivers': 50, 'residents': 2000, 'routes_per_driver': 30, 'streets_per_route': 5, 'stops_per_street': 2},
+    'large': {'drivers': 200, 'residents': 10000, 'routes_per_driver': 60, 'streets_per_route': 5, 'stops_per_street': 2},
+}
+
+
+class Dataset:
+    """Ids and helpers for the rows seed() created."""
+
+    def __init__(self, drivers, residents, **counts):
+        self.driver_ids = list(range(1, drivers + 1))
+        self.resident_ids = list(range(drivers + 1, drivers + residents + 1))
+        self.rng = random.Random(7)
+
+    def driver(self, i):
+        return self.driver_ids[i % len(self.driver_ids)]
+
+    def resident(self, i):
+        return self.resident_ids[i % len(self.resident_ids)]
+
+
+# Each case receives the dataset and the number of calls it will be timed
+# for, does any untimed setup, and returns the call to time for call i.
+
+def bench_view_stops(data, count):
+    return lambda i: view_stops(data.driver(i), limit=50)
+
+
+def bench_track_driver(data, count):
+    return lambda i: track_driver(data.resident(i), data.driver(i))
+
+
+def bench_get_all_users_json(data, count):
+    return lambda i: get_all_users_json()
+
+
+def bench_login(data, count):
+    return lambda i: login(f'resident{data.resident(i)}', PASSWORD)
+
+
+def bench_update_driver_location(data, count):
+    return lambda i: update_driver_location(
+        data.driver(i), 10 + data.rng.random(), -61 - data.rng.random()
+    )
+
+
+def bench_schedule_route(data, count):
+    start = date(2030, 1, 1)
+    streets = [(f'Bench Street {n}', f'10.{n:05d},-61.{n:05d}') for n in range(3)]
+    return lambda i: schedule_route(data.driver(i), start + timedelta(days=i), dtime(8, 0), streets)
+
+
+def bench_request_stop(data, count):
+    # Fresh streets so every request is new rather than a duplicate
+    route = schedule_route(data.driver_ids[0], date(2031, 1, 1), dtime(8, 0),
+                           [(f'Request Street {n}', '') for n in range(count)])
+    street_ids = [street.streetID for street in route.streets]
+    return lambda i: request_stop(data.resident(i), street_ids[i], dtime(9, 0))
+
+
+def bench_cancel_stop(data, count):
+    stops = db.session.execute(
+        db.select(Stop.stopID, Stop.residentID).filter(Stop.stopStatus == 'requested')
+        .order_by(Stop.stopID).limit(count)
+    ).all()
+    return lambda i: cancel_stop(stops[i].residentID, stops[i].stopID)
+
+
+# Read-only cases first so the writes do not change what they read
+CASES = [
+    ('view_stops', bench_view_stops),
+    ('track_driver', bench_track_driver),
+    ('get_all_users_json', bench_get_all_users_json),
+    ('login', bench_login),
+    ('update_driver_location', bench_update_driver_location),
+    ('schedule_route', bench_schedule_route),
+    ('request_stop', bench_request_stop),
+    ('cancel_stop', bench_cancel_stop),
+]
+
+
+def time_case(make, data, repeat):
+    fn = make(data, WARMUP + repeat)
+    timings = []
+    for i in range(WARMUP + repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        fn(i)
+        if i >= WARMUP:
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'iterations': repeat,
+        'median_ms': round(statistics.median(timings), 4),
+        'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 4),
+        'mean_ms': round(statistics.fmean(timings), 4),
+        'ops_per_sec': round(1000 / statistics.fmean(timings), 1),
+    }
+
+
+def database_label(url):
+    return make_url(url).get_backend_name()
+
+
+def run_database(url, sizes, repeat, cases=None, log=print):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url})
+    get_migrate(app)
+    label = database_label(url)
+    results = []
+    with app.app_context():
+        password_hash = password_hasher.hash(PASSWORD)
+        for size in sizes:
+            try:
+                upgrade(directory=MIGRATIONS)
+                log(f'[{label}/{size}] seeding {SIZES[size]}')
+                seed(**SIZES[size], password_hash=password_hash)
+                data = Dataset(**SIZES[size])
+                for name, make in CASES:
+                    if cases and name not in cases:
+                        continue
+                    result = time_case(make, data, repeat)
+                    log(f'[{label}/{size}] {name}: median {result["median_ms"]:.3f} ms, '
+                        f'p95 {result["p95_ms"]:.3f} ms')
+                    results.append(dict(database=label, size=size, case=name, **result))
+            finally:
+                db.session.remove()
+                downgrade(directory=MIGRATIONS, revision='base')
+        db.engine.dispose()
+    return results
+
+
+def run_suite(sizes=('small', 'medium'), database_urls=(), repeat=30, cases=None, log=print):
+    """Benchmark every size on a scratch SQLite file and each extra database."""
+    handle, scratch = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    results = []
+    try:
+        for url in [f'sqlite:///{scratch}'] + list(database_urls):
+            results.extend(run_database(url, sizes, repeat, cases, log))
+    finally:
+        os.remove(scratch)
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'sizes': {size: SIZES[size] for size in sizes},
+        },
+        'results': results
+    }
+
+
+def compare(report, baseline, tolerance=0.25):
+    """
+    Pair each result with the baseline result for the same database, size
+    and case. Returns one row per pair with the median ratio and whether it
+    is more than tolerance slower than the baseline.
+    """
+    previous = {(r['database'], r['size'], r['case']): r for r in baseline.get('results', [])}
+    rows = []
+    for result in report['results']:
+        before = previous.get((result['database'], result['size'], result['case']))
+        if before is None or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        rows.append({
+            'database': result['database'],
+            'size': result['size'],
+            'case': result['case'],
+            'baseline_ms': before['median_ms'],
+            'median_ms': result['median_ms'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + tolerance
+        })
+    return rows
+
+
+def load_json(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def write_json(path, data):
+    with open(path, 'w') as handle:
+        json.dump(data, handle, indent=2)
+        handle.write('\n')
+
+
+def print_comparison(rows, tolerance):
+    print(f'\n{"database":<10} {"size":<8} {"case":<24} {"baseline":>10} {"now":>10} {"ratio":>7}')
+    for row in rows:
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f'{row["database"]:<10} {row["size"]:<8} {row["case"]:<24} {row["baseline_ms"]:>8.3f}ms '
+              f'{row["median_ms"]:>8.3f}ms {row["ratio"]:>7.2f}{flag}')
+    regressions = sum(row['regression'] for row in rows)
+    print(f'\n{regressions} regression(s) beyond {tolerance:.0%} of {len(rows)} compared case(s)')
+    return regressions
+
+
+def bench(sizes, database_urls, repeat, cases, output, baseline_path, save_baseline, tolerance):
+    """Run the suite, write the results and compare them; returns the exit code."""
+    report = run_suite(sizes, database_urls, repeat, cases)
+    write_json(output, report)
+    print(f'\nResults written to {output}')
+    if save_baseline:
+        write_json(baseline_path, report)
+        print(f'Baseline saved to {baseline_path}')
+        return 0
+    baseline = load_json(baseline_path)
+    if baseline is None:
+        print(f'No baseline at {baseline_path}; rerun with --save-baseline to store one')
+        return 0
+    return 1 if print_comparison(compare(report, baseline, tolerance), tolerance) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', dest='sizes', action='append', choices=list(SIZES),
+                        help='dataset size, repeatable (default: small and medium)')
+    parser.add_argument('--database-url', dest='database_urls', action='append', default=[],
+                        help='extra scratch database to benchmark, repeatable')
+    parser.add_argument('--case', dest='cases', action='append', choices=[name for name, _ in CASES],
+                        help='only run this case, repeatable')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before a case is flagged')
+    args = parser.parse_args()
+    sys.exit(bench(args.sizes or ['small', 'medium'], args.database_urls, args.repeat, args.cases,
+                   args.output, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
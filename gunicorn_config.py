@@ -11,9 +11,20 @@ workers = 4
 # Use the 'gevent' worker type for async performance.
 worker_class = 'gevent'
 
+# Tell the app the worker model so it can size its database pool
+raw_env = [
+    f'FLASK_SERVER_WORKERS={workers}',
+    f'FLASK_SERVER_WORKER_CLASS={worker_class}',
+]
+
 # Log level
 loglevel = 'info'
 
 # Where to log to
 accesslog = '-'  # '-' means log to stdout
-errorlog = '-'  # '-' means log to stderr
\ No newline at end of file
+errorlog = '-'  # '-' means log to stderr
+
+# Flush buffered driver location pings before a worker exits
+def worker_exit(server, worker):
+    from App.controllers.location import location_buffer
+    location_buffer.drain()
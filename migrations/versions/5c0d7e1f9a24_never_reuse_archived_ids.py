@@ -0,0 +1,52 @@
+"""never reuse archived ids
+
+Revision ID: 5c0d7e1f9a24
+Revises: b2fcfe0ec540
+Create Date: 2026-10-18 02:41:37.512804
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0d7e1f9a24'
+down_revision = 'b2fcfe0ec540'
+branch_labels = None
+depends_on = None
+
+
+# Without AUTOINCREMENT SQLite hands out max(id) + 1, so archiving the newest
+# route frees its ID for the next one. Postgres sequences never go back.
+TABLES = [
+    ('routes', 'routeID', 'routes_archive'),
+    ('streets', 'streetID', 'streets_archive'),
+    ('stops', 'stopID', 'stops_archive'),
+    ('location_segments', 'segmentID', 'location_segments_archive'),
+]
+
+
+def _rebuild(autoincrement):
+    for table, _, _ in TABLES:
+        with op.batch_alter_table(table, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': autoincrement}):
+            pass
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild(True)
+    # Start each table past every ID already handed out, archived ones included
+    for table, column, archive in TABLES:
+        op.execute(f"DELETE FROM sqlite_sequence WHERE name = '{table}'")
+        op.execute(
+            f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', max(seq) FROM ("
+            f'SELECT coalesce(max("{column}"), 0) AS seq FROM {table} UNION ALL '
+            f'SELECT coalesce(max("{column}"), 0) FROM {archive})'
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild(False)
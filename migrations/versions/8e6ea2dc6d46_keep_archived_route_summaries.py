@@ -0,0 +1,34 @@
+"""keep archived route summaries
+
+Revision ID: 8e6ea2dc6d46
+Revises: 02f51c68e341
+Create Date: 2026-10-18 02:12:59.454160
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e6ea2dc6d46'
+down_revision = '02f51c68e341'
+branch_labels = None
+depends_on = None
+
+
+# The constraint was created unnamed: Postgres calls it route_summaries_routeID_fkey, and
+# SQLite needs a naming convention to find it while batch mode rebuilds the table
+FK_NAME = 'route_summaries_routeID_fkey'
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def upgrade():
+    with op.batch_alter_table('route_summaries', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(FK_NAME, type_='foreignkey')
+
+
+def downgrade():
+    # Summaries of archived routes have no route row to point at
+    op.execute('DELETE FROM route_summaries WHERE "routeID" NOT IN (SELECT "routeID" FROM routes)')
+    with op.batch_alter_table('route_summaries', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.create_foreign_key(FK_NAME, 'routes', ['routeID'], ['routeID'])
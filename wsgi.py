@@ -1,23 +1,49 @@
-import click, pytest, sys
+import click, os, sys
 from flask.cli import with_appcontext, AppGroup
 from datetime import datetime, date, time
 
 from App.database import db, get_migrate
 from App.models import Driver, Resident, Route, Street, Stop
 from App.main import create_app
+from App.jobs import enqueue, job_queue, run_workers
 from App.controllers import ( 
     create_user, get_all_users_json, get_all_users, initialize,
     create_driver, create_resident, get_all_drivers, get_all_residents,
     schedule_route, view_stops, update_route,
     view_driver, track_driver, request_stop, cancel_stop,
     get_routes_by_driver, get_stops_by_resident, add_street_to_route,
-    update_driver_location, get_active_routes
+    update_driver_location, get_active_routes,
+    schedule_routes_bulk, read_route_plan, nearest_drivers,
+    optimize_route, import_users, read_user_csv,
+    get_daily_summary, rebuild_route_summaries, archive_routes
 )
 
 
 # This commands file allow you to create convenient CLI commands for testing controllers
 
-app = create_app()
+# Commands that serve or inspect the web app; every other flask command skips web-only setup
+WEB_COMMANDS = {'run', 'routes', 'shell'}
+
+def cli_command(argv=None):
+    """
+    The flask subcommand this process was started with: '' when there is
+    none (e.g. flask --help) and None outside the flask CLI.
+    """
+    argv = sys.argv if argv is None else argv
+    program = os.path.normpath(argv[0]) if argv else ''
+    if os.path.basename(program) not in ('flask', 'flask.exe') and \
+            not program.endswith(os.path.join('flask', '__main__.py')):
+        return None
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in ('--app', '-A', '--env-file', '-e'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return ''
+
+command = cli_command()
+app = create_app(web=command is None or command in WEB_COMMANDS)
 migrate = get_migrate(app)
 
 # This command creates and initializes the database
@@ -56,6 +82,22 @@ def list_user_command(format):
 
 app.cli.add_command(user_cli) # add the group to the cli
 
+def run_user_import(user_type, path, chunk_size, processes, restart):
+    # Progress is kept beside the CSV so an interrupted import resumes where it stopped
+    checkpoint = f'{path}.progress'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    summary = import_users(user_type, read_user_csv(path), chunk_size, processes, checkpoint)
+    for failure in summary['failed']:
+        print(f'Row {failure["row"]} failed: {failure["error"]}')
+    if summary['resumedAfter']:
+        print(f'Resumed after row {summary["resumedAfter"]}')
+    print(f'{summary["imported"]} {user_type}s imported in {summary["seconds"]}s '
+          f'({summary["rowsPerSecond"]} rows/s), {summary["skipped"]} already existed, '
+          f'{len(summary["failed"])} rows failed')
+    if 'error' in summary:
+        print(f'Import stopped: {summary["error"]}; run the command again to resume')
+
 '''
 Driver Commands
 '''
@@ -97,14 +139,39 @@ def schedule_route_command(driver_id, date_str, time_str):
     except ValueError as e:
         print(f'Invalid date/time format: {e}')
 
+@driver_cli.command("schedule-bulk", help="Schedule many routes from a CSV or NDJSON plan file")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=500, type=int, help="Routes inserted per batch")
+def schedule_bulk_command(path, chunk_size):
+    summary = schedule_routes_bulk(read_route_plan(path), chunk_size=chunk_size)
+    if 'error' in summary:
+        print(f'Bulk scheduling failed: {summary["error"]}')
+        return
+    for failure in summary['failed']:
+        print(f'Row {failure["row"]} failed: {failure["error"]}')
+    print(f'{len(summary["created"])} routes scheduled, {len(summary["failed"])} rows failed')
+
 @driver_cli.command("view-stops", help="View stops for a driver")
 @click.argument("driver_id", type=int)
 @click.option("--route-id", default=None, type=int, help="Specific route ID")
-def view_stops_command(driver_id, route_id):
-    stops = view_stops(driver_id, route_id)
+@click.option("--from", "from_date", default=None, help="Earliest route date (YYYY-MM-DD)")
+@click.option("--to", "to_date", default=None, help="Latest route date (YYYY-MM-DD)")
+@click.option("--status", multiple=True, help="Stop status to include (repeatable)")
+@click.option("--after", default=None, type=int, help="Only show stops after this stop ID")
+@click.option("--limit", default=None, type=int, help="Maximum number of stops to show")
+def view_stops_command(driver_id, route_id, from_date, to_date, status, after, limit):
+    try:
+        start_date = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else None
+        end_date = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else None
+    except ValueError as e:
+        print(f'Invalid date format: {e}')
+        return
+    stops = view_stops(driver_id, route_id, start_date, end_date, status or None, after, limit)
     if stops:
         for stop in stops:
-            print(f'Stop ID: {stop.stopID}, Resident: {stop.residentID}, Time: {stop.stopTime}, Status: {stop.stopStatus}')
+            print(f'Stop ID: {stop.stopID}, Resident: {stop.residentID}, Date: {stop.street.route.driveDate}, Time: {stop.stopTime}, Status: {stop.stopStatus}')
+        if limit and len(stops) == limit:
+            print(f'More stops available: use --after {stops[-1].stopID}')
     else:
         print('No stops found')
 
@@ -134,6 +201,14 @@ def update_location_command(driver_id, lat, lng):
     else:
         print('Failed to update location')
 
+@driver_cli.command("import", help="Import drivers from a CSV file (username,password[,route,lat,lng])")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=500, type=int, help="Rows committed per batch")
+@click.option("--processes", default=None, type=int, help="Password hashing processes (default: one per CPU, 0 hashes inline)")
+@click.option("--restart", is_flag=True, help="Ignore the progress file and start from the first row")
+def import_drivers_command(path, chunk_size, processes, restart):
+    run_user_import('driver', path, chunk_size, processes, restart)
+
 app.cli.add_command(driver_cli)
 
 '''
@@ -189,6 +264,19 @@ def track_driver_command(resident_id, driver_id):
     else:
         print('Driver not found')
 
+@resident_cli.command("nearest-drivers", help="List the drivers closest to a point")
+@click.argument("lat", type=float)
+@click.argument("lng", type=float)
+@click.option("--radius", default=5.0, type=float, help="Search radius in kilometres")
+@click.option("--k", default=10, type=int, help="Maximum number of drivers")
+def nearest_drivers_command(lat, lng, radius, k):
+    drivers = nearest_drivers(lat, lng, radius, k)
+    if drivers:
+        for driver in drivers:
+            print(f'Driver ID: {driver["userID"]}, Location: ({driver["latitude"]}, {driver["longitude"]}), Distance: {driver["distanceKm"]} km')
+    else:
+        print('No drivers found nearby')
+
 @resident_cli.command("request-stop", help="Request a stop (time format: HH:MM)")
 @click.argument("resident_id", type=int)
 @click.argument("street_id", type=int)
@@ -220,14 +308,30 @@ def cancel_stop_command(resident_id, stop_id):
 
 @resident_cli.command("my-stops", help="View all stops for a resident")
 @click.argument("resident_id", type=int)
-def my_stops_command(resident_id):
-    stops = get_stops_by_resident(resident_id)
+@click.option("--from", "from_date", default=None, help="Earliest route date (YYYY-MM-DD); includes archived stops")
+@click.option("--to", "to_date", default=None, help="Latest route date (YYYY-MM-DD); includes archived stops")
+def my_stops_command(resident_id, from_date, to_date):
+    try:
+        start_date = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else None
+        end_date = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else None
+    except ValueError as e:
+        print(f'Invalid date format: {e}')
+        return
+    stops = get_stops_by_resident(resident_id, start_date, end_date)
     if stops:
         for stop in stops:
             print(f'Stop ID: {stop.stopID}, Street: {stop.streetID}, Time: {stop.stopTime}, Status: {stop.stopStatus}')
     else:
         print('No stops found')
 
+@resident_cli.command("import", help="Import residents from a CSV file (username,password,name,address,phone)")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=500, type=int, help="Rows committed per batch")
+@click.option("--processes", default=None, type=int, help="Password hashing processes (default: one per CPU, 0 hashes inline)")
+@click.option("--restart", is_flag=True, help="Ignore the progress file and start from the first row")
+def import_residents_command(path, chunk_size, processes, restart):
+    run_user_import('resident', path, chunk_size, processes, restart)
+
 app.cli.add_command(resident_cli)
 
 '''
@@ -266,8 +370,126 @@ def list_streets_command():
     else:
         print('No streets found')
 
+@route_cli.command("optimize", help="Suggest a short visit order for a route's streets")
+@click.argument("route_id", type=int)
+@click.option("--budget-ms", default=50, type=int, help="Time budget for the 2-opt pass")
+@click.option("--only-with-stops", is_flag=True, help="Skip streets without requested stops")
+def optimize_route_command(route_id, budget_ms, only_with_stops):
+    plan = optimize_route(route_id, budget_ms, only_with_stops)
+    if not plan:
+        print('Route not found')
+        return
+    for position, visit in enumerate(plan['visits'], start=1):
+        leg = f'{visit["legKm"]} km' if visit['legKm'] is not None else 'no coordinates'
+        print(f'{position}. Street ID: {visit["streetID"]}, Name: {visit["streetName"]}, Leg: {leg}, Stops: {len(visit["stops"])}')
+    print(f'Total: {plan["distanceKm"]} km (entered order: {plan["originalDistanceKm"]} km), computed in {plan["elapsedMs"]} ms')
+
+@route_cli.command("summary", help="Show the day's routes with street and stop counts")
+@click.option("--date", "date_str", default=None, help="Drive date (YYYY-MM-DD, default: today)")
+def route_summary_command(date_str):
+    try:
+        drive_date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else date.today()
+    except ValueError as e:
+        print(f'Invalid date format: {e}')
+        return
+    summary = get_daily_summary(drive_date)
+    if summary is None:
+        print('Failed to load the summary')
+        return
+    for route in summary['routes']:
+        stops = ', '.join(f'{status} {count}' for status, count in route['stops'].items())
+        print(f'Route ID: {route["routeID"]}, Driver: {route["driverID"]}, Time: {route["driveTime"]}, Status: {route["status"]}, Streets: {route["streets"]}, Stops: {stops}')
+    totals = summary['totals']
+    by_status = ', '.join(f'{status} {count}' for status, count in totals['byStatus'].items()) or 'none'
+    print(f'{totals["routes"]} routes on {summary["driveDate"]} ({by_status}), {totals["streets"]} streets, '
+          f'{sum(totals["stops"].values())} stops')
+
+@route_cli.command("rebuild-summary", help="Recompute the route summary table")
+@click.option("--from", "from_date", default=None, help="Earliest route date (YYYY-MM-DD)")
+@click.option("--to", "to_date", default=None, help="Latest route date (YYYY-MM-DD)")
+@click.option("--background", is_flag=True, help="Queue the rebuild for a worker instead of running it here")
+def rebuild_summary_command(from_date, to_date, background):
+    try:
+        start_date = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else None
+        end_date = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else None
+    except ValueError as e:
+        print(f'Invalid date format: {e}')
+        return
+    if background:
+        new_job = enqueue('route_summaries.rebuild', {
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None
+        })
+        db.session.commit()
+        print(f'Queued job {new_job.jobID}')
+        return
+    count = rebuild_route_summaries(start_date, end_date)
+    if count is None:
+        print('Failed to rebuild the route summary')
+    else:
+        print(f'Rebuilt the summary for {count} routes')
+
+def parse_days(value):
+    """Parse an age such as 30d, 2w or a plain number of days"""
+    value = value.strip().lower()
+    unit = {'d': 1, 'w': 7}.get(value[-1:]) if value else None
+    number = value[:-1] if unit else value
+    if not number.isdigit():
+        raise click.BadParameter(f'{value!r} is not a number of days like 30d or 2w')
+    return int(number) * (unit or 1)
+
+@route_cli.command("archive", help="Move old completed and cancelled routes into the archive tables")
+@click.option("--older-than", default="30d", show_default=True, help="Age of the routes to archive, e.g. 30d or 8w")
+@click.option("--batch-size", default=None, type=int, help="Routes moved per transaction (default: ARCHIVE_BATCH_SIZE)")
+@click.option("--max-batches", default=None, type=int, help="Stop after this many batches")
+@click.option("--background", is_flag=True, help="Queue the archiving for a worker instead of running it here")
+def archive_routes_command(older_than, batch_size, max_batches, background):
+    older_than_days = parse_days(older_than)
+    if background:
+        new_job = enqueue('routes.archive', {'older_than_days': older_than_days, 'batch_size': batch_size})
+        db.session.commit()
+        print(f'Queued job {new_job.jobID}')
+        return
+    result = archive_routes(older_than_days, batch_size, max_batches)
+    if result is None:
+        print('Failed to archive routes')
+        return
+    print(f'Archived {result["routes"]} routes driven before {result["cutoff"]} with {result["streets"]} streets, '
+          f'{result["stops"]} stops and {result["segments"]} location segments '
+          f'in {result["batches"]} batches ({result["ms"] / 1000:.1f} s)')
+    if result['remaining']:
+        print('More routes are waiting; run the command again to continue')
+
 app.cli.add_command(route_cli)
 
+'''
+Worker Commands
+'''
+
+worker_cli = AppGroup('worker', help='Background job commands')
+
+@worker_cli.command("run", help="Run queued background jobs until stopped")
+@click.option("--processes", default=1, show_default=True, help="Worker processes to start")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty")
+def run_worker_command(processes, burst):
+    processed = run_workers(processes, burst)
+    if processed is not None:
+        print(f'Ran {processed} jobs')
+
+@worker_cli.command("status", help="Show job counts by status")
+def worker_status_command():
+    stats = job_queue.get_stats()
+    print(f"queued: {stats['queued']}, running: {stats['running']}, done: {stats['done']}, failed: {stats['failed']}")
+    if stats['oldestQueued']:
+        print(f"oldest queued job due at {stats['oldestQueued']}")
+
+@worker_cli.command("purge", help="Delete jobs that finished successfully")
+@click.option("--older-than-days", default=7, show_default=True)
+def purge_jobs_command(older_than_days):
+    print(f'Deleted {job_queue.purge(older_than_days * 86400)} finished jobs')
+
+app.cli.add_command(worker_cli)
+
 '''
 Test Commands
 '''
@@ -277,12 +499,29 @@ test = AppGroup('test', help='Testing commands')
 @test.command("user", help="Run User tests")
 @click.argument("type", default="all")
 def user_tests_command(type):
+    import pytest
     if type == "unit":
         sys.exit(pytest.main(["-k", "UserUnitTests"]))
     elif type == "int":
         sys.exit(pytest.main(["-k", "UserIntegrationTests"]))
     else:
         sys.exit(pytest.main(["-k", "App"]))
-    
+
+@test.command("bench", help="Benchmark the controllers and compare with the stored baseline")
+@click.option("--size", "sizes", multiple=True, type=click.Choice(["small", "medium", "large"]),
+              help="Dataset size, repeatable (default: small and medium)")
+@click.option("--database-url", "database_urls", multiple=True,
+              help="Extra scratch database to benchmark, e.g. a local Postgres; it is emptied afterwards")
+@click.option("--case", "cases", multiple=True, help="Only run this controller, repeatable")
+@click.option("--repeat", default=30, show_default=True)
+@click.option("--output", default=None, help="Results file (default: benchmarks/results.json)")
+@click.option("--baseline", default=None, help="Baseline file (default: benchmarks/baseline.json)")
+@click.option("--save-baseline", is_flag=True, help="Store these results as the new baseline")
+@click.option("--tolerance", default=0.25, show_default=True, help="Allowed slowdown before a case is flagged")
+def bench_command(sizes, database_urls, cases, repeat, output, baseline, save_baseline, tolerance):
+    from benchmarks.suite import bench, DEFAULT_OUTPUT, DEFAULT_BASELINE
+    sys.exit(bench(list(sizes) or ["small", "medium"], database_urls, repeat, cases,
+                   output or DEFAULT_OUTPUT, baseline or DEFAULT_BASELINE, save_baseline, tolerance))
+
 
 app.cli.add_command(test)
\ No newline at end of file